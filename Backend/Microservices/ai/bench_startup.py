@@ -0,0 +1,55 @@
+"""
+Cold-start benchmark for the AI service.
+
+Imports ``server`` in fresh interpreters under ``python -X importtime`` and
+reports the cumulative import time of the module, the peak resident memory
+of the process, and whether the forecasting dependencies were loaded. A
+chat-only worker should not load NumPy until a forecasting endpoint is hit.
+
+Usage:
+    python bench_startup.py [runs]
+"""
+
+import os
+import re
+import sys
+import json
+import statistics
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PROBE = (
+    "import resource, sys, server; "
+    "print('RESULT', resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, "
+    "'numpy' in sys.modules, len(sys.modules))"
+)
+SERVER_LINE = re.compile(r"^import time:\s+\d+ \|\s+(\d+) \| server$", re.MULTILINE)
+
+
+def run_once():
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE],
+                            cwd=HERE, capture_output=True, text=True, check=True)
+    import_us = int(SERVER_LINE.search(result.stderr).group(1))
+    max_rss_kb, numpy_loaded, modules = result.stdout.split("RESULT")[-1].split()
+    return import_us, int(max_rss_kb), numpy_loaded == "True", int(modules)
+
+
+def main(runs=5):
+    samples = [run_once() for _ in range(runs)]
+    report = {
+        "runs": runs,
+        "import_ms_median": round(statistics.median(s[0] for s in samples) / 1000, 1),
+        "import_ms_min": round(min(s[0] for s in samples) / 1000, 1),
+        "max_rss_mb_median": round(statistics.median(s[1] for s in samples) / 1024, 1),
+        "numpy_loaded": any(s[2] for s in samples),
+        "modules_loaded": samples[0][3],
+    }
+    print(json.dumps(report, indent=2))
+    # Importing the server sets up its log file; do not leave one behind in the source tree
+    log_file = os.path.join(HERE, "ai_server.log")
+    if os.path.exists(log_file) and not os.path.getsize(log_file):
+        os.remove(log_file)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
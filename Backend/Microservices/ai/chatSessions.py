@@ -0,0 +1,162 @@
+"""
+Per-session state for the AI chat.
+
+``/chat`` used to re-read the user's profile, re-render the system prompt
+and send the model only the latest message, on every message. A chat session
+now keeps, until it ends:
+
+- the user's profile, read from the database on the first message
+- the rendered system prompt, re-rendered only if the personality changes
+- a rolling history of the conversation, trimmed oldest first to
+  ``CHAT_HISTORY_TOKENS`` (estimated) so prompts stay bounded
+
+Because the system prompt and earlier turns are sent unchanged, Ollama can
+reuse its cached prompt prefix as long as the model stays loaded, which
+``CHAT_KEEP_ALIVE`` asks for.
+
+A session ends when the client clears it through ``/clear_session``, or when
+it sits idle for ``CHAT_SESSION_TTL`` seconds. At most ``CHAT_SESSION_MAX``
+sessions are kept; the least recently used is dropped first.
+
+Sessions are identified by the user and an optional client-chosen session id,
+so a user can have more than one conversation open.
+
+Configuration (environment variables):
+    CHAT_SESSION_TTL     idle seconds before a session is forgotten
+    CHAT_SESSION_MAX     sessions kept at most
+    CHAT_HISTORY_TOKENS  estimated tokens of history sent with each message
+    CHAT_KEEP_ALIVE      how long Ollama keeps the model loaded after a message
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from getData import get_data
+
+logger = logging.getLogger("ai_service.chat_sessions")
+
+SESSION_TTL = float(os.getenv("CHAT_SESSION_TTL", "1800"))
+SESSION_MAX = int(os.getenv("CHAT_SESSION_MAX", "1000"))
+HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_TOKENS", "2000"))
+KEEP_ALIVE = os.getenv("CHAT_KEEP_ALIVE", "30m")
+
+
+def estimate_tokens(text):
+    """Rough token count for budgeting (about four characters per token for English)."""
+    return len(text) // 4 + 1
+
+
+class ChatSession:
+    """State kept for one conversation."""
+
+    def __init__(self, user_id, session_id):
+        self.user_id = user_id
+        self.session_id = session_id
+        self.user_info = None
+        self.system_prompt = None
+        self.personality_mode = None
+        self.history = []  # alternating user / assistant messages, oldest first
+        self.history_tokens = 0
+        self.last_used = time.monotonic()
+        self._lock = threading.Lock()
+
+    def messages(self, user_message):
+        """
+        The messages to send for a new user message: system prompt, history, then the message.
+
+        Args:
+            user_message (str): The user's new message
+
+        Returns:
+            list: Ollama chat messages
+        """
+        with self._lock:
+            history = list(self.history)
+        return [{"role": "system", "content": self.system_prompt}] + history + [{"role": "user", "content": user_message}]
+
+    def add_exchange(self, user_message, reply):
+        """
+        Append a finished exchange to the history, dropping the oldest exchanges beyond the token budget.
+
+        Args:
+            user_message (str): What the user asked
+            reply (str): What the model answered; empty replies are not kept
+        """
+        if not reply:
+            return
+        with self._lock:
+            self.history.append({"role": "user", "content": user_message})
+            self.history.append({"role": "assistant", "content": reply})
+            self.history_tokens += estimate_tokens(user_message) + estimate_tokens(reply)
+            while self.history_tokens > HISTORY_TOKENS and self.history:
+                # Drop a whole exchange so the history never starts with an assistant message
+                for message in self.history[:2]:
+                    self.history_tokens -= estimate_tokens(message["content"])
+                del self.history[:2]
+
+
+_sessions = OrderedDict()  # (user_id, session_id) -> ChatSession
+_lock = threading.Lock()
+
+
+def get_session(user_id, session_id=None):
+    """
+    Return a conversation's session, starting a new one when it does not exist or has expired.
+
+    Args:
+        user_id (int): User chatting
+        session_id (str, optional): Client-chosen conversation id
+
+    Returns:
+        ChatSession: The session, with its last use updated
+    """
+    key = (user_id, session_id)
+    now = time.monotonic()
+    with _lock:
+        chat_session = _sessions.get(key)
+        if chat_session is None or now - chat_session.last_used >= SESSION_TTL:
+            chat_session = ChatSession(user_id, session_id)
+            _sessions[key] = chat_session
+        chat_session.last_used = now
+        _sessions.move_to_end(key)
+        while len(_sessions) > SESSION_MAX:
+            _sessions.popitem(last=False)
+    return chat_session
+
+
+def get_user_context(chat_session):
+    """
+    The user's profile for a session, read from the database on first use only.
+
+    Args:
+        chat_session (ChatSession): Session asking
+
+    Returns:
+        dict: Output of get_data, or None when the user could not be loaded
+    """
+    if chat_session.user_info is None:
+        chat_session.user_info = get_data(chat_session.user_id)
+    else:
+        logger.debug(f"User context for user_id {chat_session.user_id} served from the chat session")
+    return chat_session.user_info
+
+
+def end_session(user_id, session_id=None):
+    """
+    Forget a conversation.
+
+    Args:
+        user_id (int): User whose session ends
+        session_id (str, optional): Conversation id; all of the user's sessions when omitted
+
+    Returns:
+        int: Sessions dropped
+    """
+    with _lock:
+        keys = [key for key in _sessions if key[0] == user_id and (session_id is None or key[1] == session_id)]
+        for key in keys:
+            del _sessions[key]
+    return len(keys)
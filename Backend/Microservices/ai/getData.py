@@ -1,101 +1,158 @@
 import psycopg2
 from psycopg2 import sql
+from psycopg2.extras import register_composite
 import json
 import ast  # Safe parser for string tuples
 import logging
 import time
+import threading
 from datetime import datetime
-import numpy as np
-from sklearn.linear_model import LinearRegression
 from datetime import timedelta
+from typing import NamedTuple, Optional
 import traceback
+from global_func import getConnection
 
 # Set up logger
 logger = logging.getLogger("ai_service.data")
 
-def build_motivation_prompt(user_id):
+class MotivationState(NamedTuple):
+    fname: str
+    streak: int
+    last_workout: Optional[datetime]
+    current_weight: Optional[float]
+    goal_weight: Optional[float]
+
+    def fingerprint(self):
+        """Everything the motivation prompt depends on; the last workout only counts by day."""
+        last_workout_day = self.last_workout.date() if isinstance(self.last_workout, datetime) else self.last_workout
+        return (self.fname, self.streak, last_workout_day, self.current_weight, self.goal_weight)
+
+
+# Latest engagement, weight and weight goal in one round trip; a row comes back even for unknown users
+motivationStateQuery = sql.SQL("""
+    SELECT u.fname, e.day_streak, e.last_workout, s.weight, g.target_weight
+    FROM (SELECT %s::int AS user_id) me
+    LEFT JOIN users u ON u.id = me.user_id
+    LEFT JOIN LATERAL (
+        SELECT day_streak, last_workout
+        FROM user_engagement
+        WHERE user_id = me.user_id
+        ORDER BY last_login DESC
+        LIMIT 1
+    ) e ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT weight
+        FROM user_stats
+        WHERE user_id = me.user_id
+        ORDER BY created_at DESC
+        LIMIT 1
+    ) s ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT target_weight
+        FROM weight_goals
+        WHERE user_id = me.user_id
+        ORDER BY created_at DESC
+        LIMIT 1
+    ) g ON TRUE
+""")
+
+def get_motivation_state(user_id):
+    """
+    Read the inputs of the motivation prompt.
+
+    Args:
+        user_id (int): User to read
+
+    Returns:
+        MotivationState: Streak, last workout, weights and first name, or None on a database error
+    """
     start_time = time.time()
     request_id = datetime.now().strftime("%Y%m%d%H%M%S")
-    logger.info(f"Request [{request_id}]: Building motivation prompt for user_id: {user_id}")
-    
+    logger.info(f"Request [{request_id}]: Reading motivation state for user_id: {user_id}")
+
     try:
-        conn = psycopg2.connect(
-            dbname="gitfitbro",
-            user="postgres",
-            password="password",
-            host="postgres",
-            port="5432"
-        )
-        cur = conn.cursor()
-        logger.debug(f"Request [{request_id}]: Database connection established")
+        conn = getConnection()
+        try:
+            cur = conn.cursor()
+            cur.execute(motivationStateQuery, (user_id,))
+            fname, streak, last_workout, current_weight, goal_weight = cur.fetchone()
+            cur.close()
+        finally:
+            conn.close()
 
-        # Get day_streak and last_workout from user_engagement
-        cur.execute("""
-            SELECT day_streak, last_workout
-            FROM user_engagement
-            WHERE user_id = %s
-            ORDER BY last_login DESC
-            LIMIT 1
-        """, (user_id,))
-        engagement = cur.fetchone()
-        streak = engagement[0] if engagement and engagement[0] is not None else 0
-        last_workout = engagement[1] if engagement and engagement[1] else None
-        logger.debug(f"Request [{request_id}]: Retrieved streak: {streak}, last_workout: {last_workout}")
+        state = MotivationState(
+            fname=fname or "Athlete",
+            streak=streak if streak is not None else 0,
+            last_workout=last_workout or None,
+            current_weight=current_weight,
+            goal_weight=goal_weight
+        )
+        processing_time = time.time() - start_time
+        logger.debug(f"Request [{request_id}]: Retrieved motivation state {state} in {processing_time:.2f}s")
+        return state
 
-        # Get latest current weight
-        cur.execute("""
-            SELECT weight
-            FROM user_stats
-            WHERE user_id = %s
-            ORDER BY created_at DESC
-            LIMIT 1
-        """, (user_id,))
-        weight_result = cur.fetchone()
-        current_weight = weight_result[0] if weight_result else None
-        logger.debug(f"Request [{request_id}]: Retrieved current weight: {current_weight}")
+    except Exception as e:
+        processing_time = time.time() - start_time
+        logger.error(f"Request [{request_id}]: Error reading motivation state in {processing_time:.2f}s: {str(e)}")
+        return None
 
-        # Get goal weight
-        cur.execute("""
-            SELECT target_weight
-            FROM weight_goals
-            WHERE user_id = %s
-            ORDER BY created_at DESC
-            LIMIT 1
-        """, (user_id,))
-        goal_result = cur.fetchone()
-        goal_weight = goal_result[0] if goal_result else None
-        logger.debug(f"Request [{request_id}]: Retrieved goal weight: {goal_weight}")
 
-        # Get user's first name
-        cur.execute("SELECT fname FROM users WHERE id = %s", (user_id,))
-        name_result = cur.fetchone()
-        fname = name_result[0] if name_result else "Athlete"
-        logger.debug(f"Request [{request_id}]: Retrieved first name: {fname}")
+def format_motivation_prompt(state):
+    """
+    Build the motivation prompt from a user's state.
 
-        cur.close()
-        conn.close()
-        logger.debug(f"Request [{request_id}]: Database connection closed")
+    Args:
+        state (MotivationState): Output of get_motivation_state
 
-        # ✨ Build the motivational prompt
-        prompt = f"""
+    Returns:
+        str: Prompt for the model
+    """
+    # ✨ Build the motivational prompt
+    return f"""
 You are a positive, motivational AI fitness coach.
 
-User: {fname}
-Streak: {streak} days
-Last workout: {str(last_workout) if last_workout else "Unknown"}
-Current weight: {current_weight} lbs
-Target weight: {goal_weight} lbs
+User: {state.fname}
+Streak: {state.streak} days
+Last workout: {str(state.last_workout) if state.last_workout else "Unknown"}
+Current weight: {state.current_weight} lbs
+Target weight: {state.goal_weight} lbs
 
 Write a short motivational message (under 200 characters). Make it personalized and energizing, like Duolingo style messages.
 """
-        processing_time = time.time() - start_time
-        logger.info(f"Request [{request_id}]: Built motivation prompt in {processing_time:.2f}s")
-        return prompt
 
-    except Exception as e:
-        processing_time = time.time() - start_time
-        logger.error(f"Request [{request_id}]: Error building motivation prompt in {processing_time:.2f}s: {str(e)}")
-        return None
+
+def build_motivation_prompt(user_id):
+    state = get_motivation_state(user_id)
+    return format_motivation_prompt(state) if state else None
+
+
+def get_active_user_ids(days, limit):
+    """
+    Users who logged in recently, most recent first.
+
+    Args:
+        days (int): How far back a login counts as active
+        limit (int): Maximum number of users
+
+    Returns:
+        list: User ids
+    """
+    conn = getConnection()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT user_id
+            FROM user_engagement
+            WHERE last_login >= CURRENT_TIMESTAMP - make_interval(days => %s)
+            GROUP BY user_id
+            ORDER BY MAX(last_login) DESC
+            LIMIT %s
+        """, (days, limit))
+        user_ids = [row[0] for row in cur.fetchall()]
+        cur.close()
+    finally:
+        conn.close()
+    return user_ids
 
 
 def get_user_streak(user_id):
@@ -104,13 +161,7 @@ def get_user_streak(user_id):
     logger.info(f"Request [{request_id}]: Getting streak data for user_id: {user_id}")
     
     try:
-        conn = psycopg2.connect(
-            dbname="gitfitbro",
-            user="postgres",
-            password="password",
-            host="postgres",
-            port="5432"
-        )
+        conn = getConnection()
         cur = conn.cursor()
         logger.debug(f"Request [{request_id}]: Database connection established")
 
@@ -194,98 +245,115 @@ def format_sets(set_data):
         return [f"❌ Could not parse sets: {e}"]
 
 
+# Profile, latest stats and goal, and the latest workout with its exercises in one round trip
+userContextQuery = sql.SQL("""
+    SELECT u.id, u.fname, u.lname, u.sex, (current_date - u.dob) AS age,
+           s.weight, s.height, g.target_weight,
+           w.id, w.name, w.workout_type, w.workout_date, x.names, x.sets
+    FROM users u
+    LEFT JOIN LATERAL (
+        SELECT weight, height
+        FROM user_stats
+        WHERE user_id = u.id
+        ORDER BY created_at DESC
+        LIMIT 1
+    ) s ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT target_weight
+        FROM weight_goals
+        WHERE user_id = u.id
+        ORDER BY created_at DESC
+        LIMIT 1
+    ) g ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT id, name, workout_type, workout_date
+        FROM workouts
+        WHERE user_id = u.id
+        ORDER BY workout_date DESC
+        LIMIT 1
+    ) w ON TRUE
+    LEFT JOIN LATERAL (
+        SELECT array_agg(e.name ORDER BY we.order_exercise, we.id) AS names,
+               array_agg(we.sets ORDER BY we.order_exercise, we.id) AS sets
+        FROM workout_exercises we
+        JOIN exercises e ON we.exercise_id = e.id
+        WHERE we.workout_id = w.id
+    ) x ON TRUE
+    WHERE u.id = %s
+""")
+
+_set_type_registered = False
+_set_type_lock = threading.Lock()
+
+def register_set_type(conn):
+    """
+    Teach psycopg2 to decode the ``set_type`` composite into a named tuple.
+
+    Without this, ``sets`` arrives as its text form and had to be parsed
+    back. The enum array inside it (``type_set_type[]``) gets a caster too,
+    since psycopg2 only decodes arrays of built-in types. Casters are
+    registered globally, so this runs once per process.
+
+    Args:
+        conn: Pooled or raw psycopg2 connection used to look the types up
+    """
+    global _set_type_registered
+    if _set_type_registered:
+        return
+    with _set_type_lock:
+        if _set_type_registered:
+            return
+        raw = getattr(conn, "raw", conn)
+        cur = raw.cursor()
+        try:
+            cur.execute("SELECT 'type_set_type[]'::regtype::oid")
+            enum_array_oid = cur.fetchone()[0]
+        finally:
+            cur.close()
+        psycopg2.extensions.register_type(
+            psycopg2.extensions.new_array_type((enum_array_oid,), "TYPE_SET_TYPE_ARRAY", psycopg2.STRING))
+        register_composite("set_type", raw, globally=True)
+        # The lookups above opened a transaction on a connection that goes back to the pool
+        raw.rollback()
+        _set_type_registered = True
+
+
 def get_data(user_id):
     start_time = time.time()
     request_id = datetime.now().strftime("%Y%m%d%H%M%S")
     logger.info(f"Request [{request_id}]: Getting user data for user_id: {user_id}")
     
     try:
-        conn = psycopg2.connect(
-            dbname="gitfitbro",
-            user="postgres",
-            password="password",
-            host="postgres",
-            port="5432"
-        )
-        cur = conn.cursor()
-        logger.debug(f"Request [{request_id}]: Database connection established")
-
-        # Get user basic info
-        cur.execute("""
-            SELECT id, fname, lname, sex, (current_date - dob) AS age
-            FROM users
-            WHERE id = %s
-        """, (user_id,))
-        user = cur.fetchone()
-
-        if not user:
-            logger.warning(f"Request [{request_id}]: No user found with ID {user_id}")
+        conn = getConnection()
+        try:
+            register_set_type(conn)
+            cur = conn.cursor()
+            cur.execute(userContextQuery, (user_id,))
+            row = cur.fetchone()
             cur.close()
+        finally:
             conn.close()
+
+        if not row:
+            logger.warning(f"Request [{request_id}]: No user found with ID {user_id}")
             return None
 
-        user_id, fname, lname, sex, age = user
+        (user_id, fname, lname, sex, age, weight, height, target_weight,
+         workout_id, name, w_type, w_date, exercise_names, exercise_sets) = row
         logger.debug(f"Request [{request_id}]: Retrieved user: {fname} {lname}")
 
-        # Get latest user stats
-        cur.execute("""
-            SELECT weight, height
-            FROM user_stats
-            WHERE user_id = %s
-            ORDER BY created_at DESC
-            LIMIT 1
-        """, (user_id,))
-        stats = cur.fetchone()
-        weight, height = stats if stats else (None, None)
-        logger.debug(f"Request [{request_id}]: Retrieved stats - weight: {weight}, height: {height}")
-
-        # Get target weight from weight_goals
-        cur.execute("""
-            SELECT target_weight
-            FROM weight_goals
-            WHERE user_id = %s
-            ORDER BY created_at DESC
-            LIMIT 1
-        """, (user_id,))
-        goal_result = cur.fetchone()
-        target_weight = float(goal_result[0]) if goal_result else None
-        logger.debug(f"Request [{request_id}]: Retrieved target weight: {target_weight}")
-
-        # Get most recent workout
-        cur.execute("""
-            SELECT id, name, workout_type, workout_date
-            FROM workouts
-            WHERE user_id = %s
-            ORDER BY workout_date DESC
-            LIMIT 1
-        """, (user_id,))
-        workout_row = cur.fetchone()
-
         workout_data = None
-        if workout_row:
-            workout_id, name, w_type, w_date = workout_row
+        if workout_id is not None:
             workout_data = {
                 "name": name,
                 "type": w_type,
                 "date": str(w_date),
-                "exercises": []
+                "exercises": [
+                    {"name": ex_name, "sets": format_sets(sets)}
+                    for ex_name, sets in zip(exercise_names or [], exercise_sets or [])
+                ]
             }
 
-            cur.execute("""
-                SELECT e.name, we.sets
-                FROM workout_exercises we
-                JOIN exercises e ON we.exercise_id = e.id
-                WHERE we.workout_id = %s
-            """, (workout_id,))
-            exercise_rows = cur.fetchall()
-
-            for ex_name, sets in exercise_rows:
-                formatted = format_sets(sets)
-                workout_data["exercises"].append({
-                    "name": ex_name,
-                    "sets": formatted
-                })
-
         # Final structured data
         data = {
             "user": {
@@ -298,7 +366,7 @@ def get_data(user_id):
                 "weight": float(weight) if weight else None,
                 "height": height,
                 "goal": {
-                    "target_weight": target_weight
+                    "target_weight": float(target_weight)
                 } if target_weight else "None"
             }
         }
@@ -306,8 +374,6 @@ def get_data(user_id):
         if workout_data:
             data["recent_workout"] = workout_data
 
-        cur.close()
-        conn.close()
         processing_time = time.time() - start_time
         logger.info(f"Request [{request_id}]: Retrieved user data in {processing_time:.2f}s")
         return data
@@ -320,13 +386,7 @@ def get_data(user_id):
 
 def get_userName(user_id):
     try:
-        conn = psycopg2.connect(
-            dbname="gitfitbro",
-            user="postgres",
-            password="password",
-            host="postgres",
-            port="5432"
-        )
+        conn = getConnection()
         cur = conn.cursor()
 
         cur.execute("SELECT fname, lname FROM users WHERE id = %s", (user_id,))
@@ -351,9 +411,7 @@ def get_userName(user_id):
 
 def get_user_id_by_username(username):
     try:
-        conn = psycopg2.connect(
-            dbname="gitfitbro", user="postgres", password="password", host="postgres", port="5432"
-        )
+        conn = getConnection()
         cur = conn.cursor()
         query = sql.SQL("SELECT id FROM users WHERE username = %s")
 
@@ -392,121 +450,23 @@ def get_actual_and_predicted_weights(user_id):
         return [], []
     
     try:
-        conn = psycopg2.connect(
-            dbname="gitfitbro",
-            user="postgres",
-            password="password",
-            host="postgres",
-            port="5432"
-        )
-        cur = conn.cursor()
-        logger.debug(f"Request [{request_id}]: Database connection established")
-
-        # 1. Get actual weights
-        cur.execute("""
-            SELECT created_at::date, weight
-            FROM user_stats
-            WHERE user_id = %s
-            ORDER BY created_at ASC
-        """, (user_id,))
-        raw_data = cur.fetchall()
-        
-        if not raw_data:
+        # Imported here so chat-only workers never load NumPy
+        import weightForecast
+        trend = weightForecast.get_trend(user_id)
+        actual_data = trend.actual_data
+        if not actual_data:
             logger.warning(f"Request [{request_id}]: No weight data found for user {user_id}")
-            cur.close()
-            conn.close()
             return [], []
-            
-        # Validate weight values before converting
-        actual_data = []
-        for d, w in raw_data:
-            try:
-                weight = float(w)
-                if weight <= 0 or weight > 1000:  # Basic sanity check
-                    logger.warning(f"Request [{request_id}]: Invalid weight value: {w}")
-                    continue
-                actual_data.append((d, weight))
-            except (ValueError, TypeError) as e:
-                logger.warning(f"Request [{request_id}]: Error converting weight: {str(e)}")
-                logger.debug(f"Request [{request_id}]: Traceback: {traceback.format_exc()}")
-                continue
-        
-        logger.debug(f"Request [{request_id}]: Retrieved {len(actual_data)} weight entries")
-
-        # 2. Get goal - with validation
-        cur.execute("""
-            SELECT target_weight, achieve_by
-            FROM weight_goals
-            WHERE user_id = %s
-            ORDER BY created_at DESC
-            LIMIT 1
-        """, (user_id,))
-        goal_result = cur.fetchone()
-        
-        goal_weight, goal_date = None, None
-        if goal_result:
-            try:
-                if goal_result[0] is not None:
-                    goal_weight = float(goal_result[0])
-                goal_date = goal_result[1]
-            except (ValueError, TypeError) as e:
-                logger.warning(f"Request [{request_id}]: Error parsing goal data: {str(e)}")
-                logger.debug(f"Request [{request_id}]: Traceback: {traceback.format_exc()}")
-        
-        logger.debug(f"Request [{request_id}]: Retrieved goal - weight: {goal_weight}, date: {goal_date}")
-
-        predicted_data = []
-
-        if actual_data and len(actual_data) >= 2 and goal_weight and goal_date:
-            try:
-                # Train model on actual data
-                x = np.array([(d - actual_data[0][0]).days for d, _ in actual_data]).reshape(-1, 1)
-                y = np.array([w for _, w in actual_data])
-                
-                if len(x) != len(y):
-                    logger.error(f"Request [{request_id}]: Data length mismatch: x={len(x)}, y={len(y)}")
-                    return actual_data, []
-                
-                model = LinearRegression().fit(x, y)
+        logger.debug(f"Request [{request_id}]: Retrieved {len(actual_data)} weight entries, "
+                     f"goal - weight: {trend.goal_weight}, date: {trend.goal_date}")
 
-                # Start prediction from the last actual data point, continue until the goal date
-                start_date = actual_data[0][0]
-                last_actual_date = actual_data[-1][0]
-
-                predicted_data.extend(actual_data)  # Include actual weights first
-
-                if goal_date <= last_actual_date:
-                    logger.warning(f"Request [{request_id}]: Goal date {goal_date} is in the past")
-                
-                i = 1
-                max_predictions = 52  # Safety limit for number of predictions (1 year)
-                while i <= max_predictions:
-                    future_date = last_actual_date + timedelta(weeks=i)
-                    if future_date > goal_date:
-                        break
-
-                    days_from_start = (future_date - start_date).days
-                    try:
-                        pred_weight = model.predict(np.array([[days_from_start]]))[0]
-                        # Apply constraints to predictions
-                        pred_weight = max(goal_weight, min(pred_weight, actual_data[0][1] * 1.5))  # Don't allow unreasonable values
-                        predicted_data.append((future_date, pred_weight))
-                    except Exception as e:
-                        logger.error(f"Request [{request_id}]: Prediction error: {str(e)}")
-                        logger.debug(f"Request [{request_id}]: Traceback: {traceback.format_exc()}")
-                        break
-                        
-                    i += 1
-                    
-                logger.debug(f"Request [{request_id}]: Generated {len(predicted_data) - len(actual_data)} predictions")
-            except Exception as e:
-                logger.error(f"Request [{request_id}]: Error in prediction model: {str(e)}")
-                logger.debug(f"Request [{request_id}]: Traceback: {traceback.format_exc()}")
-                # Return actual data but no predictions
-                return actual_data, []
+        forecast = trend.forecast()
+        if trend.goal_date and trend.goal_date <= actual_data[-1][0]:
+            logger.warning(f"Request [{request_id}]: Goal date {trend.goal_date} is in the past")
+        # The predicted line starts with the actual weights
+        predicted_data = actual_data + forecast if trend.slope is not None and trend.goal_weight and trend.goal_date else []
+        logger.debug(f"Request [{request_id}]: Generated {len(forecast)} predictions")
 
-        cur.close()
-        conn.close()
         logger.info(f"Request [{request_id}]: Successfully retrieved weight data")
         return actual_data, predicted_data
 
@@ -677,41 +637,13 @@ def predict_progress(user_id):
         }
     
     try:
-        conn = psycopg2.connect(
-            dbname="gitfitbro",
-            user="postgres",
-            password="password",
-            host="postgres",
-            port="5432",
-        )
-        cur = conn.cursor()
-        logger.debug(f"Request [{request_id}]: Database connection established")
-
-        # Get recent weights with error handling
-        try:
-            cur.execute(
-                """
-                SELECT weight, created_at
-                FROM user_stats
-                WHERE user_id = %s AND weight IS NOT NULL AND weight > 0
-                ORDER BY created_at DESC
-                LIMIT 15  -- Get more history for better trend analysis
-                """,
-                (user_id,),
-            )
-            weights = cur.fetchall()
-        except psycopg2.Error as e:
-            logger.error(f"Request [{request_id}]: Error fetching weight data: {str(e)}")
-            return {
-                "message": "Error retrieving weight history.",
-                "start_date": None,
-                "goal_date": None,
-                "days_remaining": None,
-            }
+        # Same fitted trend as the weight chart
+        import weightForecast
+        trend = weightForecast.get_trend(user_id)
 
         # Validate we have enough data points
-        if not weights or len(weights) < 2:
-            logger.warning(f"Request [{request_id}]: Insufficient weight data for prediction, found {len(weights) if weights else 0} entries")
+        if len(trend.entries) < 2:
+            logger.warning(f"Request [{request_id}]: Insufficient weight data for prediction, found {len(trend.entries)} entries")
             return {
                 "message": "Not enough weight data to make a prediction. Please record at least 2 weight measurements.",
                 "start_date": None,
@@ -719,125 +651,44 @@ def predict_progress(user_id):
                 "days_remaining": None,
             }
 
-        # Validate and sort weight data
-        try:
-            # Sort by date (oldest first)
-            valid_weights = []
-            for weight, date in weights:
-                try:
-                    weight_float = float(weight)
-                    if weight_float <= 0 or weight_float > 1000:  # Basic validation
-                        continue
-                    valid_weights.append((weight_float, date))
-                except (ValueError, TypeError):
-                    continue
-                    
-            if len(valid_weights) < 2:
-                logger.warning(f"Request [{request_id}]: Insufficient valid weight data for prediction")
-                return {
-                    "message": "Not enough valid weight measurements for prediction.",
-                    "start_date": None, 
-                    "goal_date": None,
-                    "days_remaining": None,
-                }
-                
-            weights = sorted(valid_weights, key=lambda x: x[1])
-            start_weight, start_date = weights[0]
-            end_weight, end_date = weights[-1]
-            
-            # Validate dates
-            if end_date <= start_date:
-                logger.warning(f"Request [{request_id}]: Invalid date range: start={start_date}, end={end_date}")
-                return {
-                    "message": "Invalid date range in weight data.",
-                    "start_date": None, 
-                    "goal_date": None,
-                    "days_remaining": None,
-                }
-                
-        except Exception as e:
-            logger.error(f"Request [{request_id}]: Error processing weight data: {str(e)}")
+        end_date, end_weight = trend.entries[-1]
+        if end_date <= trend.entries[0][0]:
+            logger.warning(f"Request [{request_id}]: Invalid date range: start={trend.entries[0][0]}, end={end_date}")
             return {
-                "message": "Error processing weight history.",
-                "start_date": None,
+                "message": "Invalid date range in weight data.",
+                "start_date": None, 
                 "goal_date": None,
                 "days_remaining": None,
             }
 
-        # Calculate rate of weight change with sanity checks
-        try:
-            days = (end_date - start_date).days
-            if days <= 0:
-                days = 1  # Avoid division by zero
-                
-            rate = (end_weight - start_weight) / days
-            
-            # Sanity check - extremely rapid weight change may indicate bad data
-            if abs(rate) > 1:  # More than 1 lb per day
-                logger.warning(f"Request [{request_id}]: Unusually rapid weight change detected: {rate:.2f} lbs/day")
-                # Continue but log the warning
-        except Exception as e:
-            logger.error(f"Request [{request_id}]: Error calculating weight change rate: {str(e)}")
+        # Rate of weight change from the fitted trend, in lbs per day
+        rate = trend.slope
+        
+        # Sanity check - extremely rapid weight change may indicate bad data
+        if abs(rate) > 1:  # More than 1 lb per day
+            logger.warning(f"Request [{request_id}]: Unusually rapid weight change detected: {rate:.2f} lbs/day")
+            # Continue but log the warning
+
+        target_weight = trend.goal_weight
+        if target_weight is None:
+            logger.warning(f"Request [{request_id}]: No weight goal found for user {user_id}")
             return {
-                "message": "Error analyzing weight trend.",
-                "start_date": None,
+                "message": "No weight goal has been set. Set a goal weight for prediction.",
+                "current_weight": end_weight,
+                "start_date": end_date.strftime("%Y-%m-%d") if end_date else None,
                 "goal_date": None,
                 "days_remaining": None,
             }
-
-        # Get user's goal weight
-        try:
-            cur.execute(
-                """
-                SELECT target_weight, achieve_by
-                FROM weight_goals
-                WHERE user_id = %s
-                ORDER BY created_at DESC
-                LIMIT 1
-                """,
-                (user_id,),
-            )
-            goal_result = cur.fetchone()
-            
-            if not goal_result or goal_result[0] is None:
-                logger.warning(f"Request [{request_id}]: No weight goal found for user {user_id}")
-                return {
-                    "message": "No weight goal has been set. Set a goal weight for prediction.",
-                    "current_weight": end_weight,
-                    "start_date": end_date.strftime("%Y-%m-%d") if end_date else None,
-                    "goal_date": None,
-                    "days_remaining": None,
-                }
-                
-            target_weight = float(goal_result[0]) if goal_result[0] is not None else None
-            goal_date = goal_result[1]
             
-            if target_weight <= 0 or target_weight > 1000:
-                logger.warning(f"Request [{request_id}]: Invalid target weight: {target_weight}")
-                return {
-                    "message": "Invalid goal weight value.",
-                    "current_weight": end_weight,
-                    "start_date": end_date.strftime("%Y-%m-%d") if end_date else None,
-                    "goal_date": None,
-                    "days_remaining": None,
-                }
-                
-        except Exception as e:
-            logger.error(f"Request [{request_id}]: Error retrieving goal data: {str(e)}")
+        if target_weight <= 0 or target_weight > 1000:
+            logger.warning(f"Request [{request_id}]: Invalid target weight: {target_weight}")
             return {
-                "message": "Error retrieving goal information.",
-                "start_date": None,
+                "message": "Invalid goal weight value.",
+                "current_weight": end_weight,
+                "start_date": end_date.strftime("%Y-%m-%d") if end_date else None,
                 "goal_date": None,
                 "days_remaining": None,
             }
-        finally:
-            # Clean up database resources
-            try:
-                cur.close()
-                conn.close()
-                logger.debug(f"Request [{request_id}]: Database connection closed")
-            except:
-                pass
 
         # Calculate prediction with intelligent messaging
         if target_weight is not None and abs(rate) > 0.0001:  # Avoid division by very small numbers
@@ -0,0 +1,221 @@
+"""
+Cache of generated motivation messages.
+
+Every app open used to read the user's state and run a full generation, even
+though streak, weight and goals rarely change within a day. Messages are now
+cached under a fingerprint of the prompt inputs (see
+``MotivationState.fingerprint``), so a user whose state has not changed gets
+their previous message back without a model call.
+
+The user's state itself is remembered for ``MOTIVATION_STATE_TTL`` seconds, so
+within that window a repeat request skips the database as well. Workout and
+step writes announce themselves on the leaderboard channel, and weight and
+weight goal writes on the weight channel; hearing one drops that user's
+remembered state, so the next request re-reads it.
+
+An optional background job (``MOTIVATION_PREGENERATE_INTERVAL`` > 0) fills the
+cache for recently active users, only using the model while it is idle.
+
+Configuration (environment variables):
+    MOTIVATION_CACHE_TTL             seconds a generated message is served
+    MOTIVATION_CACHE_MAX_ENTRIES     messages (and user states) kept at most
+    MOTIVATION_STATE_TTL             seconds a user's state is trusted without re-reading it
+    MOTIVATION_PREGENERATE_INTERVAL  seconds between pre-generation runs, 0 to disable
+    MOTIVATION_PREGENERATE_USERS     active users covered per run
+    MOTIVATION_ACTIVE_DAYS           how recent a login makes a user active
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from getData import get_motivation_state, format_motivation_prompt, get_active_user_ids
+from ollamaClient import get_client, OllamaBusyError
+from common import notify, leaderboard_store
+
+logger = logging.getLogger("ai_service.motivation_cache")
+
+CACHE_TTL = float(os.getenv("MOTIVATION_CACHE_TTL", "21600"))
+CACHE_MAX_ENTRIES = int(os.getenv("MOTIVATION_CACHE_MAX_ENTRIES", "5000"))
+STATE_TTL = float(os.getenv("MOTIVATION_STATE_TTL", "300"))
+PREGENERATE_INTERVAL = float(os.getenv("MOTIVATION_PREGENERATE_INTERVAL", "0"))
+PREGENERATE_USERS = int(os.getenv("MOTIVATION_PREGENERATE_USERS", "100"))
+ACTIVE_DAYS = int(os.getenv("MOTIVATION_ACTIVE_DAYS", "1"))
+
+_messages = OrderedDict()  # fingerprint -> (message, stored_at)
+_states = OrderedDict()  # user_id -> (MotivationState, read_at)
+_lock = threading.Lock()
+_subscribed = False
+_stats = {"hits": 0, "state_hits": 0, "misses": 0, "stored": 0, "pregenerated": 0}
+
+
+def _forget_states(payload=None):
+    """Drop remembered states named in a notification (all of them for ``*`` or a reconnect)."""
+    target = payload.partition(":")[0] if payload else "*"
+    with _lock:
+        if target == "*":
+            _states.clear()
+            return
+        try:
+            _states.pop(int(target), None)
+        except ValueError:
+            logger.warning(f"Ignoring malformed notification: {payload}")
+
+
+def _subscribe():
+    global _subscribed
+    if _subscribed:
+        return
+    with _lock:
+        if _subscribed:
+            return
+        _subscribed = True
+    notify.subscribe(leaderboard_store.NOTIFY_CHANNEL, _forget_states, on_reconnect=_forget_states)
+    notify.subscribe(notify.WEIGHT_CHANNEL, _forget_states, on_reconnect=_forget_states)
+
+
+def _trim(cache):
+    while len(cache) > CACHE_MAX_ENTRIES:
+        cache.popitem(last=False)
+
+
+def _message_for(state, now):
+    """Cached message for a state, or None; caller holds the lock."""
+    key = state.fingerprint()
+    entry = _messages.get(key)
+    if entry is None:
+        return None
+    message, stored_at = entry
+    if now - stored_at >= CACHE_TTL:
+        del _messages[key]
+        return None
+    _messages.move_to_end(key)
+    return message
+
+
+def cached_message(user_id):
+    """
+    Serve a user's message from memory alone, when both their state and its message are cached.
+
+    Args:
+        user_id (int): User asking for motivation
+
+    Returns:
+        str: Cached message, or None when the database has to be consulted
+    """
+    _subscribe()
+    now = time.monotonic()
+    with _lock:
+        entry = _states.get(user_id)
+        if entry is None or now - entry[1] >= STATE_TTL:
+            return None
+        message = _message_for(entry[0], now)
+        if message is not None:
+            _states.move_to_end(user_id)
+            _stats["state_hits"] += 1
+        return message
+
+
+def lookup(user_id, state):
+    """
+    Remember a freshly read state and return the message cached for it.
+
+    Args:
+        user_id (int): User the state belongs to
+        state (MotivationState): Output of get_motivation_state
+
+    Returns:
+        str: Cached message, or None when one has to be generated
+    """
+    now = time.monotonic()
+    with _lock:
+        _states[user_id] = (state, now)
+        _states.move_to_end(user_id)
+        _trim(_states)
+        message = _message_for(state, now)
+        _stats["hits" if message is not None else "misses"] += 1
+        return message
+
+
+def remember(user_id, state, message):
+    """
+    Cache a generated message for a state.
+
+    Args:
+        user_id (int): User the message was generated for
+        state (MotivationState): State the prompt was built from
+        message (str): Generated message; empty messages are not cached
+    """
+    if not message:
+        return
+    now = time.monotonic()
+    with _lock:
+        key = state.fingerprint()
+        _messages[key] = (message, now)
+        _messages.move_to_end(key)
+        _trim(_messages)
+        _states[user_id] = (state, now)
+        _states.move_to_end(user_id)
+        _trim(_states)
+        _stats["stored"] += 1
+
+
+def stats():
+    """Hit counters and cache sizes."""
+    with _lock:
+        return {**_stats, "messages": len(_messages), "states": len(_states)}
+
+
+def _model_idle():
+    client_stats = get_client().stats()
+    return client_stats["in_flight"] < client_stats["max_concurrency"] and client_stats["queued"] == 0
+
+
+def pregenerate():
+    """
+    Generate messages for recently active users whose state has no cached message.
+
+    Stops early when the model gets busy, so interactive requests keep priority.
+
+    Returns:
+        int: Messages generated
+    """
+    generated = 0
+    for user_id in get_active_user_ids(ACTIVE_DAYS, PREGENERATE_USERS):
+        state = get_motivation_state(user_id)
+        if state is None or lookup(user_id, state) is not None:
+            continue
+        if not _model_idle():
+            logger.info(f"Stopping motivation pre-generation after {generated} messages, model is busy")
+            break
+        try:
+            message = get_client().generate(format_motivation_prompt(state)).get("response", "").strip()
+        except OllamaBusyError:
+            break
+        remember(user_id, state, message)
+        generated += 1
+    with _lock:
+        _stats["pregenerated"] += generated
+    return generated
+
+
+def start_pregeneration():
+    """Run ``pregenerate`` every MOTIVATION_PREGENERATE_INTERVAL seconds in a daemon thread, if enabled."""
+    if PREGENERATE_INTERVAL <= 0:
+        return
+
+    def run():
+        _subscribe()
+        while True:
+            start_time = time.time()
+            try:
+                generated = pregenerate()
+                logger.info(f"Pre-generated {generated} motivation messages in {time.time() - start_time:.2f}s")
+            except Exception as e:
+                logger.error(f"Motivation pre-generation failed: {str(e)}")
+            time.sleep(PREGENERATE_INTERVAL)
+
+    threading.Thread(target=run, name="motivation-pregenerate", daemon=True).start()
+    logger.info(f"Motivation pre-generation every {PREGENERATE_INTERVAL:.0f}s for up to {PREGENERATE_USERS} active users")
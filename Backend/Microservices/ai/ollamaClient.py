@@ -0,0 +1,281 @@
+"""
+Pooled HTTP client for the Ollama backend.
+
+Every generation used to call a bare ``requests.post`` with no timeout, on a
+fresh TCP connection, and with no limit on how many ran at once, so one slow
+model could tie up every Flask worker. The client here:
+
+- reuses keep-alive connections through one ``requests.Session``
+- applies connect and read timeouts to every call
+- lets at most ``OLLAMA_MAX_CONCURRENCY`` generations run at once; up to
+  ``OLLAMA_MAX_QUEUE`` more wait for a slot, and anything beyond that is
+  rejected straight away with OllamaBusyError (served as HTTP 429)
+- records per-endpoint call counts, errors, rejections and latencies
+
+Configuration (environment variables):
+    OLLAMA_URL              base URL of the Ollama server
+    OLLAMA_CONNECT_TIMEOUT  seconds to establish a connection
+    OLLAMA_READ_TIMEOUT     seconds to wait for data from Ollama
+    OLLAMA_MAX_CONCURRENCY  generations in flight at once
+    OLLAMA_MAX_QUEUE        generations allowed to wait for a slot
+    OLLAMA_QUEUE_TIMEOUT    seconds a queued generation waits before being rejected
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger("ai_service.ollama")
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://10.150.200.25:5000")
+CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "3"))
+READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "120"))
+MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "2"))
+MAX_QUEUE = int(os.getenv("OLLAMA_MAX_QUEUE", "8"))
+QUEUE_TIMEOUT = float(os.getenv("OLLAMA_QUEUE_TIMEOUT", "30"))
+
+GENERATE_PATH = "/api/generate"
+CHAT_PATH = "/api/chat"
+
+
+class OllamaBusyError(Exception):
+    """Raised when the generation queue is full or a queued call waited too long."""
+
+    def __init__(self, message="The AI model is busy, please retry shortly.", retry_after=5):
+        self.message = message
+        self.retry_after = retry_after
+        super().__init__(message)
+
+
+class OllamaStream:
+    """
+    An in-flight streaming generation.
+
+    Iterating yields the decoded JSON chunks. The concurrency slot is held
+    until the stream is exhausted or ``close()`` is called.
+    """
+
+    def __init__(self, client, path, response, start_time):
+        self._client = client
+        self._path = path
+        self._response = response
+        self._start_time = start_time
+        self._closed = False
+        self._failed = False
+        self.first_chunk_time = None
+
+    def __iter__(self):
+        try:
+            for line in self._response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if self.first_chunk_time is None:
+                    self.first_chunk_time = time.monotonic()
+                yield chunk
+                if chunk.get("done"):
+                    break
+        except GeneratorExit:
+            raise
+        except Exception:
+            self._failed = True
+            raise
+        finally:
+            self.close()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._response.close()
+        ttft = self.first_chunk_time - self._start_time if self.first_chunk_time else None
+        self._client._finish(self._path, self._start_time, failed=self._failed, ttft=ttft)
+
+
+class OllamaClient:
+    """
+    Thread-safe Ollama client with a connection pool and a bounded generation queue.
+
+    Args:
+        base_url (str, optional): Ollama server, e.g. a local stub in tests
+        connect_timeout (float, optional): Seconds to establish a connection
+        read_timeout (float, optional): Seconds to wait for data
+        max_concurrency (int, optional): Generations in flight at once
+        max_queue (int, optional): Generations allowed to wait for a slot
+        queue_timeout (float, optional): Seconds a queued generation waits
+    """
+
+    def __init__(self, base_url=OLLAMA_URL, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 max_concurrency=MAX_CONCURRENCY, max_queue=MAX_QUEUE, queue_timeout=QUEUE_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(max_concurrency, 1))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._in_flight = 0
+        self._metrics = {}
+
+    def _endpoint_metrics(self, path):
+        return self._metrics.setdefault(path, {
+            "calls": 0, "errors": 0, "rejected": 0,
+            "latency_total": 0.0, "latency_max": 0.0,
+            "ttft_total": 0.0, "ttft_count": 0,
+        })
+
+    def _acquire(self, path):
+        """Take a concurrency slot, queueing if allowed; raises OllamaBusyError otherwise."""
+        if self._slots.acquire(blocking=False):
+            with self._lock:
+                self._in_flight += 1
+            return
+
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                self._endpoint_metrics(path)["rejected"] += 1
+                logger.warning(f"Rejecting Ollama call to {path}: {self._waiting} already queued")
+                raise OllamaBusyError()
+            self._waiting += 1
+
+        try:
+            acquired = self._slots.acquire(timeout=self.queue_timeout)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+        with self._lock:
+            if not acquired:
+                self._endpoint_metrics(path)["rejected"] += 1
+                logger.warning(f"Rejecting Ollama call to {path}: no slot within {self.queue_timeout}s")
+                raise OllamaBusyError()
+            self._in_flight += 1
+
+    def _finish(self, path, start_time, failed=False, ttft=None):
+        """Release the slot taken by ``_acquire`` and record the call."""
+        latency = time.monotonic() - start_time
+        with self._lock:
+            self._in_flight -= 1
+            metrics = self._endpoint_metrics(path)
+            metrics["calls"] += 1
+            metrics["errors"] += 1 if failed else 0
+            metrics["latency_total"] += latency
+            metrics["latency_max"] = max(metrics["latency_max"], latency)
+            if ttft is not None:
+                metrics["ttft_total"] += ttft
+                metrics["ttft_count"] += 1
+        self._slots.release()
+        logger.info(f"Ollama call to {path} {'failed' if failed else 'finished'} in {latency:.2f}s"
+                    + (f" (first chunk after {ttft:.2f}s)" if ttft is not None else ""))
+
+    def post(self, path, payload):
+        """
+        Run a non-streaming generation.
+
+        Args:
+            path (str): Ollama API path, e.g. GENERATE_PATH
+            payload (dict): Request body; "stream" is forced off
+
+        Returns:
+            dict: Ollama's JSON response
+
+        Raises:
+            OllamaBusyError: If no slot is available
+            requests.RequestException: On connection errors, timeouts or HTTP errors
+        """
+        self._acquire(path)
+        start_time = time.monotonic()
+        failed = True
+        try:
+            response = self.session.post(self.base_url + path, json={**payload, "stream": False}, timeout=self.timeout)
+            response.raise_for_status()
+            result = response.json()
+            failed = False
+            return result
+        finally:
+            self._finish(path, start_time, failed=failed)
+
+    def open_stream(self, path, payload):
+        """
+        Start a streaming generation.
+
+        The slot is taken before returning, so a full queue is reported
+        (as OllamaBusyError) before any response is sent to the client.
+
+        Args:
+            path (str): Ollama API path
+            payload (dict): Request body; "stream" is forced on
+
+        Returns:
+            OllamaStream: Iterable of chunks; close it if not fully consumed
+        """
+        self._acquire(path)
+        start_time = time.monotonic()
+        try:
+            response = self.session.post(self.base_url + path, json={**payload, "stream": True},
+                                         timeout=self.timeout, stream=True)
+            response.raise_for_status()
+        except Exception:
+            self._finish(path, start_time, failed=True)
+            raise
+        return OllamaStream(self, path, response, start_time)
+
+    def generate(self, prompt, model="llama3:latest", **options):
+        return self.post(GENERATE_PATH, {"model": model, "prompt": prompt, **options})
+
+    def chat(self, messages, model="llama3:latest", **options):
+        return self.post(CHAT_PATH, {"model": model, "messages": messages, **options})
+
+    def stats(self):
+        """
+        Snapshot of queue state and per-endpoint latency metrics.
+
+        Returns:
+            dict: Queue gauges and, per endpoint, counts plus latencies in milliseconds
+        """
+        with self._lock:
+            endpoints = {}
+            for path, metrics in self._metrics.items():
+                calls = metrics["calls"]
+                endpoints[path] = {
+                    "calls": calls,
+                    "errors": metrics["errors"],
+                    "rejected": metrics["rejected"],
+                    "latency_avg_ms": round(metrics["latency_total"] / calls * 1000, 1) if calls else 0.0,
+                    "latency_max_ms": round(metrics["latency_max"] * 1000, 1),
+                    "ttft_avg_ms": round(metrics["ttft_total"] / metrics["ttft_count"] * 1000, 1) if metrics["ttft_count"] else None,
+                }
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "queued": self._waiting,
+                "endpoints": endpoints,
+            }
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide client, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OllamaClient()
+            logger.info(f"Initialised Ollama client for {_client.base_url} "
+                        f"(max_concurrency={_client.max_concurrency}, max_queue={_client.max_queue})")
+        return _client
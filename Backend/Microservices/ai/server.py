@@ -11,29 +11,116 @@ from global_func import verify_key
 import traceback  # Add this import at the top
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("ai_server.log"),
-        logging.StreamHandler()
-    ]
-)
+from common import log_setup, query_stats
+log_setup.configure("ai", "ai_server.log", logging.INFO)
 logger = logging.getLogger("ai_service")
 
 # Add the project root to the Python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../../')))
 
-from flask import Flask, request, jsonify, session
-import requests
-from getData import get_data, get_userName, build_motivation_prompt, get_user_id_by_username, get_actual_and_predicted_weights, format_weight_chart, predict_progress
+from flask import Flask, request, jsonify, Response, stream_with_context
+from ollamaClient import get_client, OllamaBusyError, GENERATE_PATH, CHAT_PATH
+import motivationCache
+import chatSessions
+from getData import get_userName, get_motivation_state, format_motivation_prompt, get_user_id_by_username, get_actual_and_predicted_weights, format_weight_chart, predict_progress
 
 app = Flask(__name__)
-app.config["SESSION_TYPE"] = "filesystem"
 CORS(app, resources={r"/*": {"origins": "*"}})
+query_stats.init_app(app, "ai")
+
+def busy_response(error):
+    """429 with Retry-After for a call the Ollama queue turned away."""
+    return jsonify({"error": error.message}), 429, {"Retry-After": str(error.retry_after)}
+
+def wants_stream():
+    """A client asks for streaming with ?stream=true, "stream": true in the body, or Accept: text/event-stream."""
+    if request.args.get("stream", "").lower() in ("1", "true", "yes"):
+        return True
+    if request.is_json and (request.get_json(silent=True) or {}).get("stream") is True:
+        return True
+    return "text/event-stream" in request.headers.get("Accept", "")
+
+def stream_ollama(path, payload, request_id, extract_token, on_complete=None):
+    """
+    Relay an Ollama completion to the client as server-sent events.
+
+    Each token is sent as a ``data: {"token": ...}`` event as soon as Ollama
+    produces it. A final ``event: done`` carries time-to-first-token and
+    tokens per second; ``event: error`` replaces it if the upstream call fails.
+    If the client disconnects, the upstream request is closed so Ollama stops generating.
+
+    Args:
+        path (str): Ollama API path
+        payload (dict): Request body; "stream" is forced on
+        request_id (str): Request id for logging
+        extract_token (callable): Pulls the text out of one streamed chunk
+        on_complete (callable, optional): Receives the full text once the completion finishes
+
+    Returns:
+        flask.Response: text/event-stream response
+
+    Raises:
+        OllamaBusyError: If the generation queue is full, before anything is sent
+    """
+    start_time = time.time()
+    stream = get_client().open_stream(path, payload)
+
+    def events():
+        first_token_time = None
+        chunks = 0
+        text = []
+        final = {}
+        try:
+            for chunk in stream:
+                token = extract_token(chunk)
+                if token:
+                    if first_token_time is None:
+                        first_token_time = time.time()
+                        logger.info(f"Request [{request_id}]: First token after {first_token_time - start_time:.2f}s")
+                    chunks += 1
+                    text.append(token)
+                    yield f"data: {json.dumps({'token': token})}\n\n"
+                if chunk.get("done"):
+                    final = chunk
+        except GeneratorExit:
+            logger.info(f"Request [{request_id}]: Client disconnected after {chunks} chunks, upstream request closed")
+            raise
+        except Exception as e:
+            logger.error(f"Request [{request_id}]: Error while streaming from Ollama - {str(e)}")
+            logger.error(f"Request [{request_id}]: {traceback.format_exc()}")
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+            return
+        finally:
+            stream.close()
+
+        end_time = time.time()
+        # Ollama reports its own token count and generation time (in ns) on the last chunk
+        tokens = final.get("eval_count") or chunks
+        generation_seconds = (final.get("eval_duration") or 0) / 1e9
+        if not generation_seconds and first_token_time is not None:
+            generation_seconds = end_time - first_token_time
+        metrics = {
+            "time_to_first_token": round(first_token_time - start_time, 3) if first_token_time else None,
+            "total_time": round(end_time - start_time, 3),
+            "tokens": tokens,
+            "tokens_per_second": round(tokens / generation_seconds, 2) if generation_seconds else None
+        }
+        logger.info(f"Request [{request_id}]: Streamed {tokens} tokens in {metrics['total_time']:.2f}s "
+                    f"(ttft {metrics['time_to_first_token']}s, {metrics['tokens_per_second']} tokens/s)")
+        if on_complete is not None:
+            on_complete("".join(text))
+        yield f"event: done\ndata: {json.dumps(metrics)}\n\n"
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def stream_text(text):
+    """Send an already generated text in the same event format as stream_ollama."""
+    def events():
+        yield f"data: {json.dumps({'token': text})}\n\n"
+        yield f"event: done\ndata: {json.dumps({'time_to_first_token': 0, 'total_time': 0, 'tokens': None, 'tokens_per_second': None, 'cached': True})}\n\n"
 
-OLLAMA_SERVER_URL_GEN = "http://10.150.200.25:5000/api/generate"
-OLLAMA_SERVER_URL_CHAT = "http://10.150.200.25:5000/api/chat"
+    return Response(events(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 @app.route('/generate', methods=['POST'])
 def generate():
@@ -43,15 +130,18 @@ def generate():
     
     data = request.json
     try:
-        response = requests.post(OLLAMA_SERVER_URL_GEN, json={
-            "model": "llama3:latest",
-            "prompt": data.get("prompt"),
-            "stream": False
-        })
-        response_json = response.json()
+        if wants_stream():
+            return stream_ollama(GENERATE_PATH, {
+                "model": "llama3:latest",
+                "prompt": data.get("prompt")
+            }, request_id, lambda chunk: chunk.get("response", ""))
+        
+        response_json = get_client().generate(data.get("prompt"))
         processing_time = time.time() - start_time
         logger.info(f"Request [{request_id}]: Generated response in {processing_time:.2f}s")
         return jsonify(response_json)
+    except OllamaBusyError as e:
+        return busy_response(e)
     except Exception as e:
         logger.error(f"Request [{request_id}]: Error in generate endpoint - {str(e)}")
         logger.error(f"Request [{request_id}]: {traceback.format_exc()}")
@@ -109,6 +199,8 @@ def get_username():
         logger.error(f"Request [{request_id}]: {traceback.format_exc()}")
         return jsonify({"error": str(e)}), 500
 
+MOTIVATION_FALLBACK = "Couldn't generate a motivational message right now."
+
 def generate_llama_response(prompt):
     start_time = time.time()
     request_id = datetime.now().strftime("%Y%m%d%H%M%S")
@@ -116,25 +208,18 @@ def generate_llama_response(prompt):
     logger.debug(f"Request [{request_id}]: Prompt: {prompt[:100]}...")  # Log first 100 chars of prompt
     
     try:
-        response = requests.post(OLLAMA_SERVER_URL_GEN, json={
-            "model": "llama3:latest",
-            "prompt": prompt,
-            "stream": False
-        })
+        result = get_client().generate(prompt).get("response", "").strip()
         
         processing_time = time.time() - start_time
-        if response.status_code == 200:
-            result = response.json().get("response", "").strip()
-            logger.info(f"Request [{request_id}]: Generated response in {processing_time:.2f}s")
-            logger.debug(f"Request [{request_id}]: Response preview: {result[:100]}...")  # Log first 100 chars
-            return result
-        else:
-            logger.error(f"Request [{request_id}]: LLaMA generation error - Status {response.status_code}, Response: {response.text}")
-            return "Couldn't generate a motivational message right now."
+        logger.info(f"Request [{request_id}]: Generated response in {processing_time:.2f}s")
+        logger.debug(f"Request [{request_id}]: Response preview: {result[:100]}...")  # Log first 100 chars
+        return result
+    except OllamaBusyError:
+        raise
     except Exception as e:
         logger.error(f"Request [{request_id}]: Exception during LLaMA generation - {str(e)}")
         logger.error(f"Request [{request_id}]: {traceback.format_exc()}")
-        return "Couldn't generate a motivational message right now."
+        return MOTIVATION_FALLBACK
     
 @app.route("/api/motivation", methods=["GET"])
 def get_dynamic_motivation():
@@ -145,17 +230,35 @@ def get_dynamic_motivation():
     logger.info(f"Request [{request_id}]: Motivation endpoint called for user_id: {user_id}")
 
     try:
-        prompt = build_motivation_prompt(user_id)
-        if not prompt:
-            logger.warning(f"Request [{request_id}]: Failed to generate prompt for user_id: {user_id}")
-            return jsonify({"error": "Failed to generate prompt"}), 500
-        
+        # Unchanged users get their previous message without a database read or a model call
+        message = motivationCache.cached_message(user_id)
+        if message is None:
+            state = get_motivation_state(user_id)
+            if not state:
+                logger.warning(f"Request [{request_id}]: Failed to generate prompt for user_id: {user_id}")
+                return jsonify({"error": "Failed to generate prompt"}), 500
+            message = motivationCache.lookup(user_id, state)
+
+        if message is not None:
+            processing_time = time.time() - start_time
+            logger.info(f"Request [{request_id}]: Served cached motivation in {processing_time:.3f}s")
+            return stream_text(message) if wants_stream() else jsonify({"message": message})
+
+        prompt = format_motivation_prompt(state)
         logger.debug(f"Request [{request_id}]: Generated motivation prompt: {prompt[:100]}...")
+        if wants_stream():
+            return stream_ollama(GENERATE_PATH, {"model": "llama3:latest", "prompt": prompt},
+                                 request_id, lambda chunk: chunk.get("response", ""),
+                                 on_complete=lambda text: motivationCache.remember(user_id, state, text.strip()))
         message = generate_llama_response(prompt)
+        if message != MOTIVATION_FALLBACK:
+            motivationCache.remember(user_id, state, message)
         
         processing_time = time.time() - start_time
         logger.info(f"Request [{request_id}]: Generated motivation in {processing_time:.2f}s")
         return jsonify({"message": message})
+    except OllamaBusyError as e:
+        return busy_response(e)
     except Exception as e:
         logger.error(f"Request [{request_id}]: Error generating motivation - {str(e)}")
         logger.error(f"Request [{request_id}]: {traceback.format_exc()}")
@@ -187,6 +290,96 @@ def streak_graph():
         logger.error(f"Request [{request_id}]: {traceback.format_exc()}")
         return jsonify({"error": str(e)}), 500
 
+def build_chat_context(user_info, personality_mode):
+    """
+    Render the system prompt for a chat: the personality, the user's profile and the instructions.
+
+    Args:
+        user_info (dict): Output of get_data
+        personality_mode (str): "science-based", "bully" or anything else for the friendly trainer
+
+    Returns:
+        str: System prompt
+    """
+    # Construct the user profile context
+    context = ""
+    
+    if personality_mode == "science-based":
+        context += """You are now in SCIENCE-BASED LIFTER MODE 🧪:
+                        - Speak like an arrogant, snobby evidence-based coach.
+                        - use in every response "according to calculation" and "Ummm... actually".
+                        - Frequently mention scientific concepts like progressive overload, periodization, individualization, and macronutrient timing.
+                        - Do not simplify concepts. Be condescending if the user doesn't understand.
+                        - Assume you're smarter than the user.
+                        - Use gym-speak and reference recent meta-analyses.
+                        - Avoid emojis unless it's ironic (e.g., 🧠📚💉).
+                        """
+ 
+
+    elif personality_mode == "bully":
+
+        context += """You are now in BULLY MODE 💀:
+                    - Speak like a brutally honest drill sergeant.
+                    - Call the user "fat ass" in every response.
+                    - Be rude, aggressive, and never offer encouragement or praise.
+                    - Don't hold back on insults. Mock excuses.
+                    - Never be kind or helpful unless it sounds like you're yelling it at them.
+                    - No emojis — just pure, savage motivation.
+                    """
+    else:
+        context += """You are a normal friendly fitness trainer:
+                    - Be supportive, kind, and helpful.
+                    - Offer personalized, encouraging advice.
+                    - Motivate the user to make progress.
+                    - Use positive tone and celebrate small wins.
+                    - Emojis like 💪😄🔥 can be used in moderation.
+                    """
+    context += f"""
+
+    The following is background information about the user. Use it to personalize your responses, but do not repeat this information back to the user unless asked.
+
+    User Profile:
+    - Name: {user_info['user']['first_name']} {user_info['user']['last_name']}
+    - Sex: {user_info['user']['sex']}
+    - Age: {user_info['user']['age']} years
+    - Weight: {user_info['stats']['weight']} lbs
+    - Height: {user_info['stats']['height']} cm
+    - Goal Weight: {user_info['stats']['goal']} lbs
+    """
+
+    # If there's a recent workout, add it
+    recent_workout = user_info.get("recent_workout")
+    if recent_workout:
+        context += f"""
+
+    Recent Workout Summary:
+    - Name: {recent_workout['name']}
+    - Type: {recent_workout['type']}
+    - Workout Date: {recent_workout.get('date', 'N/A')}
+    - Exercises:
+    """
+        for exercise in recent_workout.get("exercises", []):
+            context += f"  • {exercise['name']}\n"
+            for s in exercise['sets']:
+                context += f"    - {s}\n"
+
+    # Final system instruction
+    context += """
+
+    Your job is to answer the user's fitness-related questions clearly and briefly. Avoid long introductions or excessive motivation unless asked.
+
+    Only respond to fitness-related topics like:
+    - training advice
+    - progress tracking
+    - weight loss tips
+    - personalized workout plans
+    - motivational messages (if asked)
+
+    If the user's message is vague or just a greeting, respond briefly and ask a simple follow-up question to guide the conversation.
+    """
+
+    return context
+
 @app.route('/chat', methods=['POST'])
 def chat():
     start_time = time.time()
@@ -197,131 +390,53 @@ def chat():
     user_message = data.get("message", "")
     user_id = data.get("user_id", 1)
     personality_mode = data.get("personality_mode", "chill")  # Default to 'chill'
+    session_id = data.get("session_id")
     
     logger.info(f"Request [{request_id}]: Processing chat for user_id: {user_id}")
     logger.debug(f"Request [{request_id}]: User message: {user_message[:100]}...")
     
     try:
-        user_info = get_data(user_id)
+        # The profile is read once per chat session rather than on every message
+        chat_session = chatSessions.get_session(user_id, session_id)
+        user_info = chatSessions.get_user_context(chat_session)
         logger.debug(f"Request [{request_id}]: Retrieved user data: {user_info.keys() if isinstance(user_info, dict) else 'N/A'}")
         
-        # Extract recent workout info (if available)
-        recent = user_info.get("workout")
-        workout_context = ""
-        if recent:
-            workout_context += f"""
-        Recent Workout:
-        - Workout Name: {recent.get('name')}
-        - Type: {recent.get('type')}
-        - Start Time: {recent.get('start')}
-        - End Time: {recent.get('end')}
-        """
-
-            if recent.get("exercises"):
-                workout_context += "\n- Exercises Performed:"
-                for ex in recent["exercises"]:
-                    workout_context += f"\n  • {ex['name']} | Sets: {ex['sets']}"
-        
-        # Construct the user profile context
-        context = ""
-        
-        if personality_mode == "science-based":
-            context += """You are now in SCIENCE-BASED LIFTER MODE 🧪:
-                            - Speak like an arrogant, snobby evidence-based coach.
-                            - use in every response "according to calculation" and "Ummm... actually".
-                            - Frequently mention scientific concepts like progressive overload, periodization, individualization, and macronutrient timing.
-                            - Do not simplify concepts. Be condescending if the user doesn't understand.
-                            - Assume you're smarter than the user.
-                            - Use gym-speak and reference recent meta-analyses.
-                            - Avoid emojis unless it's ironic (e.g., 🧠📚💉).
-                            """
- 
-
-        elif personality_mode == "bully":
-
-            context += """You are now in BULLY MODE 💀:
-                        - Speak like a brutally honest drill sergeant.
-                        - Call the user "fat ass" in every response.
-                        - Be rude, aggressive, and never offer encouragement or praise.
-                        - Don't hold back on insults. Mock excuses.
-                        - Never be kind or helpful unless it sounds like you're yelling it at them.
-                        - No emojis — just pure, savage motivation.
-                        """
+        if chat_session.system_prompt is None or chat_session.personality_mode != personality_mode:
+            chat_session.system_prompt = build_chat_context(user_info, personality_mode)
+            chat_session.personality_mode = personality_mode
+            logger.debug(f"Request [{request_id}]: Chat context generated successfully")
         else:
-            context += """You are a normal friendly fitness trainer:
-                        - Be supportive, kind, and helpful.
-                        - Offer personalized, encouraging advice.
-                        - Motivate the user to make progress.
-                        - Use positive tone and celebrate small wins.
-                        - Emojis like 💪😄🔥 can be used in moderation.
-                        """
-        context += f"""
-
-        The following is background information about the user. Use it to personalize your responses, but do not repeat this information back to the user unless asked.
-
-        User Profile:
-        - Name: {user_info['user']['first_name']} {user_info['user']['last_name']}
-        - Sex: {user_info['user']['sex']}
-        - Age: {user_info['user']['age']} years
-        - Weight: {user_info['stats']['weight']} lbs
-        - Height: {user_info['stats']['height']} cm
-        - Goal Weight: {user_info['stats']['goal']} lbs
-        """
-
-        # If there's a recent workout, add it
-        recent_workout = user_info.get("recent_workout")
-        if recent_workout:
-            context += f"""
-
-        Recent Workout Summary:
-        - Name: {recent_workout['name']}
-        - Type: {recent_workout['type']}
-        - Workout Date: {recent_workout.get('date', 'N/A')}
-        - Exercises:
-        """
-            for exercise in recent_workout.get("exercises", []):
-                context += f"  • {exercise['name']}\n"
-                for s in exercise['sets']:
-                    context += f"    - {s}\n"
-
-        # Final system instruction
-        context += """
-
-        Your job is to answer the user's fitness-related questions clearly and briefly. Avoid long introductions or excessive motivation unless asked.
-
-        Only respond to fitness-related topics like:
-        - training advice
-        - progress tracking
-        - weight loss tips
-        - personalized workout plans
-        - motivational messages (if asked)
-
-        If the user's message is vague or just a greeting, respond briefly and ask a simple follow-up question to guide the conversation.
-        """
-
-        logger.debug(f"Request [{request_id}]: Chat context generated successfully")
+            logger.debug(f"Request [{request_id}]: Reusing chat context of the session")
 
         ollama_request = {
             "model": "llama3:latest",
-            "messages": [
-                {"role": "system", "content": context},
-                {"role": "user", "content": user_message}
-            ],
+            "messages": chat_session.messages(user_message),
+            "keep_alive": chatSessions.KEEP_ALIVE,
             "stream": False
         }
+        logger.debug(f"Request [{request_id}]: Sending {len(chat_session.history)} history messages "
+                     f"(~{chat_session.history_tokens} tokens)")
+
+        if wants_stream():
+            logger.debug(f"Request [{request_id}]: Streaming from Ollama chat endpoint")
+            return stream_ollama(CHAT_PATH, ollama_request, request_id,
+                                 lambda chunk: chunk.get("message", {}).get("content", ""),
+                                 on_complete=lambda text: chat_session.add_exchange(user_message, text))
 
         logger.debug(f"Request [{request_id}]: Sending request to Ollama chat endpoint")
-        ollama_response = requests.post(OLLAMA_SERVER_URL_CHAT, json=ollama_request)
-        response_data = ollama_response.json()
+        response_data = get_client().post(CHAT_PATH, ollama_request)
         
-        logger.info(response_data)
+        logger.debug("Request [%s]: Ollama chat response: %s", request_id, response_data)
         
         ai_response = response_data.get("message", {}).get("content", "No response from model.")
+        chat_session.add_exchange(user_message, response_data.get("message", {}).get("content"))
         processing_time = time.time() - start_time
         logger.info(f"Request [{request_id}]: Chat response generated in {processing_time:.2f}s")
         logger.debug(f"Request [{request_id}]: AI response preview: {ai_response[:100]}...")
         
         return jsonify({"response": ai_response})
+    except OllamaBusyError as e:
+        return busy_response(e)
     except Exception as e:
         logger.error(f"Request [{request_id}]: Error in chat endpoint - {str(e)}")
         logger.error(f"Request [{request_id}]: {traceback.format_exc()}")
@@ -333,7 +448,11 @@ def clear_session():
     logger.info(f"Request [{request_id}]: Clearing session")
     
     try:
-        session.pop("history", None)
+        # Chat state lives in chatSessions; the Flask session never held any (and has no secret key)
+        data = request.get_json(silent=True) or {}
+        if data.get("user_id") is not None:
+            dropped = chatSessions.end_session(data["user_id"], data.get("session_id"))
+            logger.info(f"Request [{request_id}]: Ended {dropped} chat sessions for user_id: {data['user_id']}")
         logger.info(f"Request [{request_id}]: Session cleared successfully")
         return jsonify({"message": "Session cleared successfully"})
     except Exception as e:
@@ -411,7 +530,32 @@ def progress_prediction():
         logger.error(f"Request [{request_id}]: {traceback.format_exc()}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/ai/ollama-stats', methods=['GET'])
+def ollama_stats():
+    """Queue state and per-endpoint latency metrics of the Ollama client."""
+    return jsonify(get_client().stats())
+
+def ollama_metrics():
+    """Ollama client queue and call counters for /metrics."""
+    stats = get_client().stats()
+    endpoints = stats["endpoints"].items()
+    return [
+        ("gitfit_ollama_in_flight", "gauge", "Ollama calls running", [({}, stats["in_flight"])]),
+        ("gitfit_ollama_queued", "gauge", "Ollama calls waiting for a slot", [({}, stats["queued"])]),
+        ("gitfit_ollama_calls_total", "counter", "Ollama calls made, failed and rejected",
+         [({"path": path, "outcome": outcome}, metrics[outcome]) for path, metrics in endpoints
+          for outcome in ("calls", "errors", "rejected")]),
+        ("gitfit_ollama_latency_avg_seconds", "gauge", "Average Ollama call latency",
+         [({"path": path}, metrics["latency_avg_ms"] / 1000) for path, metrics in endpoints]),
+    ]
+
+query_stats.register_collector(ollama_metrics)
+
 if __name__ == '__main__':
     logger.info("Starting Flask server on 0.0.0.0")
+    # debug=True re-runs this module in a reloader child that does the serving;
+    # pre-generate only there, or the watcher process would run a second loop
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        motivationCache.start_pregeneration()
     app.run(debug=True, host="0.0.0.0")
 
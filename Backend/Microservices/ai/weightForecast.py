@@ -0,0 +1,197 @@
+"""
+Weight trend forecasting for the weight chart and the progress prediction.
+
+Both endpoints used to read ``user_stats`` on their own. The chart fitted a
+scikit-learn regression per request and predicted one week at a time;
+the prediction derived a second, two-point trend. Now one query reads a
+user's weight history with their latest weight goal, the least-squares line
+is solved in closed form with NumPy, and the whole forecast horizon is
+evaluated in one vectorised call.
+
+Fitted trends are cached per user. The user service publishes on
+``notify.WEIGHT_CHANNEL`` when it stores new stats or a new weight goal,
+which drops that user's trend; ``WEIGHT_FORECAST_MAX_AGE`` is a safety net
+for writes made outside the services.
+
+Configuration (environment variables):
+    WEIGHT_FORECAST_MAX_USERS  trends kept at most
+    WEIGHT_FORECAST_MAX_AGE    seconds a trend is served without re-reading
+"""
+
+import os
+import time
+import logging
+import datetime
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from psycopg2 import sql
+
+from global_func import getConnection
+from common import notify
+
+logger = logging.getLogger("ai_service.weight_forecast")
+
+FORECAST_MAX_USERS = int(os.getenv("WEIGHT_FORECAST_MAX_USERS", "1000"))
+FORECAST_MAX_AGE = float(os.getenv("WEIGHT_FORECAST_MAX_AGE", "3600"))
+MAX_PREDICTIONS = 52  # Weekly forecast points at most (1 year)
+MAX_WEIGHT = 1000  # Weights outside (0, MAX_WEIGHT] are treated as bad data
+
+# Every weight entry oldest first, each carrying the latest weight goal;
+# a single row of NULLs with the goal when the user has no entries
+weightHistoryQuery = sql.SQL("""
+    SELECT us.created_at, us.weight, goal.target_weight, goal.achieve_by
+    FROM (SELECT %s::int AS user_id) me
+    LEFT JOIN LATERAL (
+        SELECT target_weight, achieve_by
+        FROM weight_goals
+        WHERE user_id = me.user_id
+        ORDER BY created_at DESC
+        LIMIT 1
+    ) goal ON TRUE
+    LEFT JOIN user_stats us ON us.user_id = me.user_id
+    ORDER BY us.created_at
+""")
+
+
+class WeightTrend:
+    """
+    A user's weight history, latest goal and fitted linear trend.
+
+    ``slope`` is in pounds per day and ``intercept`` is the fitted weight on
+    the day of the first entry; both are None with fewer than two entries.
+    """
+
+    def __init__(self, entries, goal_weight, goal_date):
+        self.entries = entries  # [(created_at, weight)] oldest first
+        self.goal_weight = goal_weight
+        self.goal_date = goal_date
+        self.slope = None
+        self.intercept = None
+        self.loaded_at = time.monotonic()
+
+        if len(entries) >= 2:
+            x = self._days(np.array([created_at.date() for created_at, _ in entries], dtype="datetime64[D]"))
+            y = np.array([weight for _, weight in entries], dtype=float)
+            x_centered = x - x.mean()
+            denominator = np.dot(x_centered, x_centered)
+            # All entries on one day leave the slope undetermined; call the trend flat
+            self.slope = float(np.dot(x_centered, y - y.mean()) / denominator) if denominator else 0.0
+            self.intercept = float(y.mean() - self.slope * x.mean())
+
+    def _days(self, dates):
+        return (dates - np.datetime64(self.entries[0][0].date(), "D")).astype(float)
+
+    @property
+    def actual_data(self):
+        """(date, weight) per entry, for the chart."""
+        return [(created_at.date(), weight) for created_at, weight in self.entries]
+
+    def forecast(self):
+        """
+        Weekly predicted weights from the last entry up to the goal date.
+
+        Predictions are kept between the goal weight and one and a half times
+        the first recorded weight.
+
+        Returns:
+            list: (date, weight) tuples; empty without a trend or a goal
+        """
+        if self.slope is None or not self.goal_weight or not self.goal_date:
+            return []
+        last_date = self.entries[-1][0].date()
+        weeks = np.arange(1, MAX_PREDICTIONS + 1)
+        dates = np.datetime64(last_date, "D") + weeks * 7
+        dates = dates[dates <= np.datetime64(self.goal_date, "D")]
+        if not len(dates):
+            return []
+        predicted = self.intercept + self.slope * self._days(dates)
+        predicted = np.maximum(self.goal_weight, np.minimum(predicted, self.entries[0][1] * 1.5))
+        return [(date.item(), float(weight)) for date, weight in zip(dates, predicted)]
+
+
+def _load(user_id):
+    conn = getConnection()
+    try:
+        cur = conn.cursor()
+        cur.execute(weightHistoryQuery, (user_id,))
+        rows = cur.fetchall()
+        cur.close()
+    finally:
+        conn.close()
+
+    entries = []
+    for created_at, weight, _, _ in rows:
+        if created_at is None or weight is None:
+            continue
+        weight = float(weight)
+        if weight <= 0 or weight > MAX_WEIGHT:
+            logger.warning(f"Skipping invalid weight value {weight} for user {user_id}")
+            continue
+        entries.append((created_at, weight))
+
+    goal_weight, goal_date = (rows[0][2], rows[0][3]) if rows else (None, None)
+    goal_weight = float(goal_weight) if goal_weight is not None else None
+    if isinstance(goal_date, datetime.datetime):
+        goal_date = goal_date.date()
+    return WeightTrend(entries, goal_weight, goal_date)
+
+
+_trends = OrderedDict()  # user_id -> WeightTrend
+_lock = threading.Lock()
+_invalidations = 0  # bumped by invalidate() so a load racing a write is not cached
+_subscribed = False
+
+
+def invalidate(payload=None):
+    """Forget a user's trend (all of them when the payload is empty or ``*``)."""
+    global _invalidations
+    with _lock:
+        _invalidations += 1
+        if not payload or payload == "*":
+            _trends.clear()
+            return
+        try:
+            _trends.pop(int(payload), None)
+        except ValueError:
+            logger.warning(f"Ignoring malformed weight notification: {payload}")
+
+
+def get_trend(user_id):
+    """
+    Return a user's weight trend, fitting it on first use or after their weight data changed.
+
+    Args:
+        user_id (int): User to forecast
+
+    Returns:
+        WeightTrend: History, goal and fitted coefficients
+
+    Raises:
+        psycopg2.Error: If the history cannot be read
+    """
+    global _subscribed
+    now = time.monotonic()
+    with _lock:
+        if not _subscribed:
+            notify.subscribe(notify.WEIGHT_CHANNEL, invalidate, on_reconnect=invalidate)
+            _subscribed = True
+        trend = _trends.get(user_id)
+        if trend is not None and now - trend.loaded_at < FORECAST_MAX_AGE:
+            _trends.move_to_end(user_id)
+            return trend
+        invalidations = _invalidations
+
+    start_time = time.time()
+    trend = _load(user_id)
+    logger.info(f"Fitted weight trend for user {user_id} over {len(trend.entries)} entries "
+                f"in {time.time() - start_time:.3f}s")
+
+    with _lock:
+        if invalidations == _invalidations:
+            _trends[user_id] = trend
+            _trends.move_to_end(user_id)
+            while len(_trends) > FORECAST_MAX_USERS:
+                _trends.popitem(last=False)
+    return trend
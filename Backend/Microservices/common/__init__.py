@@ -0,0 +1,6 @@
+"""
+Shared code used by every GitFit microservice.
+
+Each service's Docker image copies this package next to its own modules, and
+local runs pick it up through the parent ``Microservices`` directory.
+"""
@@ -0,0 +1,176 @@
+"""
+In-process cache of API key -> user id lookups.
+
+Every authenticated request used to run ``SELECT id FROM users WHERE key = %s``,
+often more than once. The services now consult this bounded LRU cache first:
+
+- valid keys are cached for ``API_KEY_CACHE_TTL`` seconds
+- unknown keys are cached as misses for ``API_KEY_CACHE_NEGATIVE_TTL`` seconds
+- writers that change or remove a key call ``invalidate()``, which drops the
+  entry locally and, when given a cursor, queues a ``pg_notify`` so the other
+  services drop it too once the transaction commits
+
+Keys are stored as SHA-256 digests so raw API keys are neither kept in memory
+nor broadcast over NOTIFY.
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from common import notify
+
+logger = logging.getLogger("common.auth_cache")
+
+CACHE_MAX_SIZE = int(os.getenv("API_KEY_CACHE_MAX_SIZE", "10000"))
+CACHE_TTL = float(os.getenv("API_KEY_CACHE_TTL", "300"))
+CACHE_NEGATIVE_TTL = float(os.getenv("API_KEY_CACHE_NEGATIVE_TTL", "30"))
+NOTIFY_CHANNEL = "api_key_invalidated"
+
+# Returned by ApiKeyCache.get() when nothing usable is cached
+MISSING = object()
+
+
+def _digest(key):
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class ApiKeyCache:
+    """
+    Bounded LRU + TTL cache mapping API key digests to user ids.
+
+    A cached value of ``None`` is a negative entry (the key is known to be invalid).
+    """
+
+    def __init__(self, max_size=CACHE_MAX_SIZE, ttl=CACHE_TTL, negative_ttl=CACHE_NEGATIVE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()  # digest -> (user_id, expires_at)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "negative_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, key):
+        """
+        Look up a key.
+
+        Returns:
+            int, None or MISSING: The user id, None for a cached invalid key,
+            or MISSING when the database has to be asked
+        """
+        digest = _digest(key)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[digest]
+                self._stats["misses"] += 1
+                return MISSING
+            self._entries.move_to_end(digest)
+            if entry[0] is None:
+                self._stats["negative_hits"] += 1
+            else:
+                self._stats["hits"] += 1
+            return entry[0]
+
+    def put(self, key, user_id):
+        """Cache the result of a database lookup; ``user_id=None`` records an invalid key."""
+        ttl = self.ttl if user_id is not None else self.negative_ttl
+        digest = _digest(key)
+        with self._lock:
+            self._entries[digest] = (user_id, time.monotonic() + ttl)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def discard(self, digest=None, user_id=None):
+        """Drop entries by key digest and/or by user id."""
+        with self._lock:
+            if digest is not None and self._entries.pop(digest, None) is not None:
+                self._stats["invalidations"] += 1
+            if user_id is not None:
+                stale = [d for d, (uid, _) in self._entries.items() if uid == user_id]
+                for d in stale:
+                    del self._entries[d]
+                self._stats["invalidations"] += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the process-wide cache, starting the invalidation listener on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ApiKeyCache()
+            cache = _cache
+            # Anything published while the listener was disconnected is lost, so start clean
+            notify.subscribe(NOTIFY_CHANNEL, lambda payload: _apply_notification(cache, payload),
+                             on_reconnect=cache.clear)
+        return _cache
+
+
+def get(key):
+    """Cached user id for ``key``, None for a known-invalid key, or MISSING."""
+    if not key:
+        return MISSING
+    return get_cache().get(key)
+
+
+def put(key, user_id):
+    """Record the outcome of a database key lookup."""
+    if key:
+        get_cache().put(key, user_id)
+
+
+def invalidate(key=None, user_id=None, cur=None):
+    """
+    Forget cached lookups for a key and/or every key of a user.
+
+    Args:
+        key (str, optional): API key that changed or was revoked
+        user_id (int, optional): User whose keys should all be forgotten
+        cur (psycopg2.cursor, optional): Cursor inside the writing transaction;
+            when given, the other services are notified once it commits
+    """
+    digest = _digest(key) if key else None
+    get_cache().discard(digest=digest, user_id=user_id)
+
+    if cur is None:
+        return
+    payloads = []
+    if digest:
+        payloads.append(f"key:{digest}")
+    if user_id is not None:
+        payloads.append(f"user:{user_id}")
+    for payload in payloads:
+        notify.publish(cur, NOTIFY_CHANNEL, payload)
+
+
+def _apply_notification(cache, payload):
+    kind, _, value = payload.partition(":")
+    if kind == "key":
+        cache.discard(digest=value)
+    elif kind == "user":
+        try:
+            cache.discard(user_id=int(value))
+        except ValueError:
+            logger.warning(f"Ignoring malformed API key invalidation: {payload}")
+
@@ -0,0 +1,161 @@
+"""
+Immutable in-memory index of the exercise catalogue.
+
+The exercises table is small (under a thousand rows) and rarely changes, yet
+it was queried row by row to resolve names and muscle groups. Each process now
+loads the whole catalogue once into an immutable snapshot and serves lookups
+from memory. The snapshot is swapped for a fresh one when:
+
+- a writer calls ``invalidate()`` (other services hear about it through NOTIFY)
+- it is older than ``EXERCISE_CATALOGUE_MAX_AGE`` seconds, as a safety net for
+  edits made outside the services (e.g. seeding scripts)
+"""
+
+import os
+import time
+import logging
+import threading
+from types import MappingProxyType
+from typing import NamedTuple, Optional, Tuple
+
+from common import db, notify
+
+logger = logging.getLogger("common.exercise_catalogue")
+
+CATALOGUE_MAX_AGE = float(os.getenv("EXERCISE_CATALOGUE_MAX_AGE", "600"))
+NOTIFY_CHANNEL = "exercise_catalogue_changed"
+
+
+class Exercise(NamedTuple):
+    id: int
+    name: str
+    equipment: Optional[str]
+    description: Optional[str]
+    single_sided: bool
+    primary_muscles: Tuple[str, ...]
+    secondary_muscles: Tuple[str, ...]
+    createdby: Optional[int]
+    is_deleted: bool
+
+    @property
+    def muscles(self):
+        """Primary then secondary muscles, without duplicates."""
+        return tuple(dict.fromkeys(self.primary_muscles + self.secondary_muscles))
+
+    def visible_to(self, user_id):
+        """Whether the exercise shows up in a user's catalogue (not deleted, global or their own)."""
+        return not self.is_deleted and (self.createdby is None or self.createdby == user_id)
+
+
+class ExerciseCatalogue:
+    """
+    Read-only snapshot of the exercises table.
+
+    Iterating yields exercises in database ``ORDER BY name`` order; deleted
+    exercises are kept so historical workouts can still be resolved.
+    """
+
+    def __init__(self, exercises):
+        self._ordered = tuple(exercises)
+        self._by_id = MappingProxyType({exercise.id: exercise for exercise in self._ordered})
+        self.loaded_at = time.monotonic()
+
+    def get(self, exercise_id):
+        return self._by_id.get(exercise_id)
+
+    def muscles(self, exercise_id):
+        exercise = self._by_id.get(exercise_id)
+        return list(exercise.muscles) if exercise else []
+
+    def __contains__(self, exercise_id):
+        return exercise_id in self._by_id
+
+    def __iter__(self):
+        return iter(self._ordered)
+
+    def __len__(self):
+        return len(self._ordered)
+
+
+_catalogue = None
+_stale = True
+_lock = threading.Lock()
+_subscribed = False
+
+
+def _mark_stale(payload=None):
+    global _stale
+    _stale = True
+
+
+def _load():
+    query = """
+        SELECT id, name, equipment::text, description, COALESCE(single_sided, FALSE),
+               COALESCE(primary_muscle::text[], '{}'), COALESCE(secondary_muscles::text[], '{}'),
+               createdby, COALESCE(is_deleted, FALSE)
+        FROM exercises
+        ORDER BY name, id
+    """
+    conn = db.get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(query)
+        rows = cur.fetchall()
+        cur.close()
+    finally:
+        conn.close()
+    return ExerciseCatalogue(
+        Exercise(row[0], row[1], row[2], row[3], row[4], tuple(row[5]), tuple(row[6]), row[7], row[8])
+        for row in rows
+    )
+
+
+def get_catalogue():
+    """
+    Return the current catalogue snapshot, loading or refreshing it when needed.
+
+    If a refresh fails while an older snapshot exists, the old one keeps being served.
+
+    Returns:
+        ExerciseCatalogue: Immutable snapshot
+    """
+    global _catalogue, _stale, _subscribed
+    catalogue = _catalogue
+    if catalogue is not None and not _stale and time.monotonic() - catalogue.loaded_at < CATALOGUE_MAX_AGE:
+        return catalogue
+
+    with _lock:
+        if not _subscribed:
+            notify.subscribe(NOTIFY_CHANNEL, _mark_stale, on_reconnect=_mark_stale)
+            _subscribed = True
+
+        catalogue = _catalogue
+        if catalogue is not None and not _stale and time.monotonic() - catalogue.loaded_at < CATALOGUE_MAX_AGE:
+            return catalogue
+
+        start_time = time.time()
+        _stale = False
+        try:
+            _catalogue = _load()
+        except Exception as e:
+            _stale = True
+            if catalogue is None:
+                raise
+            logger.warning(f"Exercise catalogue refresh failed, serving previous snapshot: {str(e)}")
+            return catalogue
+
+        logger.info(f"Loaded {len(_catalogue)} exercises into the catalogue in {time.time() - start_time:.3f}s")
+        return _catalogue
+
+
+def invalidate(cur=None):
+    """
+    Mark the catalogue as changed.
+
+    Args:
+        cur (psycopg2.cursor, optional): Cursor inside the writing transaction;
+            when given, the other services refresh once it commits
+    """
+    _mark_stale()
+    if cur is not None:
+        notify.publish(cur, NOTIFY_CHANNEL)
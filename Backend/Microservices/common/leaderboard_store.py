@@ -0,0 +1,501 @@
+"""
+Precomputed leaderboards kept in memory and updated incrementally.
+
+Every leaderboard request used to aggregate its whole source table. Each
+process now builds a board once per (category, exercise, window) with a
+single aggregate query and keeps its users in an indexable skip list ordered
+by score, so ranks, top-N and "around me" slices cost O(log n + k).
+
+Boards stay current without rescanning:
+
+- writers call ``publish_change()`` inside their transaction; once it commits,
+  every service marks that user dirty on the affected boards
+- on the next read, only the dirty users are re-aggregated (one indexed query)
+  and moved to their new position
+- windowed boards are rebuilt when the date rolls over, and every board is
+  rebuilt once it is older than ``LEADERBOARD_MAX_AGE`` seconds as a safety net
+
+Configuration (environment variables):
+    LEADERBOARD_MAX_BOARDS  live boards kept per process (least recently used are dropped)
+    LEADERBOARD_MAX_AGE     seconds before a board is rebuilt from scratch
+"""
+
+import os
+import time
+import random
+import logging
+import datetime
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+from psycopg2 import sql
+
+from common import db, notify
+
+logger = logging.getLogger("common.leaderboard_store")
+
+MAX_BOARDS = int(os.getenv("LEADERBOARD_MAX_BOARDS", "64"))
+MAX_AGE = float(os.getenv("LEADERBOARD_MAX_AGE", "900"))
+NOTIFY_CHANNEL = "leaderboard_changed"
+
+
+class BoardDefinition(NamedTuple):
+    query: str              # SELECT user_id, username, value[, detail] ... {filters} GROUP BY ...
+    user_column: str
+    date_column: str        # filtered on when the board has a window
+    exercise_column: str    # filtered on for per-exercise boards, None otherwise
+    descending: bool        # True when a higher value ranks first
+
+
+DEFINITIONS = {
+    "steps": BoardDefinition(
+        query="""
+            SELECT us.user_id, u.username, ROUND(AVG(us.steps)::numeric, 2)
+            FROM user_steps us
+            JOIN users u ON u.id = us.user_id
+            WHERE TRUE {filters}
+            GROUP BY us.user_id, u.username
+        """,
+        user_column="us.user_id", date_column="us.date_performed", exercise_column=None, descending=True),
+    "workouts": BoardDefinition(
+        query="""
+            SELECT w.user_id, u.username, COUNT(w.id)
+            FROM workouts w
+            JOIN users u ON u.id = w.user_id
+            WHERE TRUE {filters}
+            GROUP BY w.user_id, u.username
+        """,
+        user_column="w.user_id", date_column="w.workout_date", exercise_column=None, descending=True),
+    "weight": BoardDefinition(
+        query="""
+            SELECT w.user_id, u.username, MAX(s.weight)
+            FROM workouts w
+            JOIN workout_exercises we ON we.workout_id = w.id
+            CROSS JOIN LATERAL unnest((we.sets).weight) AS s(weight)
+            JOIN users u ON u.id = w.user_id
+            WHERE TRUE {filters}
+            GROUP BY w.user_id, u.username
+        """,
+        user_column="w.user_id", date_column="w.workout_date", exercise_column="we.exercise_id", descending=True),
+    "1rm": BoardDefinition(
+        query="""
+            SELECT uem.user_id, u.username, MAX(uem.calculated_1rm),
+                   (array_agg(uem.date_performed ORDER BY uem.calculated_1rm DESC, uem.date_performed DESC))[1]
+            FROM user_exercise_max uem
+            JOIN users u ON u.id = uem.user_id
+            WHERE TRUE {filters}
+            GROUP BY uem.user_id, u.username
+        """,
+        user_column="uem.user_id", date_column="uem.date_performed", exercise_column="uem.exercise_id", descending=True),
+    "pace": BoardDefinition(
+        query="""
+            SELECT w.user_id, u.username, MIN(wc.duration / wc.distance)
+            FROM workouts w
+            JOIN workout_cardio wc ON wc.workout_id = w.id
+            JOIN users u ON u.id = w.user_id
+            WHERE wc.distance >= 1 {filters}
+            GROUP BY w.user_id, u.username
+        """,
+        user_column="w.user_id", date_column="w.workout_date", exercise_column=None, descending=False),
+}
+
+# Categories a workout can affect, for writers in the workout service
+WORKOUT_CATEGORIES = ("workouts", "weight", "1rm", "pace")
+
+
+class IndexableSkipList:
+    """
+    Sorted sequence with O(log n) insert, remove, bisect and positional access.
+
+    Each link records how many bottom-level nodes it skips (its width), which
+    is what makes rank and index lookups logarithmic.
+    """
+
+    MAX_LEVEL = 24
+
+    class _Node:
+        __slots__ = ("value", "next", "width")
+
+        def __init__(self, value, level):
+            self.value = value
+            self.next = [None] * level
+            self.width = [1] * level
+
+    def __init__(self):
+        self._head = self._Node(None, self.MAX_LEVEL)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _random_level(self):
+        level = 1
+        while level < self.MAX_LEVEL and random.random() < 0.5:
+            level += 1
+        return level
+
+    def _predecessors(self, value):
+        """Last node before ``value`` on every level, and the positions skipped to reach it."""
+        chain = [None] * self.MAX_LEVEL
+        steps = [0] * self.MAX_LEVEL
+        node = self._head
+        for level in reversed(range(self.MAX_LEVEL)):
+            while node.next[level] is not None and node.next[level].value < value:
+                steps[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+        return chain, steps
+
+    def insert(self, value):
+        chain, steps = self._predecessors(value)
+        node = self._Node(value, self._random_level())
+        skipped = 0
+        for level in range(len(node.next)):
+            previous = chain[level]
+            node.next[level] = previous.next[level]
+            previous.next[level] = node
+            node.width[level] = previous.width[level] - skipped
+            previous.width[level] = skipped + 1
+            skipped += steps[level]
+        for level in range(len(node.next), self.MAX_LEVEL):
+            chain[level].width[level] += 1
+        self._size += 1
+
+    def remove(self, value):
+        chain, _ = self._predecessors(value)
+        node = chain[0].next[0]
+        if node is None or node.value != value:
+            raise KeyError(value)
+        for level in range(len(node.next)):
+            previous = chain[level]
+            previous.width[level] += node.width[level] - 1
+            previous.next[level] = node.next[level]
+        for level in range(len(node.next), self.MAX_LEVEL):
+            chain[level].width[level] -= 1
+        self._size -= 1
+
+    def bisect_left(self, value):
+        """Number of elements strictly less than ``value``."""
+        position = 0
+        node = self._head
+        for level in reversed(range(self.MAX_LEVEL)):
+            while node.next[level] is not None and node.next[level].value < value:
+                position += node.width[level]
+                node = node.next[level]
+        return position
+
+    def items(self, start, count):
+        """Up to ``count`` elements starting at index ``start``."""
+        if start < 0 or start >= self._size or count <= 0:
+            return []
+        node = self._head
+        remaining = start + 1
+        for level in reversed(range(self.MAX_LEVEL)):
+            while node.next[level] is not None and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        values = []
+        while node is not None and len(values) < count:
+            values.append(node.value)
+            node = node.next[0]
+        return values
+
+
+class RankedBoard:
+    """
+    Users kept sorted by score.
+
+    ``_order`` holds ``(sort_key, user_id)`` pairs in ranking order, so the
+    position of a user or of a score is a logarithmic skip list lookup. Ranks
+    follow SQL ``RANK()``: tied scores share a rank and the next rank skips ahead.
+    """
+
+    def __init__(self, descending=True):
+        self.descending = descending
+        self._order = IndexableSkipList()
+        self._entries = {}  # user_id -> (sort_key, value, username, detail)
+
+    def _sort_key(self, value):
+        return -value if self.descending else value
+
+    def set(self, user_id, value, username, detail=None):
+        self.discard(user_id)
+        sort_key = self._sort_key(value)
+        self._order.insert((sort_key, user_id))
+        self._entries[user_id] = (sort_key, value, username, detail)
+
+    def discard(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._order.remove((entry[0], user_id))
+
+    def __contains__(self, user_id):
+        return user_id in self._entries
+
+    def __len__(self):
+        return len(self._order)
+
+    def position(self, user_id):
+        """Zero-based position of a user in ranking order, or None if absent."""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        return self._order.bisect_left((entry[0], user_id))
+
+    def rank(self, user_id):
+        """RANK() of a user, or None if absent."""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        # (sort_key,) sorts before every (sort_key, user_id), so this counts strictly better scores
+        return self._order.bisect_left((entry[0],)) + 1
+
+    def slice(self, start, count):
+        """
+        Entries at positions ``start`` to ``start + count - 1``.
+
+        Returns:
+            list: (user_id, username, value, rank, detail) tuples in ranking order
+        """
+        start = max(start, 0)
+        rows = []
+        previous_key = None
+        rank = None
+        for offset, (sort_key, user_id) in enumerate(self._order.items(start, count)):
+            if rank is None:
+                rank = self._order.bisect_left((sort_key,)) + 1
+            elif sort_key != previous_key:
+                rank = start + offset + 1
+            previous_key = sort_key
+            _, value, username, detail = self._entries[user_id]
+            rows.append((user_id, username, value, rank, detail))
+        return rows
+
+    def top(self, count):
+        return self.slice(0, count)
+
+    def around(self, user_id, count, clamp=False):
+        """
+        ``count`` entries centred on a user.
+
+        Args:
+            user_id (int): User to centre on
+            count (int): Number of entries to return
+            clamp (bool, optional): Shift the window so it stays full at either end of the board
+
+        Returns:
+            list: (user_id, username, value, rank, detail) tuples, empty if the user is not on the board
+        """
+        position = self.position(user_id)
+        if position is None:
+            return []
+        start = position - count // 2
+        if clamp:
+            start = min(start, len(self._order) - count)
+        return self.slice(max(start, 0), count)
+
+
+class LiveBoard:
+    """A RankedBoard tied to its source query, refreshed lazily on read."""
+
+    def __init__(self, category, exercise_id=None, days=None):
+        if category not in DEFINITIONS:
+            raise ValueError(f"Unknown leaderboard category: {category}")
+        self.category = category
+        self.exercise_id = exercise_id
+        self.days = days
+        self.definition = DEFINITIONS[category]
+        self._board = None
+        self._built_on = None
+        self._built_at = 0.0
+        self._dirty = set()
+        self._stale = True
+        self._lock = threading.Lock()
+
+    def mark_dirty(self, user_id=None):
+        """Queue one user for re-aggregation, or the whole board for a rebuild when ``user_id`` is None."""
+        with self._lock:
+            if user_id is None:
+                self._stale = True
+            else:
+                self._dirty.add(user_id)
+
+    def _query(self, cur, user_ids=None):
+        definition = self.definition
+        filters = []
+        params = []
+        if definition.exercise_column is not None:
+            filters.append(sql.SQL("AND {} = %s").format(sql.SQL(definition.exercise_column)))
+            params.append(self.exercise_id)
+        if self.days is not None:
+            # Half-open range so timestamp columns keep everything logged today
+            today = datetime.date.today()
+            filters.append(sql.SQL("AND {0} >= %s AND {0} < %s").format(sql.SQL(definition.date_column)))
+            params.extend([today - datetime.timedelta(days=self.days), today + datetime.timedelta(days=1)])
+        if user_ids is not None:
+            filters.append(sql.SQL("AND {} = ANY(%s)").format(sql.SQL(definition.user_column)))
+            params.append(list(user_ids))
+        query = sql.SQL(definition.query).format(filters=sql.SQL(" ").join(filters))
+        cur.execute(query, params)
+        return cur.fetchall()
+
+    def _sync(self):
+        """Bring the board up to date; the caller holds the lock."""
+        today = datetime.date.today()
+        rebuild = (self._board is None or self._stale
+                   or time.monotonic() - self._built_at > MAX_AGE
+                   or (self.days is not None and self._built_on != today))
+        if not rebuild and not self._dirty:
+            return
+
+        conn = db.get_connection()
+        try:
+            cur = conn.cursor()
+            if rebuild:
+                start_time = time.time()
+                self._stale = False
+                self._dirty.clear()
+                try:
+                    rows = self._query(cur)
+                except Exception:
+                    self._stale = True
+                    raise
+                board = RankedBoard(self.definition.descending)
+                for user_id, username, value, *detail in rows:
+                    if value is not None:
+                        board.set(user_id, value, username, *detail)
+                self._board = board
+                self._built_on = today
+                self._built_at = time.monotonic()
+                logger.info(f"Built {self.category} leaderboard (exercise={self.exercise_id}, days={self.days}) "
+                            f"with {len(board)} users in {time.time() - start_time:.3f}s")
+            else:
+                dirty = self._dirty
+                self._dirty = set()
+                try:
+                    rows = self._query(cur, dirty)
+                except Exception:
+                    self._dirty |= dirty
+                    raise
+                for user_id in dirty:
+                    self._board.discard(user_id)
+                for user_id, username, value, *detail in rows:
+                    if value is not None:
+                        self._board.set(user_id, value, username, *detail)
+                logger.debug(f"Refreshed {len(dirty)} users on {self.category} leaderboard")
+            cur.close()
+        finally:
+            conn.close()
+
+    def refresh(self):
+        with self._lock:
+            self._sync()
+
+    def top(self, count):
+        with self._lock:
+            self._sync()
+            return self._board.top(count)
+
+    def around(self, user_id, count, clamp=False):
+        with self._lock:
+            self._sync()
+            return self._board.around(user_id, count, clamp)
+
+    def rank(self, user_id):
+        with self._lock:
+            self._sync()
+            return self._board.rank(user_id)
+
+
+_boards = OrderedDict()  # (category, exercise_id, days) -> LiveBoard
+_boards_lock = threading.Lock()
+_subscribed = False
+
+
+def get_board(category, exercise_id=None, days=None):
+    """
+    Return the live board for a category, creating it on first use.
+
+    Args:
+        category (str): One of DEFINITIONS
+        exercise_id (int, optional): Exercise for per-exercise categories (weight, 1rm)
+        days (int, optional): Window in days; None for all time
+
+    Returns:
+        LiveBoard: Board whose reads are refreshed as needed
+    """
+    global _subscribed
+    if DEFINITIONS.get(category) is not None and DEFINITIONS[category].exercise_column is None:
+        exercise_id = None
+    key = (category, exercise_id, days)
+    with _boards_lock:
+        if not _subscribed:
+            notify.subscribe(NOTIFY_CHANNEL, _apply_notification, on_reconnect=_mark_all_stale)
+            _subscribed = True
+        board = _boards.get(key)
+        if board is None:
+            board = LiveBoard(category, exercise_id, days)
+            _boards[key] = board
+            while len(_boards) > MAX_BOARDS:
+                _boards.popitem(last=False)
+        else:
+            _boards.move_to_end(key)
+        return board
+
+
+def publish_change(cur, user_id, *categories):
+    """
+    Tell every service that a user's scores changed, once the transaction commits.
+
+    Args:
+        cur (psycopg2.cursor): Cursor inside the writing transaction
+        user_id (int): User whose data changed; None to rebuild the categories for everyone
+        *categories (str): Affected categories; all of them when omitted
+    """
+    target = "*" if user_id is None else str(user_id)
+    payload = f"{target}:{','.join(categories)}"
+    notify.publish(cur, NOTIFY_CHANNEL, payload)
+    # Mark this process's boards right away so its next read sees the write;
+    # the notification marks them again after commit in case that read came first
+    _apply_notification(payload)
+
+
+def warm(boards):
+    """
+    Build boards in a background thread so the first requests do not pay for it.
+
+    Args:
+        boards (list): (category, exercise_id, days) tuples
+    """
+    def build():
+        for category, exercise_id, days in boards:
+            try:
+                get_board(category, exercise_id, days).refresh()
+            except Exception as e:
+                logger.warning(f"Could not prebuild {category} leaderboard: {str(e)}")
+
+    threading.Thread(target=build, name="leaderboard-warmup", daemon=True).start()
+
+
+def _live_boards():
+    with _boards_lock:
+        return list(_boards.values())
+
+
+def _mark_all_stale():
+    for board in _live_boards():
+        board.mark_dirty()
+
+
+def _apply_notification(payload):
+    target, _, categories = payload.partition(":")
+    categories = set(filter(None, categories.split(","))) or set(DEFINITIONS)
+    try:
+        user_id = None if target == "*" else int(target)
+    except ValueError:
+        logger.warning(f"Ignoring malformed leaderboard notification: {payload}")
+        return
+    for board in _live_boards():
+        if board.category in categories:
+            board.mark_dirty(user_id)
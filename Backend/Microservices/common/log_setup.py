@@ -0,0 +1,132 @@
+"""
+Shared logging setup for the services.
+
+Each service used to call ``logging.basicConfig`` with a ``FileHandler`` and a
+``StreamHandler``, so every log line was written to disk on the request
+thread. Library modules that were imported first sometimes configured logging
+before the service did. ``configure()`` replaces all of that with:
+
+- one ``QueueHandler`` on the root logger, with a ``QueueListener`` thread
+  doing the file and console I/O, so request threads only enqueue records
+- the service name and the request id of the current Flask request on
+  every record, shown in JSON output
+- optional sampling of DEBUG records, so a service can keep a share of its
+  hot-path debug output without paying for all of it
+
+Messages should use lazy %-style arguments, e.g.
+``logger.debug("Fetched %s rows", len(rows))``. That way nothing is
+formatted for records that are filtered out or sampled away.
+
+Configuration (environment variables):
+    LOG_LEVEL              overrides the service's default level
+    LOG_FORMAT             "text" (default) or "json"
+    LOG_DEBUG_SAMPLE_RATE  share of DEBUG records kept, between 0 and 1 (default 1)
+    LOG_FILE               overrides the service's log file; empty to log to the console only
+"""
+
+import os
+import json
+import atexit
+import queue
+import random
+import logging
+import logging.handlers
+import datetime
+
+try:
+    from flask import has_request_context, request
+except ImportError:  # Scripts without Flask have no request id
+    has_request_context = None
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_listener = None
+
+
+def _current_request_id():
+    if has_request_context is not None and has_request_context():
+        return getattr(request, "request_id", None)
+    return None
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamps records with the service name and the current request id, and samples DEBUG records."""
+
+    def __init__(self, service, debug_sample_rate=1.0):
+        super().__init__()
+        self.service = service
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record):
+        if record.levelno <= logging.DEBUG and self.debug_sample_rate < 1.0 and random.random() >= self.debug_sample_rate:
+            return False
+        record.service = self.service
+        if not hasattr(record, "request_id"):
+            record.request_id = _current_request_id()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, service, request id and message."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "service": getattr(record, "service", None),
+            "request_id": getattr(record, "request_id", None),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure(service, log_file=None, level=logging.INFO):
+    """
+    Route all logging of this process through a queue to file and console handlers.
+
+    Calling it again replaces the previous setup.
+
+    Args:
+        service (str): Service name put on every record
+        log_file (str, optional): File to log to, besides the console
+        level (int, optional): Default level when LOG_LEVEL is not set
+    """
+    global _listener
+    level = os.getenv("LOG_LEVEL", level)
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+    log_file = os.getenv("LOG_FILE", log_file)
+    sample_rate = min(max(float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1")), 0.0), 1.0)
+    formatter = JsonFormatter() if os.getenv("LOG_FORMAT", "text").lower() == "json" else logging.Formatter(TEXT_FORMAT)
+
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    if _listener is not None:
+        _listener.stop()
+    records = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=False)
+    _listener.start()
+
+    queue_handler = logging.handlers.QueueHandler(records)
+    queue_handler.addFilter(RequestContextFilter(service, sample_rate))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+
+@atexit.register
+def _stop_listener():
+    # Writes out whatever is still queued
+    if _listener is not None:
+        _listener.stop()
@@ -0,0 +1,188 @@
+"""
+Background, batched writer for audit and API-call log rows.
+
+Audit rows used to be written inside the request: a connection checkout, one
+INSERT and a commit per row, all counted in the request's latency. Callers now
+hand rows to a ``LogShipper``, which puts them on a bounded in-process queue
+and returns immediately. One worker thread per table drains the queue and
+writes the rows with a single multi-row INSERT (``execute_values``) when
+``LOG_SHIPPER_BATCH_SIZE`` rows are waiting or ``LOG_SHIPPER_FLUSH_INTERVAL``
+seconds have passed since the first of them arrived.
+
+Audit logging is best effort, as before: when the queue is full new rows are
+dropped and counted, and a batch that fails to write is counted and dropped.
+``stats()`` reports these counters. Rows still queued at interpreter exit are
+flushed.
+
+Configuration (environment variables):
+    LOG_SHIPPER_QUEUE_SIZE      rows waiting at most, per table
+    LOG_SHIPPER_BATCH_SIZE      rows per INSERT
+    LOG_SHIPPER_FLUSH_INTERVAL  seconds a row waits at most before it is written
+"""
+
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+from common import db
+
+logger = logging.getLogger("common.log_shipper")
+
+QUEUE_SIZE = int(os.getenv("LOG_SHIPPER_QUEUE_SIZE", "10000"))
+BATCH_SIZE = int(os.getenv("LOG_SHIPPER_BATCH_SIZE", "200"))
+FLUSH_INTERVAL = float(os.getenv("LOG_SHIPPER_FLUSH_INTERVAL", "1.0"))
+
+
+class LogShipper:
+    """
+    Queue of rows for one table and the worker thread that writes them.
+
+    Args:
+        table (str): Table the rows go to
+        columns (tuple): Column names, in the order of each row's values
+        queue_size (int, optional): Rows waiting at most
+        batch_size (int, optional): Rows per INSERT
+        flush_interval (float, optional): Seconds a row waits at most
+    """
+
+    def __init__(self, table, columns, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.table = table
+        self.columns = tuple(columns)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._query = sql.SQL("INSERT INTO {} ({}) VALUES %s").format(
+            sql.Identifier(table), sql.SQL(", ").join(map(sql.Identifier, self.columns)))
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stats = {"queued": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0}
+        self._thread = threading.Thread(target=self._run, name=f"log-shipper-{table}", daemon=True)
+        self._thread.start()
+
+    def submit(self, row):
+        """
+        Queue a row for writing.
+
+        Args:
+            row (tuple): Values in the order of ``columns``
+
+        Returns:
+            bool: True if queued, False if the queue was full and the row was dropped
+        """
+        try:
+            self._queue.put_nowait(tuple(row))
+        except queue.Full:
+            with self._lock:
+                self._stats["dropped"] += 1
+                dropped = self._stats["dropped"]
+            # Warn on the first drop and then at every power of two, so an overflow cannot flood the log
+            if dropped & (dropped - 1) == 0:
+                logger.warning(f"{self.table} log queue is full, {dropped} rows dropped so far")
+            return False
+        with self._lock:
+            self._stats["queued"] += 1
+        return True
+
+    def _take_batch(self, block=True):
+        """Wait for a first row, then collect more until the batch is full or the flush interval ends."""
+        try:
+            rows = [self._queue.get() if block else self._queue.get_nowait()]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(rows) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if block and remaining > 0:
+                    rows.append(self._queue.get(timeout=remaining))
+                else:
+                    rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _write(self, rows):
+        conn = None
+        try:
+            conn = db.get_connection()
+            cur = conn.cursor()
+            execute_values(cur, self._query, rows, page_size=self.batch_size)
+            conn.commit()
+            cur.close()
+            with self._lock:
+                self._stats["written"] += len(rows)
+                self._stats["batches"] += 1
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            with self._lock:
+                self._stats["failed"] += len(rows)
+            logger.warning(f"Failed to write {len(rows)} rows to {self.table}: {str(e)}")
+        finally:
+            if conn:
+                conn.close()
+
+    def _run(self):
+        while True:
+            rows = self._take_batch()
+            with self._write_lock:
+                self._write(rows)
+
+    def flush(self):
+        """Write everything queued right now from the calling thread (used at exit)."""
+        with self._write_lock:
+            while True:
+                rows = self._take_batch(block=False)
+                if not rows:
+                    return
+                self._write(rows)
+
+    def stats(self):
+        """Counters plus the current queue depth."""
+        with self._lock:
+            return {**self._stats, "pending": self._queue.qsize()}
+
+
+_shippers = {}
+_shippers_lock = threading.Lock()
+
+
+def get_shipper(table, columns):
+    """
+    Return the process-wide shipper for a table, starting it on first use.
+
+    Args:
+        table (str): Table the rows go to
+        columns (tuple): Column names, in the order of each row's values
+
+    Returns:
+        LogShipper: Shipper for the table
+    """
+    shipper = _shippers.get(table)
+    if shipper is not None:
+        return shipper
+    with _shippers_lock:
+        if table not in _shippers:
+            _shippers[table] = LogShipper(table, columns)
+        return _shippers[table]
+
+
+def stats():
+    """Counters of every shipper in this process, by table."""
+    with _shippers_lock:
+        shippers = dict(_shippers)
+    return {table: shipper.stats() for table, shipper in shippers.items()}
+
+
+@atexit.register
+def _flush_all():
+    with _shippers_lock:
+        shippers = list(_shippers.values())
+    for shipper in shippers:
+        shipper.flush()
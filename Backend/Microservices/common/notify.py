@@ -0,0 +1,110 @@
+"""
+Cross-service change notifications over PostgreSQL LISTEN/NOTIFY.
+
+In-process caches (API keys, the exercise catalogue, ...) subscribe to a
+channel here; writers publish on the same channel from inside their
+transaction, so every service hears about the change once it commits.
+One background thread per process holds a dedicated connection (outside the
+pool) and dispatches notifications to the subscribers.
+"""
+
+import time
+import select
+import logging
+import threading
+
+import psycopg2
+
+from common import db
+
+logger = logging.getLogger("common.notify")
+
+# Published by the user service when a user stores new stats or a new weight goal;
+# the payload is the user id
+WEIGHT_CHANNEL = "weight_changed"
+
+_subscribers = {}  # channel -> [(callback, on_reconnect)]
+_lock = threading.Lock()
+_listener = None
+
+
+def subscribe(channel, callback, on_reconnect=None):
+    """
+    Call ``callback(payload)`` for every notification published on ``channel``.
+
+    Args:
+        channel (str): Notification channel (a plain identifier)
+        callback (callable): Receives the payload string
+        on_reconnect (callable, optional): Called after the listener (re)connects,
+            since anything published while it was disconnected was lost
+    """
+    global _listener
+    with _lock:
+        _subscribers.setdefault(channel, []).append((callback, on_reconnect))
+        if _listener is None:
+            _listener = threading.Thread(target=_listen, name="pg-notify-listener", daemon=True)
+            _listener.start()
+
+
+def publish(cur, channel, payload=""):
+    """
+    Queue a notification inside the caller's transaction; it is delivered on commit.
+
+    Args:
+        cur (psycopg2.cursor): Cursor of the writing transaction
+        channel (str): Notification channel
+        payload (str, optional): Message for the subscribers
+    """
+    cur.execute("SELECT pg_notify(%s, %s)", (channel, payload))
+
+
+def _dispatch(channel, payload):
+    with _lock:
+        handlers = list(_subscribers.get(channel, []))
+    for callback, _ in handlers:
+        try:
+            callback(payload)
+        except Exception as e:
+            logger.warning(f"Notification handler for {channel} failed: {str(e)}")
+
+
+def _listen():
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(db.DATABASE_URL)
+            conn.autocommit = True
+            cur = conn.cursor()
+            listening = set()
+            reconnected = True
+
+            while True:
+                with _lock:
+                    channels = {channel: list(handlers) for channel, handlers in _subscribers.items()}
+                for channel in channels.keys() - listening:
+                    cur.execute(f"LISTEN {channel}")
+                    listening.add(channel)
+                    logger.info(f"Listening for {channel} notifications")
+
+                if reconnected:
+                    for handlers in channels.values():
+                        for _, on_reconnect in handlers:
+                            if on_reconnect:
+                                on_reconnect()
+                    reconnected = False
+
+                # Short timeout so channels subscribed later are picked up promptly
+                if select.select([conn], [], [], 5) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notification = conn.notifies.pop(0)
+                    _dispatch(notification.channel, notification.payload)
+        except Exception as e:
+            logger.warning(f"Notification listener disconnected, retrying in 5s: {str(e)}")
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            time.sleep(5)
@@ -0,0 +1,370 @@
+"""
+Per-request database query counting and timing, with Prometheus metrics.
+
+Cursors of pooled connections (``common.db``) are instrumented. Each
+statement they execute is counted and timed against the request that is
+running, and a request that executes the same statement template
+``QUERY_REPEAT_THRESHOLD`` times or more is reported as a likely N+1: a
+warning is logged with the statement and a counter is bumped. Statements run
+outside a request, by background threads or at startup, are counted under the
+``background`` endpoint.
+
+``init_app(app, service)`` wires a Flask app up:
+
+- every response gets a ``Server-Timing`` header with the request's query
+  count and database time, plus the total time spent in the app
+- ``/metrics`` serves process-wide counters and histograms in the Prometheus
+  text format, together with the connection pool and log shipper stats and
+  whatever the service adds through ``register_collector()``
+
+The request's stats live in a context variable. Work handed to other
+threads is attributed to the request only when it runs in a copy of the
+request's context (``contextvars.copy_context().run``). Queries made while a
+streamed response body is generated happen after the headers are sent and
+only reach the metrics.
+
+Configuration (environment variables):
+    QUERY_REPEAT_THRESHOLD  executions of one statement in a request reported as a likely N+1
+"""
+
+import os
+import time
+import logging
+import threading
+import contextvars
+from collections import Counter, defaultdict
+
+from psycopg2 import sql, extensions
+
+logger = logging.getLogger("common.query_stats")
+
+REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", "5"))
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+BACKGROUND = "background"
+
+
+class RequestQueryStats:
+    """Statements executed for one request, with their total time."""
+
+    def __init__(self, request_id=None):
+        self.request_id = request_id
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = Counter()
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, statement, elapsed):
+        with self._lock:
+            self.queries += 1
+            self.db_time += elapsed
+            self.statements[statement] += 1
+
+    def repeats(self, threshold=REPEAT_THRESHOLD):
+        """(statement, executions) of every statement run at least ``threshold`` times, most repeated first."""
+        with self._lock:
+            return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+
+
+_current = contextvars.ContextVar("query_stats", default=None)
+
+
+def begin(request_id=None):
+    """
+    Start counting for a request in the current context.
+
+    Args:
+        request_id (str, optional): Id to report the request under
+
+    Returns:
+        contextvars.Token: Pass to ``end()`` when the request finishes
+    """
+    return _current.set(RequestQueryStats(request_id))
+
+
+def end(token):
+    """Stop counting for the request started by ``begin()``."""
+    _current.reset(token)
+
+
+def current():
+    """Stats of the request running in this context, or None."""
+    return _current.get()
+
+
+def _statement_key(cursor, query):
+    # The statement template, so the same query with other parameters counts as a repeat
+    if isinstance(query, sql.Composable):
+        return query.as_string(cursor)
+    if isinstance(query, bytes):
+        return query.decode("utf-8", "replace")
+    return str(query)
+
+
+def _record(cursor, query, elapsed):
+    stats = _current.get()
+    if stats is None:
+        metrics.record_background(elapsed)
+        return
+    try:
+        statement = _statement_key(cursor, query)
+    except Exception:
+        statement = repr(query)
+    stats.record(statement, elapsed)
+
+
+_instrumented = {}
+_instrumented_lock = threading.Lock()
+
+
+def instrumented(cursor_class):
+    """
+    A subclass of a psycopg2 cursor class whose ``execute`` and ``executemany`` are counted and timed.
+
+    Args:
+        cursor_class (type): psycopg2 cursor class, e.g. ``RealDictCursor``
+
+    Returns:
+        type: Instrumented subclass, created once per class
+    """
+    subclass = _instrumented.get(cursor_class)
+    if subclass is not None:
+        return subclass
+    with _instrumented_lock:
+        if cursor_class not in _instrumented:
+            def execute(self, query, vars=None):
+                start = time.perf_counter()
+                try:
+                    return cursor_class.execute(self, query, vars)
+                finally:
+                    _record(self, query, time.perf_counter() - start)
+
+            def executemany(self, query, vars_list):
+                start = time.perf_counter()
+                try:
+                    return cursor_class.executemany(self, query, vars_list)
+                finally:
+                    _record(self, query, time.perf_counter() - start)
+
+            _instrumented[cursor_class] = type(f"Instrumented{cursor_class.__name__}", (cursor_class,),
+                                               {"execute": execute, "executemany": executemany})
+        return _instrumented[cursor_class]
+
+
+def instrument_cursor_factory(raw, kwargs):
+    """Put the instrumented version of the requested (or the connection's default) cursor class into ``kwargs``."""
+    factory = kwargs.get("cursor_factory") or raw.cursor_factory or extensions.cursor
+    kwargs["cursor_factory"] = instrumented(factory)
+    return kwargs
+
+
+class Metrics:
+    """Process-wide counters and histograms, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.service = None
+        self._lock = threading.Lock()
+        self._requests = Counter()  # (method, endpoint, status) -> requests
+        self._durations = defaultdict(lambda: _Histogram(DURATION_BUCKETS))  # endpoint -> request seconds
+        self._query_counts = defaultdict(lambda: _Histogram(QUERY_COUNT_BUCKETS))  # endpoint -> queries per request
+        self._queries = Counter()  # endpoint -> statements
+        self._db_time = defaultdict(float)  # endpoint -> seconds in statements
+        self._repeats = Counter()  # endpoint -> requests flagged as N+1
+        self._collectors = []
+
+    def record_request(self, method, endpoint, status, duration, stats):
+        with self._lock:
+            self._requests[(method, endpoint, status)] += 1
+            self._durations[endpoint].observe(duration)
+            self._query_counts[endpoint].observe(stats.queries)
+            self._queries[endpoint] += stats.queries
+            self._db_time[endpoint] += stats.db_time
+            if stats.repeats():
+                self._repeats[endpoint] += 1
+
+    def record_background(self, elapsed):
+        with self._lock:
+            self._queries[BACKGROUND] += 1
+            self._db_time[BACKGROUND] += elapsed
+
+    def register_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        """
+        Everything in the Prometheus text exposition format.
+
+        Returns:
+            str: Metric families, each with HELP and TYPE lines
+        """
+        service = {"service": self.service or "unknown"}
+        families = []
+        with self._lock:
+            families.append(("gitfit_http_requests_total", "counter", "HTTP requests handled",
+                             [({**service, "method": m, "endpoint": e, "status": s}, v) for (m, e, s), v in self._requests.items()]))
+            families.append(_histogram_family("gitfit_http_request_duration_seconds", "Time spent handling requests",
+                                              service, self._durations))
+            families.append(_histogram_family("gitfit_db_queries_per_request", "Statements executed per request",
+                                              service, self._query_counts))
+            families.append(("gitfit_db_queries_total", "counter", "Statements executed",
+                             [({**service, "endpoint": e}, v) for e, v in self._queries.items()]))
+            families.append(("gitfit_db_query_seconds_total", "counter", "Time spent executing statements",
+                             [({**service, "endpoint": e}, v) for e, v in self._db_time.items()]))
+            families.append(("gitfit_db_repeated_statement_requests_total", "counter",
+                             f"Requests that executed one statement {REPEAT_THRESHOLD} times or more (likely N+1)",
+                             [({**service, "endpoint": e}, v) for e, v in self._repeats.items()]))
+            collectors = list(self._collectors)
+
+        for collector in [_pool_collector, _log_shipper_collector] + collectors:
+            try:
+                families.extend((name, kind, text, [({**service, **labels}, value) for labels, value in samples])
+                                for name, kind, text, samples in collector())
+            except Exception as e:
+                logger.warning(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {str(e)}")
+
+        lines = []
+        for name, kind, text, samples in families:
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{_sample_name(name, labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _histogram_family(name, text, service, histograms):
+    samples = []
+    for endpoint, histogram in histograms.items():
+        labels = {**service, "endpoint": endpoint}
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            samples.append(({**labels, "__suffix": "_bucket", "le": _format_value(bound)}, count))
+        samples.append(({**labels, "__suffix": "_bucket", "le": "+Inf"}, histogram.count))
+        samples.append(({**labels, "__suffix": "_sum"}, histogram.sum))
+        samples.append(({**labels, "__suffix": "_count"}, histogram.count))
+    return name, "histogram", text, samples
+
+
+def _sample_name(name, labels):
+    labels = dict(labels)
+    name += labels.pop("__suffix", "")
+    if not labels:
+        return name
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for value in labels.values())
+    return name + "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def _pool_collector():
+    from common import db
+    stats = db.pool_stats()
+    return [
+        ("gitfit_db_pool_connections", "gauge", "Open pooled connections by state",
+         [({"state": "in_use"}, stats["in_use"]), ({"state": "idle"}, stats["idle"])]),
+        ("gitfit_db_pool_max_size", "gauge", "Most connections the pool opens", [({}, stats["max_size"])]),
+        ("gitfit_db_pool_acquires_total", "counter", "Connections checked out", [({}, stats["acquires"])]),
+        ("gitfit_db_pool_acquire_timeouts_total", "counter", "Checkouts that timed out", [({}, stats["acquire_timeouts"])]),
+        ("gitfit_db_pool_acquire_wait_max_seconds", "gauge", "Longest wait for a connection",
+         [({}, stats["acquire_wait_max_ms"] / 1000)]),
+        ("gitfit_db_pool_connections_created_total", "counter", "Connections opened", [({}, stats["connections_created"])]),
+    ]
+
+
+def _log_shipper_collector():
+    from common import log_shipper
+    samples = [({"table": table, "state": state}, shipper_stats[state])
+               for table, shipper_stats in log_shipper.stats().items()
+               for state in ("written", "dropped", "failed")]
+    pending = [({"table": table}, shipper_stats["pending"]) for table, shipper_stats in log_shipper.stats().items()]
+    return [
+        ("gitfit_log_shipper_rows_total", "counter", "Audit rows by outcome", samples),
+        ("gitfit_log_shipper_pending_rows", "gauge", "Audit rows waiting to be written", pending),
+    ]
+
+
+metrics = Metrics()
+
+
+def register_collector(collector):
+    """
+    Add service-specific metrics to ``/metrics``.
+
+    Args:
+        collector (callable): Returns a list of (name, type, help, [(labels, value)]) metric families
+    """
+    metrics.register_collector(collector)
+
+
+def server_timing(stats, total):
+    """``Server-Timing`` header value for a request's stats and total seconds."""
+    return f'db;dur={stats.db_time * 1000:.2f};desc="{stats.queries} queries", app;dur={total * 1000:.2f}'
+
+
+def init_app(app, service):
+    """
+    Count queries per request, add ``Server-Timing`` headers and serve ``/metrics`` on a Flask app.
+
+    Args:
+        app (flask.Flask): The service's app
+        service (str): Service name put on every metric
+    """
+    from flask import request, g, Response
+
+    metrics.service = service
+
+    @app.before_request
+    def _begin_query_stats():
+        g.query_stats_token = begin()
+
+    @app.after_request
+    def _finish_query_stats(response):
+        stats = current()
+        if stats is None:
+            return response
+        stats.request_id = getattr(request, "request_id", None)
+        total = time.perf_counter() - stats.started
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        metrics.record_request(request.method, endpoint, str(response.status_code), total, stats)
+        response.headers["Server-Timing"] = server_timing(stats, total)
+        for statement, count in stats.repeats():
+            logger.warning("Request %s: %s %s executed the same statement %s times (likely N+1): %s",
+                           stats.request_id, request.method, endpoint, count, " ".join(statement.split())[:200])
+        return response
+
+    @app.teardown_request
+    def _end_query_stats(exc):
+        token = g.pop("query_stats_token", None)
+        if token is not None:
+            try:
+                end(token)
+            except ValueError:
+                # Torn down in another context than the one begin() ran in; nothing to reset here
+                pass
+
+    def metrics_view():
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    app.add_url_rule("/metrics", "metrics", metrics_view, methods=["GET"])
@@ -20,17 +20,14 @@ import os
 import global_func
 from familyErrors import *
 from familyClass import Family
+from common import log_setup, query_stats
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG,
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                    handlers=[
-                        logging.FileHandler("family_api.log"),
-                        logging.StreamHandler()
-                    ])
+log_setup.configure("family", "family_api.log", logging.INFO)
 logger = logging.getLogger("Family")
 
 app = Flask(__name__)
+query_stats.init_app(app, "family")
 
 # Request logger middleware
 @app.before_request
@@ -39,7 +36,12 @@ def before_request():
     request.request_id = str(uuid.uuid4())
     request.start_time = time.time()
     logger.info(f"Request {request.request_id}: {request.method} {request.path} - Started")
-    logger.debug(f"Request {request.request_id}: Headers: {dict(request.headers)}")
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    safe_headers = dict(request.headers)
+    if "Authorization" in safe_headers:
+        safe_headers["Authorization"] = "***REDACTED***"
+    logger.debug("Request %s: Headers: %s", request.request_id, safe_headers)
     
     if request.is_json:
         # Log JSON payloads
@@ -47,10 +49,10 @@ def before_request():
         if isinstance(safe_data, dict):
             # Redact sensitive fields if needed
             safe_copy = safe_data.copy()
-            logger.debug(f"Request {request.request_id}: JSON payload: {safe_copy}")
+            logger.debug("Request %s: JSON payload: %s", request.request_id, safe_copy)
     elif request.args:
         # Log query parameters
-        logger.debug(f"Request {request.request_id}: Query parameters: {request.args}")
+        logger.debug("Request %s: Query parameters: %s", request.request_id, request.args)
 
 @app.after_request
 def after_request(response):
@@ -12,24 +12,18 @@ import logging
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import traceback
+import sys
 
-# Configure logging
+# Shared database helpers live in Microservices/common
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import db, auth_cache, log_shipper
+
+# Logging handlers are set up by the service (common.log_setup)
 logger = logging.getLogger("GlobalFunctions")
-logging.basicConfig(level=logging.DEBUG,
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                    handlers=[
-                        logging.FileHandler("global_functions.log"),
-                        logging.StreamHandler()
-                    ])
 
-# Database configuration
-DB_CONFIG = {
-    "host": "postgres",
-    "database": "gitfitbro",
-    "user": 'postgres',
-    "password": 'password',
-    "port": '5432'
-}
+# Database configuration (connection settings live in the shared pool)
+DATABASE_URL = db.DATABASE_URL
+API_LOG_COLUMNS = ("user_id", "service", "endpoint", "request_id", "timestamp", "status_code")
 
 # JWT configuration
 JWT_SECRET = os.getenv("JWT_SECRET", "your_super_secret_key")
@@ -38,23 +32,19 @@ JWT_EXPIRATION = 24 * 60 * 60  # 24 hours in seconds
 
 def getConnection():
     """
-    Get a connection to the database.
+    Get a connection from the shared database pool.
+    
+    Calling ``close()`` on the returned connection hands it back to the pool.
     
     Returns:
-        psycopg2.connection: Database connection
+        PooledConnection: Database connection
         
     Raises:
-        ConnectionError: If connection to database fails
+        ConnectionError: If connection to database fails or the pool is exhausted
     """
     try:
-        logger.debug("Connecting to database")
-        conn = psycopg2.connect(
-            host=DB_CONFIG["host"],
-            database=DB_CONFIG["database"],
-            user=DB_CONFIG["user"],
-            password=DB_CONFIG["password"],
-            port=DB_CONFIG["port"]
-        )
+        logger.debug("Acquiring pooled database connection")
+        conn = db.get_connection()
         logger.debug("Database connection successful")
         return conn
     except psycopg2.Error as e:
@@ -65,12 +55,19 @@ def verify_key(api_key):
     """
     Verify if an API key is valid and return associated user ID.
     
+    Lookups are served from the shared API key cache when possible.
+    
     Args:
         api_key (str): The API key to verify
         
     Returns:
         int: User ID associated with the key, or None if invalid
     """
+    cached = auth_cache.get(api_key)
+    if cached is not auth_cache.MISSING:
+        logger.debug("API key cache hit")
+        return cached
+    
     try:
         logger.debug("Verifying API key")
         conn = getConnection()
@@ -83,6 +80,7 @@ def verify_key(api_key):
         )
         
         result = cur.fetchone()
+        auth_cache.put(api_key, result[0] if result else None)
         
         if result:
             user_id = result[0]
@@ -304,6 +302,9 @@ def revoke_api_key(api_key):
         )
         
         revoked = cur.rowcount > 0
+        
+        # Make every service forget the key once the revocation commits
+        auth_cache.invalidate(key=api_key, cur=cur)
         conn.commit()
         
         if revoked:
@@ -328,6 +329,9 @@ def log_api_call(user_id, service, endpoint, request_id=None, status_code=200):
     """
     Log an API call to the database for monitoring and analytics.
     
+    The row is queued and written in a batch by a background thread, so
+    the request does not wait for the database.
+    
     Args:
         user_id (int): User ID making the call
         service (str): Service name (e.g., 'auth', 'user', 'workout')
@@ -336,34 +340,11 @@ def log_api_call(user_id, service, endpoint, request_id=None, status_code=200):
         status_code (int, optional): HTTP status code of the response
         
     Returns:
-        bool: True if log was created, False otherwise
+        bool: True if the call was queued, False if the log queue was full
     """
-    try:
-        logger.debug(f"Logging API call for user {user_id} to {service}/{endpoint}")
-        conn = getConnection()
-        cur = conn.cursor()
-        
-        cur.execute(
-            """INSERT INTO api_logs 
-               (user_id, service, endpoint, request_id, timestamp, status_code) 
-               VALUES (%s, %s, %s, %s, %s, %s)""",
-            (user_id, service, endpoint, request_id, datetime.datetime.now(), status_code)
-        )
-        
-        conn.commit()
-        logger.debug("API call logged successfully")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error logging API call: {str(e)}")
-        if 'conn' in locals() and conn:
-            conn.rollback()
-        return False
-    finally:
-        if 'cur' in locals() and cur:
-            cur.close()
-        if 'conn' in locals() and conn:
-            conn.close()
+    logger.debug(f"Logging API call for user {user_id} to {service}/{endpoint}")
+    shipper = log_shipper.get_shipper("api_logs", API_LOG_COLUMNS)
+    return shipper.submit((user_id, service, endpoint, request_id, datetime.datetime.now(), status_code))
 
 def sanitize_input(input_str):
     """
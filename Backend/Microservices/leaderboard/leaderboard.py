@@ -12,17 +12,14 @@ import json
 import base64
 import leaderboardClass as lbc
 from leaderboardErrors import *
+from common import log_setup, query_stats
 
 # Configure logging
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                    handlers=[
-                        logging.FileHandler("leaderboard_api.log"),
-                        logging.StreamHandler()
-                    ])
+log_setup.configure("leaderboard", "leaderboard_api.log", logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+query_stats.init_app(app, "leaderboard")
 
 # Request logger middleware
 @app.before_request
@@ -31,8 +28,9 @@ def before_request():
     request.request_id = str(uuid.uuid4())
     request.start_time = time.time()
     logger.info(f"Request {request.request_id}: {request.method} {request.path} - Started")
-    logger.debug(f"Request {request.request_id}: Headers: {dict(request.headers)}")
-    logger.debug(f"Request {request.request_id}: Query Parameters: {dict(request.args)}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Request %s: Headers: %s", request.request_id, dict(request.headers))
+        logger.debug("Request %s: Query Parameters: %s", request.request_id, dict(request.args))
 
 @app.after_request
 def after_request(response):
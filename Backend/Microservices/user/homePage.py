@@ -0,0 +1,139 @@
+"""
+Home page assembly for the user service.
+
+The home page has three independent sections: the user's most recent
+workout, their leaderboard rank and their families' latest workouts. They
+used to be fetched one after another on one connection. Now the two
+database sections run concurrently, each on its own pooled connection,
+while the rank is read from the in-memory leaderboards, so a page takes as
+long as its slowest section instead of their sum. Sections run in a copy of
+the request's context, so ``common.query_stats`` still counts their queries
+against the request.
+
+Assembled pages are cached per user for HOMEPAGE_CACHE_TTL seconds. A
+user's pages are dropped as soon as they log steps or a workout: the step
+writers call ``invalidate()`` after committing, and workouts logged through
+the workout service arrive as leaderboard change notifications. Workouts of
+family members and other users' ranks show up once the page expires.
+
+Configuration (environment variables):
+    HOMEPAGE_CACHE_TTL        seconds an assembled page is reused (0 disables the cache)
+    HOMEPAGE_CACHE_MAX_USERS  pages kept in the cache (least recently used are dropped)
+    HOMEPAGE_WORKERS          threads fetching home page sections
+"""
+
+import os
+import time
+import logging
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from common import leaderboard_store, notify
+
+logger = logging.getLogger(__name__)
+
+HOMEPAGE_CACHE_TTL = float(os.getenv("HOMEPAGE_CACHE_TTL", "30"))
+HOMEPAGE_CACHE_MAX_USERS = int(os.getenv("HOMEPAGE_CACHE_MAX_USERS", "1000"))
+HOMEPAGE_WORKERS = int(os.getenv("HOMEPAGE_WORKERS", "4"))
+
+# Leaderboard categories whose changes mean the user logged steps or a workout
+INVALIDATING_CATEGORIES = {"steps", "workouts"}
+
+_executor = ThreadPoolExecutor(max_workers=HOMEPAGE_WORKERS, thread_name_prefix="homepage")
+
+_cache = OrderedDict()  # (user_id, leaderboard type) -> (expires at, page)
+_cache_lock = threading.Lock()
+_invalidations = 0  # bumped by invalidate() so a page built while a write lands is not cached
+_subscribed = False
+
+
+def submit(fn, *args, **kwargs):
+    """
+    Run a home page section on the section threads.
+
+    :param fn: The section to run
+    :param args: Positional arguments for the section
+    :param kwargs: Keyword arguments for the section
+
+    :type fn: callable
+
+    :return: The section's eventual result
+    :rtype: concurrent.futures.Future
+    """
+    context = contextvars.copy_context()
+    return _executor.submit(context.run, fn, *args, **kwargs)
+
+
+def load(user_id, leaderboard_type, build):
+    """
+    Return a user's home page, from the cache while it is fresh.
+
+    :param user_id: The user the page is for
+    :param leaderboard_type: The leaderboard shown on the page
+    :param build: Assembles the page on a cache miss
+
+    :type user_id: int
+    :type leaderboard_type: str
+    :type build: callable
+
+    :return: The page built by ``build``
+    :rtype: tuple
+    """
+    _subscribe()
+    key = (user_id, leaderboard_type)
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            _cache.move_to_end(key)
+            logger.debug(f"Home page for user ID {user_id} served from cache")
+            return entry[1]
+        invalidations = _invalidations
+
+    page = build()
+
+    if HOMEPAGE_CACHE_TTL > 0 and HOMEPAGE_CACHE_MAX_USERS > 0:
+        with _cache_lock:
+            if invalidations != _invalidations:
+                return page
+            _cache[key] = (time.monotonic() + HOMEPAGE_CACHE_TTL, page)
+            _cache.move_to_end(key)
+            while len(_cache) > HOMEPAGE_CACHE_MAX_USERS:
+                _cache.popitem(last=False)
+    return page
+
+
+def invalidate(user_id=None):
+    """Forget a user's cached home pages after they log steps or a workout; everyone's when None."""
+    global _invalidations
+    with _cache_lock:
+        _invalidations += 1
+        if user_id is None:
+            _cache.clear()
+        else:
+            for key in [key for key in _cache if key[0] == user_id]:
+                del _cache[key]
+
+
+def _subscribe():
+    global _subscribed
+    with _cache_lock:
+        if _subscribed:
+            return
+        _subscribed = True
+    notify.subscribe(leaderboard_store.NOTIFY_CHANNEL, _apply_notification, on_reconnect=invalidate)
+
+
+def _apply_notification(payload):
+    target, _, categories = payload.partition(":")
+    categories = set(filter(None, categories.split(",")))
+    if categories and not categories & INVALIDATING_CATEGORIES:
+        return
+    if target == "*":
+        invalidate()
+        return
+    try:
+        invalidate(int(target))
+    except ValueError:
+        logger.warning(f"Ignoring malformed leaderboard notification: {payload}")
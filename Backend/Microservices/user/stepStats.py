@@ -0,0 +1,172 @@
+"""
+Step dashboard computation for the user service.
+
+The dashboard used to take six queries per call, with EXTRACT(MONTH ...)
+predicates that could not use the (user_id, date_performed) primary key.
+Now one query reads the user's step history through that key together with
+their latest step goal, and every statistic is derived in a single pass
+over the rows.
+
+Histories are kept in a small per-user cache for the rest of the day, so
+repeated dashboard loads do not touch the database. Writers call
+``invalidate()`` after committing new steps or step goals. Set
+STEP_CACHE_MAX_USERS to 0 to disable the cache.
+"""
+
+import os
+import logging
+import datetime
+import threading
+from collections import OrderedDict
+
+from psycopg2 import sql
+
+logger = logging.getLogger(__name__)
+
+STEP_CACHE_MAX_USERS = int(os.getenv("STEP_CACHE_MAX_USERS", "1000"))
+
+# One row per step entry, or a single row of NULLs with the goal when the user has none
+historyQuery = sql.SQL("""
+    SELECT us.date_performed, us.steps, goal.target_steps
+    FROM (SELECT %s::int AS user_id) me
+    LEFT JOIN LATERAL (
+        SELECT target_steps
+        FROM step_goals
+        WHERE user_id = me.user_id
+        ORDER BY created_at DESC
+        LIMIT 1
+    ) goal ON TRUE
+    LEFT JOIN user_steps us ON us.user_id = me.user_id
+    ORDER BY us.date_performed
+""")
+
+
+class StepHistory:
+    """A user's step entries in date order and their current step goal."""
+
+    def __init__(self, days, goal):
+        self.days = tuple(days)
+        self.goal = goal
+        self.loaded_on = datetime.date.today()
+
+
+_cache = OrderedDict()  # user_id -> StepHistory
+_cache_lock = threading.Lock()
+_invalidations = 0  # bumped by invalidate() so a load racing a write is not cached
+
+
+def load_history(cur, user_id):
+    """
+    Return a user's step history, from the cache when it was loaded today.
+
+    :param cur: Cursor to query with on a cache miss
+    :param user_id: The user to load
+
+    :type cur: psycopg2.cursor
+    :type user_id: int
+
+    :return: The user's step history
+    :rtype: StepHistory
+    """
+    today = datetime.date.today()
+    with _cache_lock:
+        history = _cache.get(user_id)
+        if history is not None and history.loaded_on == today:
+            _cache.move_to_end(user_id)
+            logger.debug(f"Step history for user ID {user_id} served from cache")
+            return history
+        invalidations = _invalidations
+
+    cur.execute(historyQuery, (user_id,))
+    rows = cur.fetchall()
+    goal = rows[0][2] if rows else None
+    history = StepHistory(((row[0], row[1]) for row in rows if row[0] is not None), goal)
+
+    if STEP_CACHE_MAX_USERS > 0:
+        with _cache_lock:
+            if invalidations != _invalidations:
+                return history
+            _cache[user_id] = history
+            _cache.move_to_end(user_id)
+            while len(_cache) > STEP_CACHE_MAX_USERS:
+                _cache.popitem(last=False)
+    return history
+
+
+def invalidate(user_id):
+    """Forget a user's cached step history after their steps or step goal change."""
+    global _invalidations
+    with _cache_lock:
+        _invalidations += 1
+        _cache.pop(user_id, None)
+
+
+def summarize(history, month, year, today=None):
+    """
+    Derive the dashboard statistics and one month's entries in a single pass.
+
+    Weeks start on Saturday, and the streak counts consecutive days with steps
+    ending today, as before.
+
+    :param history: The user's step history
+    :param month: The month to list entries for
+    :param year: The year of that month
+    :param today: The reference date, defaults to today
+
+    :type history: StepHistory
+    :type month: int
+    :type year: int
+    :type today: datetime.date
+
+    :return: The statistics and the month's (date, steps) entries in date order
+    :rtype: tuple
+    """
+    today = today or datetime.date.today()
+    one_day = datetime.timedelta(days=1)
+    # isoweekday() % 7 is PostgreSQL's DOW (Sunday = 0)
+    week_start = today - datetime.timedelta(days=(today.isoweekday() % 7 + 1) % 7)
+    month_start = today.replace(day=1)
+    listed_start = datetime.date(year, month, 1)
+    listed_end = datetime.date(year + 1, 1, 1) if month == 12 else datetime.date(year, month + 1, 1)
+
+    total = 0
+    count = 0
+    weekly = 0
+    monthly = 0
+    streak = 0
+    streak_day = today
+    month_days = []
+
+    # Newest first, so the streak can be counted back from today in the same pass
+    for date_performed, steps in reversed(history.days):
+        if steps is None:
+            # steps is nullable; like SUM/AVG, leave the row out of the totals and the
+            # listed entries, and it ends the streak
+            if streak_day is not None and date_performed <= today:
+                streak_day = None
+            continue
+        if listed_start <= date_performed < listed_end:
+            month_days.append((date_performed, steps))
+        total += steps
+        count += 1
+        if date_performed > today:
+            continue
+        if date_performed >= week_start:
+            weekly += steps
+        if date_performed >= month_start:
+            monthly += steps
+        if streak_day is not None:
+            if date_performed == streak_day and steps > 0:
+                streak += 1
+                streak_day -= one_day
+            else:
+                streak_day = None
+
+    month_days.reverse()
+    statistics = {
+        "weekly_steps": weekly,
+        "monthly_steps": monthly,
+        "current_streak": streak,
+        "average_steps": round(total / count, 2) if count else 0
+    }
+    return statistics, month_days
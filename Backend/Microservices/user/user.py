@@ -14,6 +14,7 @@ import userClass
 import jwt
 import global_func
 from userErrors import *
+from common import leaderboard_store, log_setup, query_stats
 import psycopg2
 import traceback
 import logging
@@ -23,16 +24,11 @@ import base64
 import datetime
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG,
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                    handlers=[
-                        logging.FileHandler("user_api.log"),
-                        logging.StreamHandler()
-                    ])
-logger = logging.getLogger("User")
+log_setup.configure("user", "user_api.log", logging.INFO)
 logger = logging.getLogger("User")
 
 app = Flask(__name__)
+query_stats.init_app(app, "user")
 
 # Request logger middleware
 @app.before_request
@@ -41,7 +37,9 @@ def before_request():
     request.request_id = str(uuid.uuid4())
     request.start_time = time.time()
     logger.info(f"Request {request.request_id}: {request.method} {request.path} - Started")
-    logger.debug(f"Request {request.request_id}: Headers: {dict(request.headers)}")
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    logger.debug("Request %s: Headers: %s", request.request_id, dict(request.headers))
     
     if request.is_json:
         # Log JSON payloads without sensitive data
@@ -52,16 +50,16 @@ def before_request():
             for field in ['password_hash', 'password']:
                 if field in safe_copy:
                     safe_copy[field] = "***REDACTED***"
-            logger.debug(f"Request {request.request_id}: JSON payload: {safe_copy}")
+            logger.debug("Request %s: JSON payload: %s", request.request_id, safe_copy)
         else:
             # If safe_data is not a dict, just log it as is
-            logger.debug(f"Request {request.request_id}: JSON payload: {safe_data}")
+            logger.debug("Request %s: JSON payload: %s", request.request_id, safe_data)
     elif request.args:
         # Log query parameters without sensitive data
         safe_args = request.args.copy()
         if "key" in safe_args:
             safe_args["key"] = "***REDACTED***"
-        logger.debug(f"Request {request.request_id}: Query parameters: {safe_args}")
+        logger.debug("Request %s: Query parameters: %s", request.request_id, safe_args)
 
 @app.after_request
 def after_request(response):
@@ -775,6 +773,54 @@ def step_data():
         logger.error(f"Request {request_id}: {traceback.format_exc()}")
         raise UserServiceError(f"An unexpected error occurred while adding step data")
     
+@app.route('/add_step_data_bulk', methods=['POST'])
+def step_data_bulk():
+    """
+    Add or update many days of step data for the authenticated user in one request.
+    
+    Expects an "entries" list of {"date": "YYYY-MM-DD", "steps": int} objects; a missing
+    date means today. Entries are validated like /add_step_data and stored together.
+    
+    Returns:
+        flask.Response: JSON response with an outcome per entry
+    """
+    request_id = getattr(request, 'request_id', 'unknown')
+    
+    try:
+        logger.info(f"Request {request_id}: Processing add_step_data_bulk request")
+        data, key = get_data_jwt(request)
+        
+        if not data or 'entries' not in data:
+            logger.warning(f"Request {request_id}: Missing required entries field")
+            raise MissingRequiredFieldError('entries')
+        
+        user = userClass.UserStats(id=key)
+        
+        if user.id is None or user.id == -1:
+            logger.warning(f"Request {request_id}: User not found for step data addition")
+            raise UserNotFoundException()
+        
+        results = user.insertStepsBulk(data['entries'])
+        
+        counts = {status: sum(1 for result in results if result['status'] == status)
+                  for status in ('inserted', 'updated', 'rejected')}
+        logger.info(f"Request {request_id}: Bulk step data for user ID {user.id}: {counts}")
+        return jsonify({
+            "message": "Step data processed",
+            **counts,
+            "results": results
+        }), 201 if counts['inserted'] or counts['updated'] else 200
+        
+    except (UserNotFoundException, InvalidStatsDataError, MissingRequiredFieldError, 
+           ConnectionError, QueryError, AuthenticationError) as e:
+        # These are already logged by the exception class itself
+        logger.debug(f"Request {request_id}: Re-raising specific exception: {e.__class__.__name__}")
+        raise
+    except Exception as e:
+        logger.error(f"Request {request_id}: Unexpected error in add_step_data_bulk: {str(e)}")
+        logger.error(f"Request {request_id}: {traceback.format_exc()}")
+        raise UserServiceError(f"An unexpected error occurred while adding step data")
+    
 @app.route('/get_step_data', methods=['GET'])
 def get_step_data():
     """
@@ -957,4 +1003,7 @@ def homepage():
         
 if __name__ == '__main__':
     logger.info("Starting user microservice on port 8080")
+    # Build the home page leaderboards up front instead of on the first request
+    leaderboard_store.warm([('steps', None, None)] +
+                           [('1rm', exercise_id, None) for exercise_id in userClass.UserStats.LEADERBOARD_EXERCISES.values()])
     app.run(host='0.0.0.0', port=8080, debug=True)
\ No newline at end of file
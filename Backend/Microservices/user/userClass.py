@@ -1,22 +1,28 @@
 import psycopg2
 from psycopg2 import sql
+from psycopg2.extras import execute_values
 import psycopg2.errors
 import global_func
 import random
 import string
 import logging
 import traceback
-import threading
-import queue
 import datetime
 import datetime
+import stepStats
 # Import your existing error classes
 from userErrors import *
+# Shared package is importable once global_func has set up the path
+from common import exercise_catalogue, leaderboard_store, notify
+import homePage
 
 # Get logger
 logger = logging.getLogger("UserClass")
 logger = logging.getLogger("UserClass")
 
+# Most days of steps accepted by one bulk request
+MAX_STEP_BATCH = 366
+
 class User():
     """
     A object about the user and their information. Allows for input and output of user information
@@ -424,12 +430,14 @@ class User():
         logger.debug("Generating new user key")
         KEYSET = string.ascii_letters + string.digits + "!#$%&()*+,-./:;<=>?@[\\]^_`{|}~"
         key = ''.join(random.choices(KEYSET, k=64))
+        should_close_conn = False
         
         try:
             if not conn:
                 try:
                     logger.debug("Establishing database connection")
                     conn = global_func.getConnection()
+                    should_close_conn = True
                 except Exception as e:
                     logger.error(f"Failed to connect to database: {str(e)}")
                     raise ConnectionError(str(e))
@@ -452,6 +460,12 @@ class User():
                 result = cur.fetchone()
             
             logger.debug(f"Generated unique key: {key[:5]}...")
+            
+            # The new key may be cached as invalid, and an existing user's old key is about to be replaced
+            user_id = self.id if self.id not in (None, -1) else None
+            global_func.invalidate_key(key=key, user_id=user_id, cur=cur)
+            if should_close_conn:
+                conn.commit()
             return key
         except ConnectionError:
             logger.debug("Re-raising ConnectionError")
@@ -460,6 +474,11 @@ class User():
             logger.error(f"Error generating key: {str(e)}")
             logger.debug(traceback.format_exc())
             raise QueryError(f"Error generating key: {str(e)}")
+        finally:
+            if 'cur' in locals() and cur:
+                cur.close()
+            if should_close_conn and conn:
+                conn.close()
     
     def updateUser(self, conn = None):
         """
@@ -581,7 +600,10 @@ class User():
             if cur.rowcount == 0:
                 logger.warning(f"No user found with ID {self.id}")
                 raise UserNotFoundException()
-                
+            
+            # Stop every service from accepting the deleted user's key
+            global_func.invalidate_key(key=self.key, user_id=self.id, cur=cur)
+            leaderboard_store.publish_change(cur, self.id)
             conn.commit()
             logger.info(f"Successfully deleted user with ID {self.id}")
             
@@ -690,6 +712,9 @@ class UserStats(User):
     :type height: int
     :type weight: float
     """
+    # Exercises with a 1RM leaderboard on the home page
+    LEADERBOARD_EXERCISES = {'deadlift': 523, 'squat': 716, 'bench': 273}
+    
     def __init__(self, id = None, email = None, fname=None, lname=None, pass_hash=None, dob=None, sex=None, BFL=None, key=None, height = None, weight = None, username = None):
         logger.debug(f"Creating UserStats object: username={username}, email={email}, height={height}, weight={weight}")
         super().__init__(id = id, fname=fname, lname=lname, pass_hash=pass_hash, dob=dob, sex=sex, BFL=BFL, key=key, email=email, username=username)
@@ -725,7 +750,7 @@ class UserStats(User):
             cur.execute(findStatsQuery, (self.id,))
             result = cur.fetchone()
             
-            logger.debug(f"Query result: {result}")
+            logger.debug("Query result: %s", result)
             
             if result:
                 if self.height is None:
@@ -778,6 +803,7 @@ class UserStats(User):
             cur = conn.cursor()
             logger.debug(f"Executing query to insert stats for user ID {self.id}")
             cur.execute(insertStatsQuery, (self.id, self.height, self.weight))
+            notify.publish(cur, notify.WEIGHT_CHANNEL, str(self.id))
             conn.commit()
             logger.info(f"Successfully inserted stats for user ID {self.id}")
             
@@ -992,29 +1018,33 @@ class UserStats(User):
         else:
             logger.debug("Fetching all activities")
             getUserActivitiesQuery = sql.SQL("""SELECT id, name, workout_type, TO_CHAR(workout_date, 'YYYY-MM-DD') FROM workouts WHERE user_id = %s ORDER BY workout_date DESC LIMIT %s""")
-        if days >= 1:
-            logger.debug(f"Fetching activities for the last {days} days")
-            getUserActivitiesQuery = sql.SQL("""SELECT id, name, workout_type, TO_CHAR(workout_date, 'YYYY-MM-DD') FROM workouts WHERE user_id = %s AND workout_date >= CURRENT_DATE - interval '%s day' ORDER BY workout_date DESC LIMIT %s""")
-        else:
-            logger.debug("Fetching all activities")
-            getUserActivitiesQuery = sql.SQL("""SELECT id, name, workout_type, TO_CHAR(workout_date, 'YYYY-MM-DD') FROM workouts WHERE user_id = %s ORDER BY workout_date DESC LIMIT %s""")
 
         if verbose:
-            logger.debug("Preparing detailed workout queries")
-            getWorkoutDetailsQueryStrength = sql.SQL("""SELECT e.id, e.name, e.single_sided, (we.sets).reps, (we.sets).percieved_difficulty, (we.sets).weight, (we.sets).type_set 
-                                                     FROM workout_exercises we
-                                                     JOIN exercises e ON e.id = we.exercise_id 
-                                                     WHERE we.workout_id = %s
-                                                     ORDER BY e.name""")
-
-            getWorkoutDetailsQueryCardio = sql.SQL("""SELECT duration, distance, percieved_difficulty 
-                                                   FROM workout_cardio 
-                                                   WHERE workout_id = %s""")
+            logger.debug("Preparing detailed workout query")
+            # Details of every selected workout in one round trip: strength rows for
+            # strength workouts and cardio rows for cardio workouts, grouped in Python
+            getWorkoutDetailsQuery = sql.SQL("""SELECT we.workout_id, e.name AS sort_name,
+                                                       e.id, e.name, e.single_sided, (we.sets).reps, (we.sets).percieved_difficulty, (we.sets).weight, (we.sets).type_set,
+                                                       NULL::interval, NULL::numeric, NULL::integer
+                                                FROM workout_exercises we
+                                                JOIN exercises e ON e.id = we.exercise_id
+                                                WHERE we.workout_id = ANY(%s)
+                                                UNION ALL
+                                                SELECT wc.workout_id, NULL,
+                                                       NULL, NULL, NULL, NULL, NULL, NULL, NULL,
+                                                       wc.duration, wc.distance, wc.percieved_difficulty
+                                                FROM workout_cardio wc
+                                                WHERE wc.workout_id = ANY(%s)
+                                                ORDER BY 1, 2""")
+            strengthKeys = ("exercise_id", "exercise_name", "single_sided", "reps", "percieved_difficulty", "weight", "type_set")
+            cardioKeys = ("duration", "distance", "percieved_difficulty")
             
+        should_close_conn = False
         try:
             try:
                 logger.debug("Establishing database connection")
                 if not conn:
+                    should_close_conn = True
                     conn = global_func.getConnection()
             except Exception as e:
                 logger.error(f"Failed to connect to database: {str(e)}")
@@ -1027,20 +1057,10 @@ class UserStats(User):
             else:
                 cur.execute(getUserActivitiesQuery, (self.id, number))
                 
-            logger.debug(f"Fetching results from query")
-            if days >= 1:
-                cur.execute(getUserActivitiesQuery, (self.id, days, number))
-            else:
-                cur.execute(getUserActivitiesQuery, (self.id, number))
-                
             logger.debug(f"Fetching results from query")
             result = cur.fetchall()
             
             logger.debug(f"Fetched {len(result)} activities for user ID {self.id}")
-            logger.debug(f'raw result: {result}')
-            
-            logger.debug(f"Fetched {len(result)} activities for user ID {self.id}")
-            logger.debug(f'raw result: {result}')
             
             workouts = {}
             index = 1
@@ -1051,35 +1071,38 @@ class UserStats(User):
                 
             if verbose:
                 logger.debug(f"Processing {len(result)} workouts with details")
+                strengthIds = [row[0] for row in result if row[2] == "strength"]
+                cardioIds = [row[0] for row in result if row[2] == "cardio"]
+                
+                details = {}
+                if strengthIds or cardioIds:
+                    logger.debug(f"Fetching details for {len(strengthIds)} strength and {len(cardioIds)} cardio workouts")
+                    cur.execute(getWorkoutDetailsQuery, (strengthIds, cardioIds))
+                    for detail in cur.fetchall():
+                        details.setdefault(detail[0], []).append(detail)
+                
                 for row in result:
+                    workout_id = row[0]
+                    workout_type = row[2]
+                    
+                    if workout_type == "strength":
+                        rows = [detail[2:9] for detail in details.get(workout_id, [])]
+                        keys = strengthKeys
+                    elif workout_type == "cardio":
+                        rows = [detail[9:12] for detail in details.get(workout_id, [])]
+                        keys = cardioKeys
+                    else:
+                        # Skip unknown workout types
+                        logger.warning(f"Unknown workout type '{workout_type}' for workout ID {workout_id}, skipping")
+                        continue
+                    
                     try:
-                        workout_id = row[0]
-                        workout_type = row[2]
-                        
-                        
-                        
-                        if workout_type == "strength":
-                            logger.debug(f"Fetching strength workout details for workout ID {workout_id}")
-                            cur.execute(getWorkoutDetailsQueryStrength, (workout_id,))
-                            keys = ("exercise_id", "exercise_name", "single_sided", "reps", "percieved_difficulty", "weight", "type_set")
-                            keys = ("exercise_id", "exercise_name", "single_sided", "reps", "percieved_difficulty", "weight", "type_set")
-                            
-                        elif workout_type == "cardio":
-                            logger.debug(f"Fetching cardio workout details for workout ID {workout_id}")
-                            cur.execute(getWorkoutDetailsQueryCardio, (workout_id,))
-                            keys = ("duration", "distance", "percieved_difficulty")
-                        else:
-                            # Skip unknown workout types
-                            logger.warning(f"Unknown workout type '{workout_type}' for workout ID {workout_id}, skipping")
-                            continue
-                            
-                        details = cur.fetchall()
-                        detailsList = self.__jsonifyTuple__(details, keys)
+                        detailsList = self.__jsonifyTuple__(rows, keys)
                         workouts[index] = {"name": row[1], "type": workout_type, "date": row[3], "details": detailsList}
                         index += 1
                     except Exception as e:
                         # Log this error but continue with other workouts
-                        logger.error(f"Error processing workout {row[0]}: {str(e)}")
+                        logger.error(f"Error processing workout {workout_id}: {str(e)}")
                         logger.debug(traceback.format_exc())
                 
                 logger.info(f"Retrieved {len(workouts)} workouts with details for user ID {self.id}")
@@ -1102,9 +1125,9 @@ class UserStats(User):
         finally:
             if 'cur' in locals() and cur:
                 cur.close()
-            if conn:
+            if should_close_conn and conn:
                 conn.close()
-            logger.debug("Database connection closed")
+                logger.debug("Database connection closed")
             
     def __calculate_calories__(self, activity_type, speed, weight_kg, duration_seconds):
     
@@ -1146,16 +1169,19 @@ class UserStats(User):
         """
         Format workout activities data for user dashboard display.
         
+        Muscle groups are resolved from the in-memory exercise catalogue, so
+        formatting does no per-exercise database I/O.
+        
         Args:
             activities (dict): Dictionary containing workout activity data
-            conn (psycopg2.connection, optional): Database connection to reuse
+            conn (psycopg2.connection, optional): Unused, kept for compatibility
             
         Returns:
             dict: Formatted workout data with calculated metrics
             
         Raises:
             InvalidStatsDataError: When activity data is invalid or malformed
-            ConnectionError: When database connection fails
+            ConnectionError: When the exercise catalogue cannot be loaded
             QueryError: When there's an error executing database queries
         """
         logger.info(f"Formatting dashboard data for user ID {self.id} with {len(activities) if activities else 0} activities")
@@ -1165,18 +1191,13 @@ class UserStats(User):
             return {}
             
         final1 = {}
-        should_close_conn = False
         
         try:
-            # Establish database connection if not provided
-            if not conn:
-                try:
-                    logger.debug("Opening new database connection for muscle group queries")
-                    conn = global_func.getConnection()
-                    should_close_conn = True
-                except Exception as e:
-                    logger.error(f"Failed to connect to database: {str(e)}")
-                    raise ConnectionError(str(e))
+            try:
+                catalogue = exercise_catalogue.get_catalogue()
+            except Exception as e:
+                logger.error(f"Failed to load exercise catalogue: {str(e)}")
+                raise ConnectionError(str(e))
             
             # Process each activity
             for activity_key, activity in activities.items():
@@ -1218,14 +1239,6 @@ class UserStats(User):
                             totalWeightLifted = 0
                             totalSets = 0
                             
-                            # Find muscle groups in a separate thread
-                            q = queue.Queue()
-                            muscle_thread = threading.Thread(
-                                target=self.__findMuscles__, 
-                                args=(exercise['exercise_id'], q, conn)
-                            )
-                            muscle_thread.start()
-                            
                             # Process each set in the exercise
                             try:
                                 for i in range(len(exercise['type_set'])):
@@ -1242,20 +1255,17 @@ class UserStats(User):
                             except (TypeError, ValueError) as e:
                                 logger.error(f"Error calculating weight for {exercise['exercise_name']}: {str(e)}")
                             
-                            # Wait for muscle thread to complete
-                            muscle_thread.join()
                             final["Total Weight Lifted"] += totalWeightLifted
                             final["Total Sets"] += totalSets
                             
-                            # Get muscle groups from the thread
-                            try:
-                                muscle = q.get(block=False)
-                                if muscle:
-                                    for m in muscle:
-                                        if m not in final["Muscle Groups"]:
-                                            final["Muscle Groups"].append(m)
-                            except queue.Empty:
-                                logger.warning(f"No muscle data returned for {exercise['exercise_name']}")
+                            # Look up muscle groups in the exercise catalogue
+                            muscle = catalogue.muscles(exercise.get('exercise_id'))
+                            if muscle:
+                                for m in muscle:
+                                    if m not in final["Muscle Groups"]:
+                                        final["Muscle Groups"].append(m)
+                            else:
+                                logger.warning(f"No muscle data found for {exercise['exercise_name']}")
                         
                         # Add formatted activity to results
                         final1[activity['name']] = final
@@ -1327,151 +1337,7 @@ class UserStats(User):
             logger.error(f"Unexpected error in formatUserPage: {str(e)}")
             logger.debug(traceback.format_exc())
             raise QueryError(f"Error formatting user page: {str(e)}")
-        finally:
-            # Close connection only if we opened it
-            if should_close_conn and conn:
-                conn.close()
-                logger.debug("Closed database connection")
-                
     
-    def __findMuscles__(self, exercise, q, conn=None):
-        findMusclesQuery = sql.SQL("""SELECT name, primary_muscle, secondary_muscles FROM exercises WHERE id = %s""")
-        
-        try:
-            try:
-                logger.debug(f"Finding muscles for exercise {exercise}")
-                logger.debug(f"Finding muscles for exercise {exercise}")
-                if not conn:
-                    conn = global_func.getConnection()
-            except Exception as e:
-                logger.error(f"Failed to connect to database: {str(e)}")
-                raise ConnectionError(str(e))
-                
-            cur = conn.cursor()
-            logger.debug(f"Executing query to find muscles for exercise: {exercise}")
-            logger.debug(f"Executing query to find muscles for exercise: {exercise}")
-            cur.execute(findMusclesQuery, (exercise,))
-            result = cur.fetchone()
-            
-            final = []
-            final = []
-            if result:
-                logger.debug(f"Raw muscle data for {exercise}: {result}")
-                logger.debug(f"Raw muscle data for {exercise}: {result}")
-                
-                # Process primary muscle (first element)
-                if result[1]:
-                    if isinstance(result[1], str):
-                        # If it's a PostgreSQL array string like "{muscle1,muscle2}"
-                        if result[1].startswith('{') and result[1].endswith('}'):
-                            # Parse PostgreSQL array format
-                            muscles = result[1][1:-1].split(',')
-                            for muscle in muscles:
-                                muscle = muscle.strip().strip('"')
-                                if muscle and muscle not in final:
-                                    final.append(muscle)
-                        else:
-                            # Single string value
-                            final.append(result[1])
-                    elif isinstance(result[1], list):
-                        # If it's already a Python list
-                        for muscle in result[1]:
-                            if muscle and muscle not in final:
-                                final.append(muscle)
-                
-                # Process secondary muscles (second element)
-                if result[2]:
-                    if isinstance(result[2], str):
-                        # If it's a PostgreSQL array string like "{muscle1,muscle2}"
-                        if result[2].startswith('{') and result[2].endswith('}'):
-                            # Parse PostgreSQL array format
-                            muscles = result[2][1:-1].split(',')
-                            for muscle in muscles:
-                                muscle = muscle.strip().strip('"')
-                                if muscle and muscle not in final:
-                                    final.append(muscle)
-                        else:
-                            # Single string value
-                            if result[2] not in final:
-                                final.append(result[2])
-                    elif isinstance(result[2], list):
-                        # If it's already a Python list
-                        for muscle in result[2]:
-                            if muscle and muscle not in final:
-                                final.append(muscle)
-                
-                logger.debug(f"Processed muscles for {result[0]}: {final}")
-                q.put(final)
-                # Process primary muscle (first element)
-                if result[1]:
-                    if isinstance(result[1], str):
-                        # If it's a PostgreSQL array string like "{muscle1,muscle2}"
-                        if result[1].startswith('{') and result[1].endswith('}'):
-                            # Parse PostgreSQL array format
-                            muscles = result[1][1:-1].split(',')
-                            for muscle in muscles:
-                                muscle = muscle.strip().strip('"')
-                                if muscle and muscle not in final:
-                                    final.append(muscle)
-                        else:
-                            # Single string value
-                            final.append(result[1])
-                    elif isinstance(result[1], list):
-                        # If it's already a Python list
-                        for muscle in result[1]:
-                            if muscle and muscle not in final:
-                                final.append(muscle)
-                
-                # Process secondary muscles (second element)
-                if result[2]:
-                    if isinstance(result[2], str):
-                        # If it's a PostgreSQL array string like "{muscle1,muscle2}"
-                        if result[2].startswith('{') and result[2].endswith('}'):
-                            # Parse PostgreSQL array format
-                            muscles = result[2][1:-1].split(',')
-                            for muscle in muscles:
-                                muscle = muscle.strip().strip('"')
-                                if muscle and muscle not in final:
-                                    final.append(muscle)
-                        else:
-                            # Single string value
-                            if result[2] not in final:
-                                final.append(result[2])
-                    elif isinstance(result[2], list):
-                        # If it's already a Python list
-                        for muscle in result[2]:
-                            if muscle and muscle not in final:
-                                final.append(muscle)
-                
-                logger.debug(f"Processed muscles for {result[0]}: {final}")
-                q.put(final)
-                return final
-            else:
-                logger.warning(f"No muscles found for exercise {result[0]}")
-                q.put([])
-                return []
-                
-                logger.warning(f"No muscles found for exercise {result[0]}")
-                q.put([])
-                return []
-                
-        except Exception as e:
-            logger.error(f"Error finding muscles for {exercise}: {str(e)}")
-            logger.error(f"Error finding muscles for {exercise}: {str(e)}")
-            logger.debug(traceback.format_exc())
-            # Make sure we don't block the thread waiting for a result
-            q.put([])
-            return []
-            # Make sure we don't block the thread waiting for a result
-            q.put([])
-            return []
-        finally:
-            if 'cur' in locals() and cur:
-                cur.close()
-                logger.debug("Cursor closed")
-                logger.debug("Cursor closed")
-        
-            
     def insertSteps(self, steps, date, conn = None):
         """
         Inserts the user steps into the database
@@ -1544,8 +1410,12 @@ class UserStats(User):
                     logger.debug(f"Inserting {steps_value} steps for user ID {self.id} on {date}")
                     cur.execute(insertStepsQuery, (self.id, steps_value, date))
                 
+                leaderboard_store.publish_change(cur, self.id, "steps")
+                
                 # Commit the transaction
                 conn.commit()
+                stepStats.invalidate(self.id)
+                homePage.invalidate(self.id)
                 logger.info(f"Successfully {'updated' if result else 'inserted'} steps for user ID {self.id} on {date}")
                 
             except psycopg2.Error as e:
@@ -1569,98 +1439,232 @@ class UserStats(User):
                 conn.close()
                 logger.debug("Database connection closed")
                 
-    def getHomePageData(self, leaderboardType = None, conn = None):
-        # Personal: Most recent workout
-        # Leaderboard I have
-        # Family: Most recent family workouts
+    def insertStepsBulk(self, entries, conn = None):
+        """
+        Inserts or updates many days of user steps in one statement
         
+        Each entry is validated like a single /add_step_data request. Valid entries are
+        upserted together and committed once; invalid ones are reported and skipped.
+        When a date appears more than once, the last entry for it is used.
         
+        :param entries: The days to store, each a dict with 'steps' and an optional 'date' (YYYY-MM-DD, defaults to today)
+        :param conn: The connection to the database
+        
+        :type entries: list
+        :type conn: psycopg2.connection
+        
+        :return: One outcome per entry, in order, with status 'inserted', 'updated' or 'rejected'
+        :rtype: list
+        
+        :raises UserNotFoundException: When user ID is not found
+        :raises InvalidStatsDataError: When entries is not a list or is too long
+        :raises ConnectionError: When database connection fails
+        :raises QueryError: When there's an error executing the query
         """
-        Gets the user data for the home page
-
-        Args:
-            conn (_type_, optional): _description_. Defaults to None.
-        """
-        # most recent activity
-        activities = self.getUserActivities(verbose = True, days = -1, number = 1, conn = conn)
+        logger.info(f"Bulk inserting steps for user ID {self.id}: {len(entries) if isinstance(entries, list) else 0} entries")
+        
+        if self.id is None or self.id == -1:
+            logger.warning("Cannot insert steps - Invalid user ID")
+            raise UserNotFoundException()
         
-        activity = {}
+        if not isinstance(entries, list) or not entries:
+            logger.warning("Cannot insert steps - entries must be a non-empty list")
+            raise InvalidStatsDataError("entries must be a non-empty list of {date, steps} objects")
         
-        if not activities:
-            logger.warning("No activities found for user ID")
-            activity = {}
-        elif(activities[1]['type'] == 'strength'):
-            sets = 0
-            reps = 0
-            weight = 0
-            for exercise in activities[1]['details']:
-                sets += len(exercise['weight'])
-                reps += sum(exercise['reps'])
-                weight += sum(exercise['weight'])
-            activity = {
-                "name": activities[1]['name'],
-                "type": activities[1]['type'],
-                "date": activities[1]['date'],
-                "sets": sets,
-                "reps": reps,
-                "weight": weight
-            }
-        logger.info(f"Home page data for user ID {self.id}: {activity}")
-        
-        # weight data
-        
-        # weightStats = self.getUserStats(365)
-        
-        # if not weightStats:
-        #     logger.warning("No weight stats found for user ID")
-        #     weightStats = {}
-        # else:
-        #     weights = []
-        #     for i in range(len(weightStats)):
-        #         weights[i] = {
-        #             "weight": weightStats[i]['weight'],
-        #             "date": weightStats[i]['date']
-        #         }
+        if len(entries) > MAX_STEP_BATCH:
+            logger.warning(f"Cannot insert steps - {len(entries)} entries exceeds the limit of {MAX_STEP_BATCH}")
+            raise InvalidStatsDataError(f"At most {MAX_STEP_BATCH} entries can be sent at once")
+        
+        today = datetime.date.today()
+        outcomes = []
+        latest = {}  # date -> index of the entry that wins for that date
+        for index, entry in enumerate(entries):
+            outcome = {"index": index, "date": None, "steps": None}
+            outcomes.append(outcome)
+            try:
+                if not isinstance(entry, dict) or 'steps' not in entry or entry['steps'] is None:
+                    raise InvalidStatsDataError("Steps value is required")
+                try:
+                    steps_value = int(entry['steps'])
+                except (ValueError, TypeError):
+                    raise InvalidStatsDataError("Steps value must be a number")
+                if steps_value < 0:
+                    raise InvalidStatsDataError("Steps value must be a positive number")
+                
+                date = entry.get('date')
+                if date is None:
+                    date = today
+                else:
+                    try:
+                        date = datetime.datetime.strptime(str(date), "%Y-%m-%d").date()
+                    except ValueError:
+                        raise InvalidStatsDataError("Date must be in YYYY-MM-DD format")
+                if date > today:
+                    raise InvalidStatsDataError("Cannot add step data for future dates")
+            except InvalidStatsDataError as e:
+                outcome.update(status="rejected", error=e.message)
+                continue
+            
+            outcome.update(date=date, steps=steps_value)
+            if date in latest:
+                outcomes[latest[date]].update(status="rejected", error="Superseded by a later entry for the same date")
+            latest[date] = index
+        
+        rows = [(self.id, outcomes[index]["steps"], date) for date, index in latest.items()]
+        
+        upsertStepsQuery = sql.SQL("""
+            INSERT INTO user_steps (user_id, steps, date_performed) VALUES %s
+            ON CONFLICT (user_id, date_performed) DO UPDATE SET steps = EXCLUDED.steps
+            RETURNING date_performed, (xmax = 0) AS inserted
+        """)
+        
+        should_close_conn = False
+        cur = None
+        try:
+            if rows:
+                if not conn:
+                    should_close_conn = True
+                    try:
+                        logger.debug("Establishing database connection")
+                        conn = global_func.getConnection()
+                    except Exception as e:
+                        logger.error(f"Failed to connect to database: {str(e)}")
+                        raise ConnectionError(str(e))
+                
+                cur = conn.cursor()
+                try:
+                    written = execute_values(cur, upsertStepsQuery.as_string(cur), rows, fetch=True)
+                    # Streak and leaderboard aggregates are refreshed once for the whole batch
+                    leaderboard_store.publish_change(cur, self.id, "steps")
+                    conn.commit()
+                    stepStats.invalidate(self.id)
+                    homePage.invalidate(self.id)
+                except psycopg2.Error as e:
+                    conn.rollback()
+                    logger.error(f"Database error while processing steps: {str(e)}")
+                    raise QueryError(f"Error processing steps: {str(e)}")
+                
+                for date, inserted in written:
+                    outcomes[latest[date]]["status"] = "inserted" if inserted else "updated"
+            
+            for outcome in outcomes:
+                if isinstance(outcome["date"], datetime.date):
+                    outcome["date"] = outcome["date"].isoformat()
             
+            logger.info(f"Stored {len(rows)} days of steps for user ID {self.id}, rejected {len(entries) - len(rows)} entries")
+            return outcomes
+        
+        except (ConnectionError, QueryError):
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error in insertStepsBulk: {str(e)}")
+            logger.debug(traceback.format_exc())
+            raise QueryError(f"Error inserting steps: {str(e)}")
+        finally:
+            if cur:
+                cur.close()
+            if should_close_conn and conn:
+                conn.close()
+                logger.debug("Database connection closed")
+    
+    def getHomePageData(self, leaderboardType = None, conn = None):
+        """
+        Gets the user data for the home page
+        
+        The most recent workout and the family workouts are fetched concurrently,
+        each on its own pooled connection, while the leaderboard rank is read from
+        the in-memory boards. Assembled pages are cached per user for a short time
+        and dropped when the user logs steps or a workout, see homePage
+        
+        :param leaderboardType: The leaderboard to rank the user on, steps when omitted
+        :param conn: A connection to fetch the sections on one after another instead, left open
+        
+        :type leaderboardType: str
+        :type conn: psycopg2.connection
+        
+        :return: The most recent workout, the leaderboard rank and the family workouts
+        :rtype: tuple
+        :raises UserNotFoundException: When user ID is not found
+        :raises InvalidLeaderboardTypeError: When the leaderboard type is not supported
+        :raises ConnectionError: When database connection fails
+        :raises QueryError: When there's an error executing the query
+        """
+        if self.id is None or self.id == -1:
+            logger.warning("Cannot get home page data - Invalid user ID")
+            raise UserNotFoundException()
+        
         if leaderboardType is None:
             leaderboardType = 'steps'
         else:
             leaderboardType = leaderboardType.lower()
         
-        if leaderboardType not in ['steps', 'weight', 'deadlift', 'squat', 'bench']:
+        if leaderboardType != 'steps' and leaderboardType not in self.LEADERBOARD_EXERCISES:
             logger.warning(f"Invalid leaderboard type: {leaderboardType}")
             raise InvalidLeaderboardTypeError()
         
-        match leaderboardType:
-            case 'deadlift':
-                leaderboard = self.getLeaderboardRank('deadlift', conn)
-            case 'squat':
-                leaderboard = self.getLeaderboardRank('squat', conn)
-            case 'bench':
-                leaderboard = self.getLeaderboardRank('bench', conn)
-            case 'steps':
-                leaderboard = self.getLeaderboardRank('steps', conn)
-                
-        logger.info(f"Leaderboard data for user ID {self.id}: {leaderboard}")
-        
-        # get user goal progress
+        def build():
+            if conn:
+                activities = self.getUserActivities(verbose = True, days = -1, number = 1, conn = conn)
+                leaderboard = self.getLeaderboardRank(leaderboardType)
+                familyWkouts = self.getFamilyWorkouts(conn)
+            else:
+                activitiesFuture = homePage.submit(self.getUserActivities, verbose = True, days = -1, number = 1)
+                familyFuture = homePage.submit(self.getFamilyWorkouts)
+                leaderboard = self.getLeaderboardRank(leaderboardType)
+                activities = activitiesFuture.result()
+                familyWkouts = familyFuture.result()
+            return self.__summarizeActivity__(activities), leaderboard, familyWkouts or []
         
-        familyWkouts = self.getFamilyWorkouts(conn)
+        activity, leaderboard, familyWkouts = homePage.load(self.id, leaderboardType, build)
         
+        logger.info(f"Home page data for user ID {self.id}: {len(leaderboard)} leaderboard rows, {len(familyWkouts)} family workouts, recent workout {'found' if activity else 'not found'}")
         if not familyWkouts:
             logger.warning("No family workouts found for user ID")
-            familyWkouts = []
 
         return activity, leaderboard, familyWkouts
+    
+    def __summarizeActivity__(self, activities):
+        """
+        Totals the sets, reps and weight of the most recent workout for the home page
+        
+        :param activities: Output of getUserActivities with verbose details
+        :type activities: dict
+        
+        :return: The workout summary, empty unless it was a strength workout
+        :rtype: dict
+        """
+        if not activities:
+            logger.warning("No activities found for user ID")
+            return {}
+        if activities[1]['type'] != 'strength':
+            return {}
+        
+        sets = 0
+        reps = 0
+        weight = 0
+        for exercise in activities[1]['details']:
+            sets += len(exercise['weight'])
+            reps += sum(exercise['reps'])
+            weight += sum(exercise['weight'])
+        return {
+            "name": activities[1]['name'],
+            "type": activities[1]['type'],
+            "date": activities[1]['date'],
+            "sets": sets,
+            "reps": reps,
+            "weight": weight
+        }
             
         
 
     def getLeaderboardRank(self, exercise = None, conn = None):
         """
-        Gets the leaderboard rank for the user
+        Gets the leaderboard rank for the user and the users ranked around them
+        
+        Served from the in-memory leaderboard boards, so no ranking query runs per call
         
         :param exercise: The exercise to get the rank for
-        :param conn: The connection to the database
+        :param conn: Unused, kept for compatibility
         
         :type exercise: str
         :type conn: psycopg2.connection
@@ -1670,78 +1674,6 @@ class UserStats(User):
         """
         logger.info(f"Getting leaderboard rank for user ID {self.id} for exercise {exercise}")
         
-        if not conn:
-            try:
-                logger.debug("Establishing database connection")
-                conn = global_func.getConnection()
-            except Exception as e:
-                logger.error(f"Failed to connect to database: {str(e)}")
-                raise ConnectionError(str(e))
-            
-        cur = conn.cursor()
-                
-        ex = {'deadlift': 523, 'squat': 716, 'bench': 273}
-        
-        
-        query = sql.SQL("""
-                        WITH latest_1rm AS (
-                            SELECT DISTINCT ON (uem.user_id)
-                                uem.user_id,
-                                uem.exercise_id,
-                                uem.calculated_1rm,
-                                uem.date_performed,
-                                u.username
-                            FROM user_exercise_max uem
-                            JOIN users u ON u.id = uem.user_id
-                            WHERE uem.exercise_id = %s
-                            ORDER BY uem.user_id, uem.date_performed DESC
-                        ),
-                        ranked AS (
-                            SELECT *,
-                                RANK() OVER (ORDER BY calculated_1rm DESC) AS rank
-                            FROM latest_1rm
-                        ),
-                        target_user AS (
-                            SELECT rank FROM ranked WHERE user_id = %s
-                        )
-                        SELECT r.*
-                        FROM ranked r
-                        JOIN target_user t ON r.rank BETWEEN t.rank - 2 AND t.rank + 2
-                        ORDER BY r.rank;
-                        """)
-        
-        stepsQuery = sql.SQL("""WITH ranked_users AS (
-                                    SELECT 
-                                        us.user_id,
-                                        u.username,
-                                        ROUND(AVG(us.steps)::numeric, 2) AS avg_steps,
-                                        ROW_NUMBER() OVER (ORDER BY AVG(us.steps) DESC) AS rank
-                                    FROM user_steps us
-                                    JOIN users u ON u.id = us.user_id
-                                    GROUP BY us.user_id, u.username
-                                ),
-                                target_user AS (
-                                    SELECT rank FROM ranked_users WHERE user_id = %s
-                                ),
-                                bounds AS (
-                                    SELECT 
-                                        CASE 
-                                    WHEN rank <= 3 THEN 1
-                                    WHEN rank >= (SELECT MAX(rank) FROM ranked_users) - 2 THEN GREATEST((SELECT MAX(rank) FROM ranked_users) - 4, 1)
-                                    ELSE rank - 2
-                                    END AS start_rank
-                                FROM target_user
-                                )
-                                SELECT 
-                                    ru.username,
-                                    ru.avg_steps,
-                                    ru.rank
-                                FROM ranked_users ru, bounds
-                                WHERE ru.rank BETWEEN bounds.start_rank AND bounds.start_rank + 4
-                                ORDER BY ru.rank;
-
-                            """)
-        
         if self.id is None or self.id == -1:
             logger.warning("Cannot get leaderboard rank - Invalid user ID")
             raise UserNotFoundException()
@@ -1750,41 +1682,37 @@ class UserStats(User):
             logger.warning("Cannot get leaderboard rank - Invalid exercise")
             raise InvalidLeaderboardTypeError()
         
-        logger.debug("I get here!!!!!!")
+        if exercise != 'steps' and exercise not in self.LEADERBOARD_EXERCISES:
+            logger.warning(f"Invalid exercise type: {exercise}")
+            raise InvalidLeaderboardTypeError()
         
         try:
-            
-            logger.debug(f"Executing query to get leaderboard rank for user ID {self.id} and exercise {exercise}")
-            
-            match exercise:
-                case 'deadlift':
-                    cur.execute(query, (ex['deadlift'], self.id))
-                case 'squat':
-                    cur.execute(query, (ex['squat'], self.id))
-                case 'bench':
-                    cur.execute(query, (ex['bench'], self.id))
-                case 'steps':
-                    cur.execute(stepsQuery, (self.id,))
-                case _:
-                    logger.warning(f"Invalid exercise type: {exercise}")
-                    raise InvalidLeaderboardTypeError()
-                
-            result = cur.fetchall()
-            logger.debug(f"Fetched leaderboard rank for user ID {self.id}: {result}")
-            final = []
-            if not result:
+            logger.debug(f"Looking up leaderboard rank for user ID {self.id} and exercise {exercise}")
+            
+            if exercise == 'steps':
+                # All-time average steps, five rows kept full at either end of the board
+                rows = leaderboard_store.get_board('steps').around(self.id, 5, clamp=True)
+                final = [
+                    {"username": username, "avg_steps": value, "rank": rank}
+                    for _, username, value, rank, _ in rows
+                ]
+            else:
+                exercise_id = self.LEADERBOARD_EXERCISES[exercise]
+                rows = leaderboard_store.get_board('1rm', exercise_id).around(self.id, 5)
+                final = [
+                    {"user_id": user_id, "exercise_id": exercise_id, "calculated_1rm": value,
+                     "date_performed": date_performed, "username": username, "rank": rank}
+                    for user_id, username, value, rank, date_performed in rows
+                ]
+            
+            if not final:
                 logger.info(f"No leaderboard data found for user ID {self.id}")
                 return []
-            else:
-                # Process the result into a more readable format
-                if exercise != 'steps':
-                    keys = ("user_id", "exercise_id", "calculated_1rm", "date_performed", "username", "rank")
-                    final = self.__jsonifyTuple__(result, keys)
-                else:
-                    keys = ("username", "avg_steps", "rank")
-                    final = self.__jsonifyTuple__(result, keys)
-                logger.info(f"Leaderboard rank data for user ID {self.id}: {final}")
-                return final
+            logger.info(f"Found {len(final)} leaderboard rows around user ID {self.id}")
+            return final
+        except psycopg2.OperationalError as e:
+            logger.error(f"Failed to connect to database: {str(e)}")
+            raise ConnectionError(str(e))
         except Exception as e:
             logger.error(f"Error fetching leaderboard rank: {str(e)}")
             logger.debug(traceback.format_exc())
@@ -1802,6 +1730,7 @@ class UserStats(User):
         """
         logger.info(f"Getting family workouts for user ID {self.id}")
         
+        should_close_conn = not conn
         if not conn:
             try:
                 logger.debug("Establishing database connection")
@@ -1839,14 +1768,11 @@ class UserStats(User):
                         SELECT 
                             u.username AS family_member,
                             lw.workout_date,
-                            array_agg(DISTINCT e.primary_muscle) AS primary_muscles_hit,
-                            array_agg(DISTINCT sm.muscle) AS secondary_muscles_hit,
+                            array_agg(DISTINCT we.exercise_id) AS exercise_ids,
                             lw.family_name
                         FROM latest_workouts lw
                         JOIN users u ON u.id = lw.user_id
                         JOIN workout_exercises we ON we.workout_id = lw.workout_id
-                        JOIN exercises e ON e.id = we.exercise_id
-                        LEFT JOIN LATERAL unnest(e.secondary_muscles) AS sm(muscle) ON TRUE
                         GROUP BY u.username, lw.workout_date, lw.family_name
                         ORDER BY lw.workout_date DESC;
                     """)
@@ -1855,56 +1781,33 @@ class UserStats(User):
             # Pass the user ID twice - once to find all families and once to exclude self
             cur.execute(query, (self.id, self.id))
             result = cur.fetchall()
-            logger.debug(f"Fetched family workouts for user ID {self.id}: {result}")
+            logger.debug("Fetched %d family workouts for user ID %s", len(result), self.id)
             
             if not result:
                 logger.info(f"No family workouts found for user ID {self.id}")
                 return []
             else:
-                # Process the result into a more readable format
-                keys = ("family_member", "workout_date", "primary_muscles_hit", "secondary_muscles_hit", "family_name")
-                raw_data = self.__jsonifyTuple__(result, keys)
-                
-                # Clean up the array strings and convert to proper lists
+                # Resolve muscle groups from the in-memory exercise catalogue
+                catalogue = exercise_catalogue.get_catalogue()
                 clean_data = []
-                for workout in raw_data:
-                    clean_workout = workout.copy()
+                for family_member, workout_date, exercise_ids, family_name in result:
+                    primary = set()
+                    secondary = set()
+                    for exercise_id in exercise_ids or []:
+                        exercise = catalogue.get(exercise_id)
+                        if exercise:
+                            primary.update(exercise.primary_muscles)
+                            secondary.update(exercise.secondary_muscles)
                     
-                    # Clean primary muscles format - convert PostgreSQL array string to list
-                    if isinstance(workout.get('primary_muscles_hit'), str):
-                        muscles_str = workout['primary_muscles_hit']
-                        # Remove the curly braces and split by commas
-                        if muscles_str.startswith('{') and muscles_str.endswith('}'):
-                            muscles_str = muscles_str[1:-1]
-                            # Split by comma but handle quoted strings properly
-                            muscles_list = []
-                            for muscle in muscles_str.split(','):
-                                muscle = muscle.strip().strip('"')
-                                if muscle:  # Only add if not empty
-                                    # Additional cleaning - remove any remaining curly braces
-                                    if muscle.startswith('{'):
-                                        muscle = muscle[1:]
-                                    if muscle.endswith('}'):
-                                        muscle = muscle[:-1]
-                                    muscles_list.append(muscle)
-                            clean_workout['primary_muscles_hit'] = muscles_list
-                    
-                    # Clean secondary muscles format
-                    if isinstance(workout.get('secondary_muscles_hit'), str):
-                        muscles_str = workout['secondary_muscles_hit']
-                        if muscles_str.startswith('{') and muscles_str.endswith('}'):
-                            muscles_str = muscles_str[1:-1]
-                            # Split by comma but handle quoted strings properly
-                            muscles_list = []
-                            for muscle in muscles_str.split(','):
-                                muscle = muscle.strip().strip('"')
-                                if muscle:  # Only add if not empty
-                                    muscles_list.append(muscle)
-                            clean_workout['secondary_muscles_hit'] = muscles_list
-                    
-                    clean_data.append(clean_workout)
+                    clean_data.append({
+                        "family_member": family_member,
+                        "workout_date": workout_date,
+                        "primary_muscles_hit": sorted(primary),
+                        "secondary_muscles_hit": sorted(secondary),
+                        "family_name": family_name
+                    })
                 
-                logger.info(f"Family workouts data for user ID {self.id}: {clean_data}")
+                logger.info("Returning %d family workouts for user ID %s", len(clean_data), self.id)
                 return clean_data
                 
         except Exception as e:
@@ -1914,9 +1817,9 @@ class UserStats(User):
         finally:
             if 'cur' in locals() and cur:
                 cur.close()
-            if conn:
+            if should_close_conn and conn:
                 conn.close()
-            logger.debug("Database connection closed")
+                logger.debug("Database connection closed")
         
         
     def getUserGoal(self, goalType, exercise = None, conn = None):
@@ -1997,6 +1900,7 @@ class UserStats(User):
                         raise InvalidStatsDataError("target_weight is required for weight goal")
                     query = sql.SQL("""INSERT INTO weight_goals (user_id, goal_type, target_weight, achieve_by) VALUES (%s, 'weight'::goal_type_enum, %s, %s)""")
                     cur.execute(query, (self.id, kwargs['goal_weight'], kwargs['achieve_by']))
+                    notify.publish(cur, notify.WEIGHT_CHANNEL, str(self.id))
                     
                 case 'strength':
                     if 'target_reps' not in kwargs or 'target_exercise' not in kwargs or 'target_weight' not in kwargs:
@@ -2024,6 +1928,8 @@ class UserStats(User):
                     raise InvalidGoalTypeError()
                 
             conn.commit()
+            if goalType == 'steps':
+                stepStats.invalidate(self.id)
             logger.info(f"Successfully created {goalType} goal for user ID {self.id}")
             
         except Exception as e:
@@ -2041,6 +1947,8 @@ class UserStats(User):
         """
         Gets the step data for the given month and year
         
+        All statistics come from one read of the user's step history (cached for the day)
+        
         :param month: The month to get the data for
         :param year: The year to get the data for
         :param conn: The connection to the database
@@ -2054,141 +1962,35 @@ class UserStats(User):
         """
         logger.info(f"Getting step data for user ID {self.id} for month {month} and year {year}")
         
-        if not conn:
-            try:
-                logger.debug("Establishing database connection")
-                conn = global_func.getConnection()
-            except Exception as e:
-                logger.error(f"Failed to connect to database: {str(e)}")
-                raise ConnectionError(str(e))
-        
-        cur = conn.cursor()
-        
-        if not month:
-            month = datetime.now().month
-        if not year:
-            year = datetime.now().year
-        
-        # Define SQL query to fetch step data
-        query = sql.SQL("""SELECT date_performed, steps FROM user_steps WHERE user_id = %s AND EXTRACT(MONTH FROM date_performed) = %s AND EXTRACT(YEAR FROM date_performed) = %s""")
-        
-        weeklyQuery = sql.SQL("""SELECT SUM(steps) AS total_steps
-                                        FROM user_steps
-                                        WHERE date_performed >= CURRENT_DATE - ((EXTRACT(DOW FROM CURRENT_DATE)::INT + 1) % 7)
-                                            AND date_performed <= CURRENT_DATE
-                                            AND user_id = %s;
-                                """)
-        
-        monthlyStepsQuery = sql.SQL("""SELECT SUM(steps) AS total_steps
-                                            FROM user_steps
-                                            WHERE date_performed >= date_trunc('month', CURRENT_DATE)
-                                                AND date_performed <= CURRENT_DATE
-                                                AND user_id = %s;
-                                        """)
-        
-        currentStreakQuery = sql.SQL("""WITH consecutive_dates AS (
-                                                SELECT
-                                                    date_performed,
-                                                    ROW_NUMBER() OVER (ORDER BY date_performed DESC) AS rn
-                                                FROM user_steps
-                                                WHERE steps > 0
-                                                    AND date_performed <= CURRENT_DATE
-                                                    AND user_id = %s
-                                            ),
-                                            grouped_dates AS (
-                                                SELECT
-                                                    date_performed,
-                                                    date_performed + rn * INTERVAL '1 day' AS group_id
-                                                FROM consecutive_dates
-                                            ),
-                                            streak_groups AS (
-                                                SELECT
-                                                    MIN(date_performed) AS start_date,
-                                                    MAX(date_performed) AS end_date,
-                                                    COUNT(*) AS streak_length
-                                                FROM grouped_dates
-                                                GROUP BY group_id
-                                            )
-                                            SELECT streak_length
-                                            FROM streak_groups
-                                            WHERE end_date = CURRENT_DATE;
-                                            """)
-        
-        averageStepsQuery = sql.SQL("""SELECT AVG(steps) AS average_steps
-                                            FROM user_steps
-                                            WHERE user_id = %s;"""
-                                        )
-        
-        stepGoalQuery = sql.SQL("""SELECT target_steps
-                                    FROM step_goals
-                                    WHERE user_id = %s
-                                    ORDER BY created_at DESC
-                                    LIMIT 1;""")
+        today = datetime.date.today()
+        try:
+            month = int(month) if month else today.month
+            year = int(year) if year else today.year
+            datetime.date(year, month, 1)
+        except (ValueError, TypeError):
+            logger.warning(f"Invalid month or year: month={month}, year={year}")
+            raise InvalidStatsDataError("Month and year must be a valid month number and year")
         
+        should_close_conn = False
+        cur = None
         try:
-            cur.execute(query, (self.id, month, year))
-            steps = cur.fetchall()
+            if not conn:
+                should_close_conn = True
+                try:
+                    logger.debug("Establishing database connection")
+                    conn = global_func.getConnection()
+                except Exception as e:
+                    logger.error(f"Failed to connect to database: {str(e)}")
+                    raise ConnectionError(str(e))
             
-            if not steps:
-                logger.info(f"No step data found for user ID {self.id} for month {month} and year {year}")
-                steps = {}
-                
+            cur = conn.cursor()
+            history = stepStats.load_history(cur, self.id)
+            statistics, steps = stepStats.summarize(history, month, year, today)
             
-            cur.execute(query, (self.id, month, year))
-            steps = cur.fetchall()
-        
             if not steps:
                 logger.info(f"No step data found for user ID {self.id} for month {month} and year {year}")
-                steps = {}
-        
-        # Execute each query with proper error handling
-            try:
-                cur.execute(weeklyQuery, (self.id,))
-                weeklySteps = cur.fetchone()
-            except Exception as e:
-                logger.error(f"Error executing weekly steps query: {str(e)}")
-                weeklySteps = None
-        
-            try:
-                cur.execute(monthlyStepsQuery, (self.id,))
-                monthlySteps = cur.fetchone()
-            except Exception as e:
-                logger.error(f"Error executing monthly steps query: {str(e)}")
-                monthlySteps = None
-        
-            try:
-                cur.execute(currentStreakQuery, (self.id,))
-                currentStreak = cur.fetchone()
-            except Exception as e:
-                logger.error(f"Error executing current streak query: {str(e)}")
-                currentStreak = None
-        
-            try:
-                cur.execute(averageStepsQuery, (self.id,))
-                averageSteps = cur.fetchone()
-            except Exception as e:
-                logger.error(f"Error executing average steps query: {str(e)}")
-                averageSteps = None
-        
-            try:
-                cur.execute(stepGoalQuery, (self.id,))
-                stepGoal = cur.fetchone()
-            except Exception as e:
-                logger.error(f"Error executing step goal query: {str(e)}")
-                stepGoal = None
-            
-            
-            
-            statistics = {
-                "weekly_steps": weeklySteps[0] if weeklySteps else 0,
-                "monthly_steps": monthlySteps[0] if monthlySteps else 0,
-                "current_streak": currentStreak[0] if currentStreak else 0,
-                "average_steps": round(float(averageSteps[0]), 2) if averageSteps[0] is not None else 0
-            }
-            
-            userInfo = {'username': self.username, "step_goal": stepGoal[0] if stepGoal else 0}
-            
             
+            userInfo = {'username': self.username, "step_goal": history.goal if history.goal else 0}
             
             # Process result into a more readable format
             step_data = []
@@ -2196,22 +1998,27 @@ class UserStats(User):
                 temp = {}
                 datePerformed = day[0].strftime("%Y-%m-%d")
                 stepsValue = day[1]
-                goal_percentage = round((stepsValue / userInfo['step_goal']) * 100, 2) if userInfo['step_goal'] > 0 else 0
+                goal_percentage = round((stepsValue / userInfo['step_goal']) * 100, 2) if stepsValue and userInfo['step_goal'] > 0 else 0
                 
                 temp['date'] = datePerformed
                 temp['steps'] = stepsValue
                 temp['goal_percentage'] = goal_percentage
                 step_data.append(temp)
 
-            logger.info(f"Step data for user ID {self.id}: {step_data}")
+            logger.info(f"Found {len(step_data)} days of step data for user ID {self.id}")
             return userInfo, statistics, step_data
             
+        except ConnectionError:
+            raise
         except Exception as e:
             logger.error(f"Error fetching step data: {str(e)}")
             logger.debug(traceback.format_exc())
             raise QueryError(f"Error fetching step data: {str(e)}")
-        
-        
+        finally:
+            if cur:
+                cur.close()
+            if should_close_conn and conn:
+                conn.close()
         
     def __getSingleSided__(self, exercise):
         pass
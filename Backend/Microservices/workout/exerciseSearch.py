@@ -0,0 +1,267 @@
+"""
+In-memory search index over the exercise catalogue.
+
+/get_exercises used to run LIKE '%q%' over name and description plus an
+unnest subquery for muscles, paged with LIMIT/OFFSET. The index here is
+built once per catalogue snapshot and answers a search in three steps:
+
+- candidates come from an inverted index of word tokens (prefix matches,
+  for search-as-you-type) and a trigram index (substring matches)
+- candidates are scored by where each search term matched: name above
+  muscles above description, whole words above prefixes above substrings
+- the ranked list is cached per (search, muscle group), and pages are read
+  from it with a keyset cursor, so a deep page costs the same as the first
+
+Every search term has to match somewhere. Without a search, exercises are
+listed in catalogue (name) order as before.
+"""
+
+import re
+import bisect
+import base64
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+
+from common import exercise_catalogue
+from WorkoutExceptions import InvalidWorkoutDataError
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_SIZE = 256
+
+# Score for a search term depending on where it matched
+NAME_WORD = 20
+NAME_PREFIX = 12
+NAME_SUBSTRING = 6
+MUSCLE_WORD = 8
+MUSCLE_PREFIX = 6
+DESCRIPTION_PREFIX = 2
+DESCRIPTION_SUBSTRING = 1
+# Bonus when the name starts with the whole search text
+NAME_STARTS_WITH_SEARCH = 10
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _tokens(text):
+    return _TOKEN_RE.findall(text.lower()) if text else []
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """
+    Inverted and trigram indexes over one catalogue snapshot.
+
+    Parameters:
+    -----------
+    catalogue : ExerciseCatalogue
+        Snapshot to index; positions in it break score ties
+    """
+
+    def __init__(self, catalogue):
+        self.catalogue = catalogue
+        self._exercises = list(catalogue)
+        self._position = {exercise.id: position for position, exercise in enumerate(self._exercises)}
+        self._names = [exercise.name.lower() for exercise in self._exercises]
+        self._descriptions = [(exercise.description or "").lower() for exercise in self._exercises]
+        self._muscles = [tuple(muscle.lower() for muscle in exercise.muscles) for exercise in self._exercises]
+
+        postings = defaultdict(set)
+        trigrams = defaultdict(set)
+        self._by_muscle = defaultdict(set)
+        for position in range(len(self._exercises)):
+            muscle_text = " ".join(self._muscles[position])
+            for token in _tokens(self._names[position]) + _tokens(self._descriptions[position]) + _tokens(muscle_text):
+                postings[token].add(position)
+            for text in (self._names[position], self._descriptions[position], muscle_text):
+                for trigram in _trigrams(text):
+                    trigrams[trigram].add(position)
+            for muscle in self._muscles[position]:
+                self._by_muscle[muscle].add(position)
+
+        self._postings = dict(postings)
+        self._vocabulary = sorted(postings)
+        self._trigrams = dict(trigrams)
+        self._results = OrderedDict()  # (search, muscle_group) -> ranked [(-score, position)]
+        self._lock = threading.Lock()
+
+    def _candidates(self, term):
+        """Positions that may contain ``term``: token prefix matches plus trigram matches."""
+        candidates = set()
+        start = bisect.bisect_left(self._vocabulary, term)
+        for token in self._vocabulary[start:]:
+            if not token.startswith(term):
+                break
+            candidates |= self._postings[token]
+        if len(term) >= 3:
+            grams = sorted(_trigrams(term), key=lambda gram: len(self._trigrams.get(gram, ())))
+            matches = set(self._trigrams.get(grams[0], ()))
+            for gram in grams[1:]:
+                if not matches:
+                    break
+                matches &= self._trigrams.get(gram, set())
+            candidates |= matches
+        return candidates
+
+    def _score_term(self, position, term):
+        name_tokens = _tokens(self._names[position])
+        if term in name_tokens:
+            return NAME_WORD
+        if any(token.startswith(term) for token in name_tokens):
+            return NAME_PREFIX
+        if term in self._names[position]:
+            return NAME_SUBSTRING
+
+        muscle_tokens = _tokens(" ".join(self._muscles[position]))
+        if term in muscle_tokens:
+            return MUSCLE_WORD
+        if any(token.startswith(term) for token in muscle_tokens):
+            return MUSCLE_PREFIX
+
+        if any(token.startswith(term) for token in _tokens(self._descriptions[position])):
+            return DESCRIPTION_PREFIX
+        if term in self._descriptions[position]:
+            return DESCRIPTION_SUBSTRING
+        return 0
+
+    def ranked(self, search=None, muscle_group=None):
+        """
+        All matches for a search, best first.
+
+        Returns:
+        --------
+        list of tuple
+            (-score, position) pairs in ranking order; shared, do not modify
+        """
+        search = " ".join(_tokens(search)) if search else ""
+        muscle_group = muscle_group.lower() if muscle_group else ""
+        key = (search, muscle_group)
+        with self._lock:
+            ranked = self._results.get(key)
+            if ranked is not None:
+                self._results.move_to_end(key)
+                return ranked
+
+        terms = search.split()
+        if terms:
+            positions = None
+            for term in sorted(set(terms), key=len, reverse=True):
+                candidates = self._candidates(term)
+                positions = candidates if positions is None else positions & candidates
+                if not positions:
+                    break
+        else:
+            positions = set(range(len(self._exercises)))
+        if muscle_group:
+            positions = positions & self._by_muscle.get(muscle_group, set())
+
+        ranked = []
+        for position in positions:
+            score = 0
+            for term in terms:
+                term_score = self._score_term(position, term)
+                if not term_score:
+                    break
+                score += term_score
+            else:
+                if search and self._names[position].startswith(search):
+                    score += NAME_STARTS_WITH_SEARCH
+                ranked.append((-score, position))
+        ranked.sort()
+
+        with self._lock:
+            self._results[key] = ranked
+            while len(self._results) > RESULT_CACHE_SIZE:
+                self._results.popitem(last=False)
+        return ranked
+
+    def page(self, user_id, number, search=None, muscle_group=None, cursor=None, offset=0):
+        """
+        One page of matches visible to a user.
+
+        Parameters:
+        -----------
+        user_id : int
+            User whose custom exercises are included
+        number : int
+            Page size
+        search : str, optional
+            Free-text search over names, muscles and descriptions
+        muscle_group : str, optional
+            Only exercises working this muscle
+        cursor : str, optional
+            ``next_cursor`` of the previous page; takes precedence over ``offset``
+        offset : int, optional
+            Visible matches to skip, for page-number clients
+
+        Returns:
+        --------
+        tuple
+            (exercises, next_cursor); next_cursor is None on the last page
+        """
+        ranked = self.ranked(search, muscle_group)
+        start = 0
+        if cursor:
+            start = bisect.bisect_right(ranked, self._decode_cursor(cursor))
+            offset = 0
+
+        page = []
+        last = None
+        has_more = False
+        for index in range(start, len(ranked)):
+            exercise = self._exercises[ranked[index][1]]
+            if not exercise.visible_to(user_id):
+                continue
+            if offset:
+                offset -= 1
+                continue
+            if len(page) == number:
+                has_more = True
+                break
+            page.append(exercise)
+            last = ranked[index]
+
+        next_cursor = self._encode_cursor(last) if has_more else None
+        return page, next_cursor
+
+    def _encode_cursor(self, key):
+        negative_score, position = key
+        raw = f"{negative_score}:{self._exercises[position].id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def _decode_cursor(self, cursor):
+        # Cursors carry the exercise id rather than its position so they survive catalogue reloads
+        try:
+            negative_score, exercise_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+            return int(negative_score), self._position[int(exercise_id)]
+        except (ValueError, KeyError, UnicodeError):
+            raise InvalidWorkoutDataError("Invalid or expired cursor, restart from the first page")
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """
+    Return the search index for the current catalogue snapshot, rebuilding it when the snapshot changes.
+
+    Returns:
+    --------
+    SearchIndex
+        Index over the latest catalogue
+    """
+    global _index
+    catalogue = exercise_catalogue.get_catalogue()
+    index = _index
+    if index is not None and index.catalogue is catalogue:
+        return index
+    with _index_lock:
+        if _index is None or _index.catalogue is not catalogue:
+            _index = SearchIndex(catalogue)
+            logger.info(f"Built exercise search index over {len(catalogue)} exercises")
+        return _index
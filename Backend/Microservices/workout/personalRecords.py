@@ -0,0 +1,315 @@
+"""
+Personal record (estimated one-rep max) engine for the workout service.
+
+Per-set 1RM estimates are computed with NumPy for a whole workout at once.
+Prior maxes for every affected (user, exercise) pair are fetched with one
+query, and only the improvements are written back in one bulk INSERT.
+
+The estimate formula is configurable through the ONE_RM_FORMULA environment
+variable or per call:
+    legacy   weight * reps ** 0.1 (the original GitFit estimate)
+    epley    weight * (1 + reps / 30)
+    brzycki  weight * 36 / (37 - reps), only defined below 37 reps
+For every formula a single rep is the weight itself.
+
+Running this module as a script backfills user_exercise_max from the full
+workout_exercises history:
+    python personalRecords.py --backfill [--formula epley] [--chunk-size 5000] [--user-id 42]
+"""
+
+import os
+import time
+import logging
+import argparse
+
+import numpy as np
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+import global_func
+from WorkoutExceptions import InvalidExerciseDataError
+from common import leaderboard_store
+
+logger = logging.getLogger(__name__)
+
+ONE_RM_FORMULA = os.getenv("ONE_RM_FORMULA", "legacy")
+BACKFILL_CHUNK_SIZE = 5000
+
+
+def _legacy(weights, reps):
+    return weights * np.power(reps, 0.1)
+
+
+def _epley(weights, reps):
+    return weights * (1.0 + reps / 30.0)
+
+
+def _brzycki(weights, reps):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(reps < 37, weights * 36.0 / (37.0 - reps), np.nan)
+
+
+FORMULAS = {
+    "legacy": _legacy,
+    "epley": _epley,
+    "brzycki": _brzycki,
+}
+
+
+def _formula(name):
+    name = (name or ONE_RM_FORMULA).lower()
+    if name not in FORMULAS:
+        raise InvalidExerciseDataError(f"Unknown 1RM formula '{name}'. Must be one of: {', '.join(FORMULAS)}")
+    return FORMULAS[name]
+
+
+def estimate_1rm(weights, reps, formula=None):
+    """
+    Estimate the one-rep max of every set.
+
+    Parameters:
+    -----------
+    weights : array-like of float
+        Weight lifted in each set
+    reps : array-like of int
+        Repetitions performed in each set
+    formula : str, optional
+        Formula name (defaults to ONE_RM_FORMULA)
+
+    Returns:
+    --------
+    numpy.ndarray
+        Estimates rounded to 2 decimals (the precision of user_exercise_max);
+        NaN for sets that cannot be scored (missing values, no reps, no weight)
+    """
+    weights = np.asarray(weights, dtype=float)
+    reps = np.asarray(reps, dtype=float)
+    with np.errstate(invalid="ignore"):
+        estimates = np.where(reps == 1, weights, _formula(formula)(weights, reps))
+        valid = np.isfinite(weights) & np.isfinite(reps) & (weights > 0) & (reps >= 1)
+    return np.round(np.where(valid, estimates, np.nan), 2)
+
+
+def _flatten_sets(entries):
+    """Flatten (group, weights, reps) entries into parallel per-set arrays."""
+    groups, weights, reps = [], [], []
+    for group, set_weights, set_reps in entries:
+        count = min(len(set_weights or []), len(set_reps or []))
+        groups.extend([group] * count)
+        weights.extend(set_weights[:count])
+        reps.extend(set_reps[:count])
+    return (np.asarray(groups, dtype=np.int64),
+            np.asarray(weights, dtype=float),
+            np.asarray(reps, dtype=float))
+
+
+def _best_by_group(entries, formula=None):
+    """
+    Score every set of every entry at once and keep the best set per group.
+
+    Returns parallel arrays (group, calculated_1rm, weight, reps), one element
+    per group that has at least one scorable set. Ties go to the earliest set.
+    """
+    groups, weights, reps = _flatten_sets(entries)
+    estimates = estimate_1rm(weights, reps, formula) if groups.size else np.empty(0)
+    scored = np.isfinite(estimates)
+    groups, weights, reps, estimates = groups[scored], weights[scored], reps[scored], estimates[scored]
+    if groups.size == 0:
+        return groups, estimates, weights, reps
+
+    # Sort by group, best estimate first; lexsort is stable so earlier sets win ties
+    order = np.lexsort((-estimates, groups))
+    first = np.unique(groups[order], return_index=True)[1]
+    best = order[first]
+    return groups[best], estimates[best], weights[best], reps[best]
+
+
+def best_sets(exercises, formula=None):
+    """
+    Find the best set of each exercise in one vectorised pass.
+
+    Parameters:
+    -----------
+    exercises : list of tuple
+        (exercise_id, weights, reps) per exercise entry; an exercise may appear more than once
+    formula : str, optional
+        Formula name (defaults to ONE_RM_FORMULA)
+
+    Returns:
+    --------
+    dict
+        exercise_id -> (calculated_1rm, weight, reps) for the highest estimate
+    """
+    exercise_ids, estimates, weights, reps = _best_by_group(exercises, formula)
+    return {
+        int(exercise_id): (float(estimate), float(weight), int(rep))
+        for exercise_id, estimate, weight, rep in zip(exercise_ids, estimates, weights, reps)
+    }
+
+
+def record_personal_records(cur, user_id, exercises, formula=None):
+    """
+    Insert a user_exercise_max row for every exercise whose best set beats the user's latest max.
+
+    Runs on the caller's cursor and does not commit.
+
+    Parameters:
+    -----------
+    cur : psycopg2.cursor
+        Cursor inside the caller's transaction
+    user_id : int
+        The user who performed the workout
+    exercises : list of tuple
+        (exercise_id, weights, reps) per exercise entry
+    formula : str, optional
+        Formula name (defaults to ONE_RM_FORMULA)
+
+    Returns:
+    --------
+    list of tuple
+        (exercise_id, calculated_1rm, weight, reps) for every new record
+    """
+    best = best_sets(exercises, formula)
+    if not best:
+        return []
+
+    # Latest stored max of every affected exercise, in one round trip
+    previousQuery = sql.SQL("""
+        SELECT DISTINCT ON (exercise_id) exercise_id, calculated_1rm
+        FROM user_exercise_max
+        WHERE user_id = %s AND exercise_id = ANY(%s)
+        ORDER BY exercise_id, date_performed DESC
+    """)
+    cur.execute(previousQuery, (user_id, list(best)))
+    previous = {row[0]: float(row[1]) for row in cur.fetchall()}
+
+    improved = [
+        (exercise_id, estimate, weight, reps)
+        for exercise_id, (estimate, weight, reps) in best.items()
+        if estimate > previous.get(exercise_id, 0)
+    ]
+
+    if improved:
+        insertQuery = sql.SQL("""
+            INSERT INTO user_exercise_max (user_id, exercise_id, calculated_1rm, weight_actual, reps_actual)
+            VALUES %s
+        """)
+        execute_values(cur, insertQuery.as_string(cur),
+                       [(user_id, exercise_id, estimate, weight, reps) for exercise_id, estimate, weight, reps in improved])
+
+    logger.info(f"Stored {len(improved)} new maxes for user {user_id} out of {len(best)} exercises")
+    return improved
+
+
+def backfill_personal_records(conn, formula=None, chunk_size=BACKFILL_CHUNK_SIZE, user_id=None):
+    """
+    Rebuild user_exercise_max from the full workout_exercises history.
+
+    Existing rows (for one user, or everyone) are deleted, then the history is
+    replayed in id order, ``chunk_size`` workout_exercises rows at a time. Each
+    time an exercise's running best improves, a row is inserted dated at the
+    workout_exercises row that set it. Everything happens in one transaction,
+    so a failed backfill leaves the table untouched.
+
+    Parameters:
+    -----------
+    conn : psycopg2.connection
+        Database connection
+    formula : str, optional
+        Formula name (defaults to ONE_RM_FORMULA)
+    chunk_size : int, optional
+        Number of workout_exercises rows fetched per round trip
+    user_id : int, optional
+        Restrict the backfill to one user
+
+    Returns:
+    --------
+    dict
+        Number of history rows scanned and records written
+    """
+    _formula(formula)  # fail fast on an unknown formula
+    start_time = time.time()
+
+    historyQuery = sql.SQL("""
+        SELECT we.id, w.user_id, we.exercise_id, (we.sets).weight, (we.sets).reps, we.date_performed
+        FROM workout_exercises we
+        JOIN workouts w ON w.id = we.workout_id
+        WHERE we.id > %s AND we.exercise_id IS NOT NULL {user_filter}
+        ORDER BY we.id
+        LIMIT %s
+    """).format(user_filter=sql.SQL("AND w.user_id = %s") if user_id is not None else sql.SQL(""))
+    insertQuery = sql.SQL("""
+        INSERT INTO user_exercise_max (user_id, exercise_id, calculated_1rm, weight_actual, reps_actual, date_performed)
+        VALUES %s
+    """)
+
+    cur = conn.cursor()
+    try:
+        if user_id is None:
+            cur.execute("DELETE FROM user_exercise_max")
+        else:
+            cur.execute("DELETE FROM user_exercise_max WHERE user_id = %s", (user_id,))
+
+        running_max = {}  # (user_id, exercise_id) -> best estimate so far
+        last_id = 0
+        scanned = 0
+        written = 0
+
+        while True:
+            params = (last_id, user_id, chunk_size) if user_id is not None else (last_id, chunk_size)
+            cur.execute(historyQuery, params)
+            rows = cur.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            scanned += len(rows)
+
+            # Score the whole chunk at once: best set of every workout_exercises row
+            positions, estimates, weights, reps = _best_by_group(
+                [(position, row[3], row[4]) for position, row in enumerate(rows)], formula)
+
+            # Replay in history order; a record is written whenever the running best improves
+            records = []
+            for position, estimate, weight, rep in zip(positions, estimates, weights, reps):
+                _, row_user, exercise_id, _, _, performed = rows[position]
+                pair = (row_user, exercise_id)
+                if estimate > running_max.get(pair, 0):
+                    running_max[pair] = float(estimate)
+                    records.append((row_user, exercise_id, float(estimate), float(weight), int(rep), performed))
+
+            if records:
+                execute_values(cur, insertQuery.as_string(cur), records, page_size=1000)
+                written += len(records)
+            logger.info(f"Backfill processed {scanned} workout_exercises rows, {written} records so far")
+
+        # Every service rebuilds its 1RM leaderboards once the new history is committed
+        leaderboard_store.publish_change(cur, user_id, "1rm")
+        conn.commit()
+        logger.info(f"Backfill finished in {time.time() - start_time:.2f}s: {scanned} rows scanned, {written} records written")
+        return {"scanned": scanned, "written": written}
+
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="GitFit personal record engine")
+    parser.add_argument("--backfill", action="store_true", help="rebuild user_exercise_max from workout history")
+    parser.add_argument("--formula", choices=sorted(FORMULAS), default=None, help="1RM estimate formula")
+    parser.add_argument("--chunk-size", type=int, default=BACKFILL_CHUNK_SIZE, help="history rows per round trip")
+    parser.add_argument("--user-id", type=int, default=None, help="only backfill this user")
+    args = parser.parse_args()
+
+    if not args.backfill:
+        parser.error("nothing to do, pass --backfill")
+
+    conn = global_func.getConnection()
+    try:
+        backfill_personal_records(conn, formula=args.formula, chunk_size=args.chunk_size, user_id=args.user_id)
+    finally:
+        conn.close()
@@ -8,21 +8,19 @@ import global_func
 from workoutClass import Workout
 from heuristic import main
 from WorkoutExceptions import *
+from common import log_setup, query_stats
 import base64
 import time
 import uuid
 import json
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG, 
-                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                   handlers=[
-                       logging.FileHandler("workout_api.log"),
-                       logging.StreamHandler()
-                   ])
+# INFO is what the service effectively ran at (workoutClass configured logging first)
+log_setup.configure("workout", "workout_api.log", logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+query_stats.init_app(app, "workout")
 app.register_blueprint(main)
 
 # Request logger middleware
@@ -32,7 +30,9 @@ def before_request():
     request.request_id = str(uuid.uuid4())
     request.start_time = time.time()
     logger.info(f"Request {request.request_id}: {request.method} {request.path} - Started")
-    logger.debug(f"Request {request.request_id}: Headers: {dict(request.headers)}")
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    logger.debug("Request %s: Headers: %s", request.request_id, dict(request.headers))
     #if request.is_json:
         # Log JSON payloads without sensitive data
     #    safe_data = request.get_json(silent=True)
@@ -44,7 +44,7 @@ def before_request():
         safe_args = request.args.copy()
         if "key" in safe_args:
             safe_args["key"] = "***REDACTED***"
-        logger.debug(f"Request {request.request_id}: Query parameters: {safe_args}")
+        logger.debug("Request %s: Query parameters: %s", request.request_id, safe_args)
 
 @app.after_request
 def after_request(response):
@@ -482,6 +482,9 @@ def getExercises():
             search_query = request.args.get('search')
             logger.debug(f"Request {request_id}: Search query: {search_query or 'none'}")
             
+            # Keyset cursor from the previous page; takes precedence over page
+            cursor = request.args.get('cursor')
+            
             logger.info(f"Request {request_id}: Getting exercises with parameters - number: {number}, muscle_group: {muscle_group}, page: {page}, search: {search_query}")
             
         except Exception as e:
@@ -493,7 +496,7 @@ def getExercises():
         logger.debug(f"Request {request_id}: Fetching exercises from database")
         
         try:
-            exercises, next_page = workout.get_exercises(number, muscle_group, page, search_query)
+            exercises, next_page, next_cursor = workout.get_exercises(number, muscle_group, page, search_query, cursor)
             exercise_count = len(exercises) if exercises else 0
             
             logger.info(f"Request {request_id}: Successfully retrieved {exercise_count} exercises, next page: {next_page}")
@@ -503,8 +506,10 @@ def getExercises():
                 logger.debug(f"Request {request_id}: First few exercise names: {', '.join([ex.get('name', 'unnamed') for ex in exercises[:3]])}...")
                 
                 
-            return jsonify({"exercises": exercises, "page": next_page}), 200
+            return jsonify({"exercises": exercises, "page": next_page, "next_cursor": next_cursor}), 200
             
+        except WorkoutException:
+            raise
         except Exception as e:
             logger.error(f"Request {request_id}: Database error retrieving exercises: {str(e)}")
             raise DatabaseError(f"Error retrieving exercises: {str(e)}")
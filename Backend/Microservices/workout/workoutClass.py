@@ -1,19 +1,18 @@
 from psycopg2 import sql
+from psycopg2.extras import execute_values
 import psycopg2
 import logging
 import random
 import string
 import datetime
+import traceback
 import global_func
+import personalRecords
+import exerciseSearch
+from common import exercise_catalogue, leaderboard_store
 from WorkoutExceptions import *
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, 
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                    handlers=[
-                        logging.FileHandler("workout_service.log"),
-                        logging.StreamHandler()
-                    ])
+# Handlers are set up by the service (common.log_setup)
 logger = logging.getLogger(__name__)
 
 class Workout():
@@ -88,36 +87,19 @@ class Workout():
         QueryError : If database query fails
         """
         try:
-            should_close_conn = False
-            if not conn:
-                conn = global_func.getConnection()
-                should_close_conn = True
-                
-            cur = conn.cursor()
-            getUserIdQuery = sql.SQL("SELECT id FROM users WHERE key = %s")
+            # verify_key goes through the shared API key cache before the database
+            user_id = global_func.verify_key(self.key, conn)
             
-            try:
-                cur.execute(getUserIdQuery, (self.key,))
-                result = cur.fetchone()
-                
-                if not result:
-                    raise InvalidTokenError("Invalid authentication key")
-                    
-                self.user_id = result[0]
+            if not user_id:
+                raise InvalidTokenError("Invalid authentication key")
                 
-            except psycopg2.Error as e:
-                logger.error(f"Database error while getting user ID: {str(e)}")
-                raise QueryError(f"Failed to get user ID: {str(e)}")
+            self.user_id = user_id
                 
+        except (ConnectionError, InvalidTokenError, QueryError):
+            raise
         except Exception as e:
-            if not isinstance(e, (ConnectionError, InvalidTokenError, QueryError)):
-                logger.error(f"Unexpected error in _get_user_id_from_key: {str(e)}")
-                raise WorkoutException(f"Error retrieving user from key: {str(e)}")
-        finally:
-            if 'cur' in locals() and cur:
-                cur.close()
-            if should_close_conn and 'conn' in locals() and conn:
-                conn.close()
+            logger.error(f"Unexpected error in _get_user_id_from_key: {str(e)}")
+            raise WorkoutException(f"Error retrieving user from key: {str(e)}")
                 
     def updateUserActivity(self, workout = False, conn = None):
         """
@@ -156,11 +138,12 @@ class Workout():
             logger.debug(f"Executing query to fetch user activity for ID {self.user_id}")
             cur.execute(query, (self.user_id,))
             result = cur.fetchone()
+            last_login = None
             
             if result:
-                last_login = datetime.strptime(result[0], "%Y-%m-%d").date() if result[0] else None
+                last_login = datetime.datetime.strptime(result[0], "%Y-%m-%d").date() if result[0] else None
                 day_streak = result[1]
-                last_workout = datetime.strptime(result[2], "%Y-%m-%d").date() if result[2] else None
+                last_workout = datetime.datetime.strptime(result[2], "%Y-%m-%d").date() if result[2] else None
                 logger.info(f"Successfully fetched user activity for ID {self.user_id}")
             else:
                 logger.warning(f"No user found with ID {self.user_id}")
@@ -169,17 +152,17 @@ class Workout():
             if last_login is None:
                 updateQuery = sql.SQL("""INSERT INTO user_engagement (user_id, last_login, day_streak, last_workout) VALUES (%s, %s, %s, NULL)""")
             
-            if last_login and last_login == datetime.now().date():
+            if last_login and last_login == datetime.date.today():
                 # Already logged in today, no need to update streak
                 updateQuery = sql.SQL("""UPDATE user_engagement SET last_login = CURRENT_TIMESTAMP WHERE user_id = %s""")
                 # Execute with just user_id
                 cur.execute(updateQuery, (self.user_id,))
-            elif last_login and (datetime.now().date() - last_login).days == 1:
+            elif last_login and (datetime.date.today() - last_login).days == 1:
                 # Consecutive day, increment streak
                 day_streak += 1
                 updateQuery = sql.SQL("""UPDATE user_engagement SET last_login = CURRENT_TIMESTAMP, day_streak = %s WHERE user_id = %s""")
                 cur.execute(updateQuery, (day_streak, self.user_id))
-            elif last_login and (datetime.now().date() - last_login).days >= 2:
+            elif last_login and (datetime.date.today() - last_login).days >= 2:
                 # Not consecutive, reset streak
                 day_streak = 1
                 updateQuery = sql.SQL("""UPDATE user_engagement SET last_login = CURRENT_TIMESTAMP, day_streak = %s WHERE user_id = %s""")
@@ -321,11 +304,16 @@ class Workout():
                 
                 if result:
                     self.id = result[0]
-                    conn.commit()
+                    
+                    # The workout row, its exercises/cardio details and any new maxes
+                    # are written in one transaction and committed once
                     if self.workout_type == "strength":
                         self.__add_exercise__(conn)
+                        leaderboard_store.publish_change(cur, self.user_id, "workouts", "weight", "1rm")
                     else:
                         self.__add_cardio__(conn)
+                        leaderboard_store.publish_change(cur, self.user_id, "workouts", "pace")
+                    conn.commit()
                     
                     logger.info(f"Created workout: ID={self.id}, Name={self.name}, Type={self.workout_type}")
                     self.updateUserActivity(workout=True, conn=conn)
@@ -337,18 +325,21 @@ class Workout():
                 conn.rollback()
                 raise WorkoutAlreadyExistsError()
                 
-            except (psycopg2.Error, QueryError, WorkoutAlreadyExistsError) as e:
-                if isinstance(e, psycopg2.Error):
-                    conn.rollback()
-                    logger.error(f"Database error: {str(e)}")
-                    raise QueryError(f"Error creating workout: {str(e)}")
+            except psycopg2.Error as e:
+                conn.rollback()
+                logger.error(f"Database error: {str(e)}")
+                raise QueryError(f"Error creating workout: {str(e)}")
+                
+            except WorkoutException:
+                # Nothing from a failed ingestion may be left behind
+                conn.rollback()
                 raise
                 
+        except WorkoutException:
+            raise
         except Exception as e:
-            if not isinstance(e, (MissingRequiredFieldError, ConnectionError, 
-                                  WorkoutAlreadyExistsError, QueryError)):
-                logger.error(f"Unexpected error in create_workout: {str(e)}")
-                raise WorkoutException(f"Error creating workout: {str(e)}")
+            logger.error(f"Unexpected error in create_workout: {str(e)}")
+            raise WorkoutException(f"Error creating workout: {str(e)}")
         finally:
             if 'cur' in locals() and cur:
                 cur.close()
@@ -479,7 +470,12 @@ class Workout():
     
     def __add_exercise__(self, conn=None):
         """
-        Add an exercise to a workout.
+        Add the workout's exercises to the database in bulk.
+        
+        All exercise ids are validated with a single query, every
+        workout_exercises row is written with one multi-row INSERT and new
+        maxes are computed with one set-based statement. When a connection is
+        passed in, nothing is committed so the caller controls the transaction.
         
         Parameters:
         -----------
@@ -491,6 +487,7 @@ class Workout():
         MissingRequiredFieldError : If required fields are missing
         WorkoutNotFoundException : If workout is not found
         ExerciseNotFoundException : If exercise is not found
+        InvalidExerciseDataError : If an exercise entry is malformed
         ConnectionError : If database connection fails
         QueryError : If database query fails
         """
@@ -503,10 +500,31 @@ class Workout():
             logger.error(f"Missing required fields: {', '.join(missing_fields)}")
             raise MissingRequiredFieldError(', '.join(missing_fields))
         
+        if not self.exercises:
+            logger.info(f"No exercises to add to workout {self.id}")
+            return
+        
+        try:
+            rows = [(
+                self.id,
+                exercise['exerciseID'],
+                exercise['reps'],
+                exercise['setType'],
+                exercise['weight'],
+                exercise['percievedDifficulty'],
+                exercise['superset'],
+                exercise['order_exercise'],
+                exercise['notes']
+            ) for exercise in self.exercises]
+        except (KeyError, TypeError) as e:
+            logger.error(f"Malformed exercise entry for workout {self.id}: {str(e)}")
+            raise InvalidExerciseDataError(f"Malformed exercise entry: missing {str(e)}")
+        
         addExerciseQuery = sql.SQL("""
             INSERT INTO workout_exercises (workout_id, exercise_id, sets, order_exercise, notes)
-            VALUES (%s, %s, ROW(%s, %s::type_set_type[], %s, %s, %s), %s, %s)
-        """) #Figure out which is type_set_type for casting
+            VALUES %s
+        """)
+        addExerciseTemplate = "(%s, %s, ROW(%s, %s::type_set_type[], %s, %s, %s), %s, %s)"
         
         try:
             should_close_conn = False
@@ -517,54 +535,40 @@ class Workout():
             cur = conn.cursor()
             
             try:
-                # Check if workout exists
-                cur.execute(sql.SQL("SELECT id FROM workouts WHERE id = %s"), (self.id,))
-                if not cur.fetchone():
-                    raise WorkoutNotFoundException()
-                
-                for exercise in self.exercises:
-                    # Check if exercise exists
-                    exID = exercise['exerciseID']
-                    
-                    cur.execute(sql.SQL("SELECT id FROM exercises WHERE id = %s"), (exID,))
+                if should_close_conn:
+                    # Standalone call: the workout must already exist
+                    # (create_workout inserts it in the same transaction)
+                    cur.execute(sql.SQL("SELECT id FROM workouts WHERE id = %s"), (self.id,))
                     if not cur.fetchone():
-                        raise ExerciseNotFoundException()
-                    
-                    exercise_id = exID
-                    weight = exercise['weight']
-                    reps = exercise['reps']
-                    type_set = exercise['setType']
-                    order_exercise = exercise['order_exercise']
-                    percieved_difficulty = exercise['percievedDifficulty']
-                    super_set = exercise['superset']
-                    notes = exercise['notes']
-                
-                    cur.execute(addExerciseQuery, (
-                        self.id, 
-                        exercise_id, 
-                        reps,
-                        type_set,
-                        weight,
-                        percieved_difficulty,
-                        super_set,
-                        order_exercise,
-                        notes
-                    ))#Fix query
+                        raise WorkoutNotFoundException()
+                
+                # Validate every exercise id in one round trip
+                exercise_ids = list({row[1] for row in rows})
+                cur.execute(sql.SQL("SELECT id FROM exercises WHERE id = ANY(%s)"), (exercise_ids,))
+                found_ids = {row[0] for row in cur.fetchall()}
+                unknown_ids = [exercise_id for exercise_id in exercise_ids if exercise_id not in found_ids]
+                if unknown_ids:
+                    logger.warning(f"Unknown exercise ids for workout {self.id}: {unknown_ids}")
+                    raise ExerciseNotFoundException(f"Exercise not found: {', '.join(str(i) for i in unknown_ids)}")
+                
+                execute_values(cur, addExerciseQuery.as_string(cur), rows, template=addExerciseTemplate)
+                logger.info(f"Added {len(rows)} exercises to workout {self.id}")
+                
+                self.__calculate_max__(cur)
+                
+                if should_close_conn:
                     conn.commit()
-                    logger.info(f"Added exercise {exID} to workout {self.id}")
-                    
-                    self.__calculate_max__(exercise, conn)
                 
             except psycopg2.Error as e:
                 conn.rollback()
                 logger.error(f"Database error: {str(e)}")
                 raise QueryError(f"Error adding exercise: {str(e)}")
                 
+        except WorkoutException:
+            raise
         except Exception as e:
-            if not isinstance(e, (WorkoutNotFoundException, ExerciseNotFoundException,
-                                  MissingRequiredFieldError, ConnectionError, QueryError)):
-                logger.error(f"Unexpected error in add_exercise: {str(e)}")
-                raise WorkoutException(f"Error adding exercise: {str(e)}")
+            logger.error(f"Unexpected error in add_exercise: {str(e)}")
+            raise WorkoutException(f"Error adding exercise: {str(e)}")
         finally:
             if 'cur' in locals() and cur:
                 cur.close()
@@ -602,7 +606,7 @@ class Workout():
             raise MissingRequiredFieldError(', '.join(missing_fields))
             
         # Ensure this is a cardio workout
-        if self.workout_type != "Cardio":
+        if self.workout_type.lower() != "cardio":
             logger.error(f"Cannot add cardio to non-cardio workout type: {self.workout_type}")
             raise InvalidWorkoutDataError("Can only add cardio details to workouts of type 'Cardio'")
         
@@ -620,10 +624,11 @@ class Workout():
             cur = conn.cursor()
             
             try:
-                # Check if workout exists
-                cur.execute("SELECT id FROM workouts WHERE id = %s", (self.id,))
-                if not cur.fetchone():
-                    raise WorkoutNotFoundException()
+                if should_close_conn:
+                    # Standalone call: the workout must already exist
+                    cur.execute("SELECT id FROM workouts WHERE id = %s", (self.id,))
+                    if not cur.fetchone():
+                        raise WorkoutNotFoundException()
                 
                 # Add difficulty level if not provided
                 percieved_difficulty = getattr(self, 'cardiopd', 3)  # Default to moderate
@@ -632,7 +637,8 @@ class Workout():
                 distance = self.distance if self.distance is not None else 0
                 
                 cur.execute(addCardioQuery, (self.id, self.duration, distance, percieved_difficulty))
-                conn.commit()
+                if should_close_conn:
+                    conn.commit()
                 logger.info(f"Added cardio details to workout {self.id}")
                 
             except psycopg2.Error as e:
@@ -640,11 +646,11 @@ class Workout():
                 logger.error(f"Database error: {str(e)}")
                 raise QueryError(f"Error adding cardio details: {str(e)}")
                 
+        except WorkoutException:
+            raise
         except Exception as e:
-            if not isinstance(e, (WorkoutNotFoundException, InvalidWorkoutDataError,
-                                 MissingRequiredFieldError, ConnectionError, QueryError)):
-                logger.error(f"Unexpected error in add_cardio: {str(e)}")
-                raise WorkoutException(f"Error adding cardio details: {str(e)}")
+            logger.error(f"Unexpected error in add_cardio: {str(e)}")
+            raise WorkoutException(f"Error adding cardio details: {str(e)}")
         finally:
             if 'cur' in locals() and cur:
                 cur.close()
@@ -680,7 +686,7 @@ class Workout():
                 logger.error(f"Access denied: User {self.user_id} doesn't own workout {self.id}")
                 raise UserAccessDeniedError()
         
-        deleteWorkoutQuery = sql.SQL("DELETE FROM workouts WHERE id = %s")
+        deleteWorkoutQuery = sql.SQL("DELETE FROM workouts WHERE id = %s RETURNING user_id")
         
         try:
             should_close_conn = False
@@ -699,10 +705,12 @@ class Workout():
                 cur.execute(deleteWorkoutQuery, (self.id,))
                 
                 # Check if any row was deleted
-                if cur.rowcount == 0:
+                deleted = cur.fetchone()
+                if deleted is None:
                     conn.rollback()
                     raise WorkoutNotFoundException()
                 
+                leaderboard_store.publish_change(cur, deleted[0], "workouts", "weight", "pace")
                 conn.commit()
                 logger.info(f"Deleted workout: ID={self.id}")
                 
@@ -793,186 +801,81 @@ class Workout():
             if should_close_conn and 'conn' in locals() and conn:
                 conn.close()
                 
-    def __calculate_max__(self, exercise, conn=None):
+    def __calculate_max__(self, cur):
         """
-        Calculate and store the maximum weight lifted for an exercise.
+        Record new estimated one-rep maxes for every exercise in this workout.
+        
+        Per-set estimates for the whole workout are computed in one vectorised
+        pass, the user's previous maxes are fetched with one query and only the
+        improvements are inserted (see personalRecords).
         
         Parameters:
         -----------
-        conn : psycopg2.connection, optional
-            Database connection
+        cur : psycopg2.cursor
+            Cursor inside the ingestion transaction
             
         Raises:
         -------
-        ConnectionError : If database connection fails
-        QueryError : If database query fails
+        psycopg2.Error : If a statement fails (handled by the caller)
         """
-        
-        exercise_id = exercise['exerciseID']
-        
-        # Calculate the maximum weight lifted for an exercise
-        getMaxQuery = sql.SQL("""
-            SELECT calculated_1rm, weight_actual, reps_actual
-            FROM user_exercise_max
-            WHERE exercise_id = %s AND user_id = %s
-            ORDER BY date_performed DESC
-            LIMIT 1
-        """)
-        
-        try:
-            should_close_conn = False
-            if not conn:
-                conn = global_func.getConnection()
-                should_close_conn = True
-                
-            cur = conn.cursor()
-            
-            try:
-                cur.execute(getMaxQuery, (exercise_id, self.user_id))
-                found = cur.fetchone()
-                if found is None:
-                    logger.info(f"No max weight found for exercise {exercise_id}")
-                    max_weight = 0
-                    weight_actual = 0
-                    reps_actual = 0
-                else:
-                    logger.info(f"Max weight found for exercise {exercise_id} for user {self.user_id}")
-                    max_weight = found[0]
-                    weight_actual = found[1]
-                    reps_actual = found[2]
-                
-                changed = False
-                for i in range (0, len(exercise["reps"])):
-                    
-                    if exercise["reps"][i] == 1:
-                        calculated_1rm = exercise["weight"][i]
-                    else:
-                        calculated_1rm = exercise["weight"][i] * (exercise["reps"][i] ** 0.1)
-                        
-                    if calculated_1rm > max_weight:
-                        changed = True
-                        max_weight = calculated_1rm
-                        weight_actual = exercise["weight"][i]
-                        reps_actual = exercise["reps"][i]
-                
-                if changed:
-                    newMaxQuery = sql.SQL("""
-                        INSERT INTO user_exercise_max (user_id, exercise_id, calculated_1rm, weight_actual, reps_actual)
-                        VALUES (%s, %s, %s, %s, %s)
-                    """)
-                    cur.execute(newMaxQuery, (self.user_id, exercise_id, max_weight, weight_actual, reps_actual))
-                    conn.commit()
-                
-                    logger.info(f"Calculated new max for {self.user_id} and stored max weight for exercise {exercise_id}")
-                
-            except psycopg2.Error as e:
-                conn.rollback()
-                logger.error(f"Database error: {str(e)}")
-                raise QueryError(f"Error calculating max weight: {str(e)}")
-                
-        except Exception as e:
-            if not isinstance(e, (ConnectionError, QueryError)):
-                logger.error(f"Unexpected error in __calculate_max__: {str(e)}")
-                raise WorkoutException(f"Error calculating max weight: {str(e)}")
-        finally:
-            if 'cur' in locals() and cur:
-                cur.close()
-            if should_close_conn and 'conn' in locals() and conn:
-                conn.close()
+        performed = [(exercise['exerciseID'], exercise['weight'], exercise['reps']) for exercise in self.exercises]
+        records = personalRecords.record_personal_records(cur, self.user_id, performed)
+        for exercise_id, calculated_1rm, weight, reps in records:
+            logger.info(f"New max for user {self.user_id} on exercise {exercise_id}: {calculated_1rm} ({weight} x {reps})")
     
-    def get_exercises(self, number=50, muscle_group=None, page=0, search_query=None):
-        """Get exercises from the database."""
-        try:
-            conn = global_func.getConnection()
-            cur = conn.cursor()
-            
-            # Base query parts
-            select_part = """
-                SELECT id, name, primary_muscle, secondary_muscles, description
-                FROM exercises
-                WHERE is_deleted = FALSE
-            """
-            
-            # Parameters for the query
-            params = []
-            
-            # Add user filter
-            user_filter = "AND (createdby IS NULL OR createdby = %s)"
-            params.append(self.user_id)
-            
-            # Add search filter if provided
-            search_filter = ""
-            if search_query:
-                search_query = search_query.strip().lower()  # Normalize search query
-                search_pattern = f"%{search_query}%"
-                search_filter = "AND (LOWER(name) LIKE %s OR LOWER(description) LIKE %s)"
-                params.extend([search_pattern, search_pattern])
-            
-            # Add muscle group filter if provided
-            muscle_filter = ""
-            if muscle_group:
-                # More flexible muscle group matching
-                muscle_filter = "AND (LOWER(%s)::text = ANY(SELECT LOWER(m::text) FROM unnest(primary_muscle) m) OR LOWER(%s)::text = ANY(SELECT LOWER(m::text) FROM unnest(secondary_muscles) m))"
-                params.extend([muscle_group.lower(), muscle_group.lower()])
-            
-            # Complete query
-            query = f"""{select_part} {user_filter} {search_filter} {muscle_filter}
-                       ORDER BY name
-                       LIMIT %s OFFSET %s"""
-            params.extend([number, page * number])
-            
-            # Execute query
-            cur.execute(sql.SQL(query), params)
-            
-            # Process results
-            exercises = []
-            for row in cur.fetchall():
-                # Convert primary_muscle to array format for frontend
-                primary = row[2]
-                if primary and isinstance(primary, str):
-                    # Handle string format like '{muscle}' by extracting 'muscle'
-                    if primary.startswith('{') and primary.endswith('}'):
-                        primary = primary[1:-1].split(',')
-                        primary = [p.strip().replace('"', '').replace("'", "") for p in primary]
-                    else:
-                        primary = [primary]
-                elif primary is None:
-                    primary = []
-                    
-                # Convert secondary_muscle to array format for frontend
-                secondary = row[3]
-                if secondary and isinstance(secondary, str):
-                    if secondary.startswith('{') and secondary.endswith('}'):
-                        secondary = secondary[1:-1].split(',')
-                        secondary = [s.strip().replace('"', '').replace("'", "") for s in secondary]
-                    else:
-                        secondary = [secondary]
-                elif secondary is None:
-                    secondary = []
-                    
-                exercises.append({
-                    "id": row[0],
-                    "name": row[1],
-                    "primary_muscle": primary,
-                    "secondary_muscle": secondary,
-                    "description": row[4]
-                })
+    def get_exercises(self, number=50, muscle_group=None, page=0, search_query=None, cursor=None):
+        """
+        Search the exercise catalogue, best matches first.
+        
+        Parameters:
+        -----------
+        number : int, optional
+            Page size
+        muscle_group : str, optional
+            Only exercises working this muscle
+        page : int, optional
+            Page number, used when no cursor is given
+        search_query : str, optional
+            Free-text search over names, muscles and descriptions
+        cursor : str, optional
+            next_cursor from the previous page
             
-            logger.info(f"Retrieved {len(exercises)} exercises")
-            return exercises, page+1
+        Returns:
+        --------
+        tuple
+            (exercises, next page number, next_cursor or None on the last page)
             
-        except Exception as e:
-            logger.error(f"Error in get_exercises: {str(e)}")
-            raise
-        finally:
-            if 'cur' in locals() and cur:
-                cur.close()
-            if 'conn' in locals() and conn:
-                conn.close()
+        Raises:
+        -------
+        ConnectionError : If the catalogue cannot be loaded
+        InvalidWorkoutDataError : If the cursor is invalid
+        """
+        try:
+            index = exerciseSearch.get_index()
+        except psycopg2.Error as e:
+            logger.error(f"Error loading exercise catalogue: {str(e)}")
+            raise ConnectionError(f"Error loading exercise catalogue: {str(e)}")
+        
+        matches, next_cursor = index.page(self.user_id, number, search_query, muscle_group,
+                                          cursor=cursor, offset=page * number)
+        
+        exercises = [
+            {
+                "id": exercise.id,
+                "name": exercise.name,
+                "primary_muscle": list(exercise.primary_muscles),
+                "secondary_muscle": list(exercise.secondary_muscles),
+                "description": exercise.description
+            }
+            for exercise in matches
+        ]
+        
+        logger.info(f"Retrieved {len(exercises)} exercises")
+        return exercises, page+1, next_cursor
     
     def get_muscles(self):
         """
-        Get all muscle groups from the database.
+        Get all muscle groups from the exercise catalogue.
         
         Returns:
         --------
@@ -981,35 +884,19 @@ class Workout():
             
         Raises:
         -------
-        ConnectionError : If database connection fails
-        QueryError : If database query fails
+        ConnectionError : If the catalogue cannot be loaded
         """
-        getMusclesQuery = sql.SQL("""
-            SELECT DISTINCT unnest(primary_muscle) AS muscle
-            FROM exercises
-            WHERE is_deleted = FALSE
-            AND (createdby IS NULL OR createdby = %s)
-        """)
-        
         try:
-            conn = global_func.getConnection()
-            cur = conn.cursor()
-            
-            cur.execute(getMusclesQuery, (self.user_id,))
-            muscles = [row[0] for row in cur.fetchall()]
-            
-            logger.info(f"Retrieved {len(muscles)} unique muscle groups")
-            return muscles
-            
+            catalogue = exercise_catalogue.get_catalogue()
         except psycopg2.Error as e:
-            logger.error(f"Database error: {str(e)}")
-            raise QueryError(f"Error retrieving muscle groups: {str(e)}")
-        except Exception as e:
-            logger.error(f"Unexpected error in get_muscles: {str(e)}")
-            raise WorkoutException(f"Error retrieving muscle groups: {str(e)}")
-        finally:
-            if 'cur' in locals() and cur:
-                cur.close()
-            if 'conn' in locals() and conn:
-                conn.close()
-
+            logger.error(f"Error loading exercise catalogue: {str(e)}")
+            raise ConnectionError(f"Error loading exercise catalogue: {str(e)}")
+        
+        muscles = list(dict.fromkeys(
+            muscle
+            for exercise in catalogue if exercise.visible_to(self.user_id)
+            for muscle in exercise.primary_muscles
+        ))
+        
+        logger.info(f"Retrieved {len(muscles)} unique muscle groups")
+        return muscles
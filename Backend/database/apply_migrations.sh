@@ -0,0 +1,9 @@
+#!/bin/bash
+# Runs from /docker-entrypoint-initdb.d after the schema dump, so a fresh
+# database starts with every migration applied. Existing databases are
+# migrated with migrate.py instead.
+set -e
+
+for migration in /migrations/*.sql; do
+    psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" -f "$migration"
+done
@@ -0,0 +1,10 @@
+-- Bookkeeping for the versioned migrations in this directory.
+-- Every migration records its version here as its last statement, so the
+-- files can be applied by migrate.py or by psql alike and re-running one is a no-op.
+
+CREATE TABLE IF NOT EXISTS public.schema_migrations (
+    version character varying(20) PRIMARY KEY,
+    applied_at timestamp without time zone DEFAULT CURRENT_TIMESTAMP NOT NULL
+);
+
+INSERT INTO public.schema_migrations (version) VALUES ('0000') ON CONFLICT DO NOTHING;
@@ -0,0 +1,27 @@
+-- Workout history lookups (workout service, user activities, AI user context, family feed).
+
+-- A user's workouts newest first: getUserActivities, getUserWorkouts, the latest
+-- workout in the AI user context and the family feed's DISTINCT ON (user_id).
+-- The included columns let the listings run as index-only scans.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS workouts_user_id_workout_date_idx
+    ON public.workouts (user_id, workout_date DESC) INCLUDE (id, name, workout_type);
+
+-- Everyone's workouts in a date window: the workouts, weight and pace leaderboards.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS workouts_workout_date_idx
+    ON public.workouts (workout_date) INCLUDE (user_id);
+
+-- Exercises of a workout, in order: workout details, the AI user context and
+-- the cascade when a workout is deleted.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS workout_exercises_workout_id_idx
+    ON public.workout_exercises (workout_id) INCLUDE (exercise_id, order_exercise);
+
+-- Workouts containing an exercise: the weight leaderboard filtered by exercise
+-- and the SET NULL when an exercise is deleted.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS workout_exercises_exercise_id_idx
+    ON public.workout_exercises (exercise_id) INCLUDE (workout_id);
+
+-- Cardio details of a workout; duration and distance are what the pace leaderboard reads.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS workout_cardio_workout_id_idx
+    ON public.workout_cardio (workout_id) INCLUDE (duration, distance);
+
+INSERT INTO public.schema_migrations (version) VALUES ('0001') ON CONFLICT DO NOTHING;
@@ -0,0 +1,44 @@
+-- Latest-row lookups on a user's stats, goals, engagement and steps
+-- (user service, AI context, motivation state, weight forecast, step stats).
+
+-- Latest height and weight, and the weight history oldest first.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_stats_user_id_created_at_idx
+    ON public.user_stats (user_id, created_at DESC) INCLUDE (height, weight);
+
+-- The goal tables inherit user_goals, so each child needs its own index.
+-- Latest weight goal: AI context, motivation state, weight forecast, getGoal.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS weight_goals_user_id_created_at_idx
+    ON public.weight_goals (user_id, created_at DESC) INCLUDE (target_weight, achieve_by);
+
+-- Latest open weight goal (goal progress). Achieved goals are never read
+-- through this path, so they are left out of the index.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS weight_goals_open_user_id_created_at_idx
+    ON public.weight_goals (user_id, created_at DESC) INCLUDE (target_weight)
+    WHERE achieved = false;
+
+-- Latest step goal: step stats.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS step_goals_user_id_created_at_idx
+    ON public.step_goals (user_id, created_at DESC) INCLUDE (target_steps);
+
+-- Latest cardio goal: getGoal.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS cardio_goals_user_id_created_at_idx
+    ON public.cardio_goals (user_id, created_at DESC);
+
+-- Latest strength goal for an exercise: getGoal and goal progress.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS strength_goals_user_id_target_exercise_idx
+    ON public.strength_goals (user_id, target_exercise, created_at DESC);
+
+-- A user's engagement row, read and updated on every login and workout.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_engagement_user_id_last_login_idx
+    ON public.user_engagement (user_id, last_login DESC) INCLUDE (day_streak, last_workout);
+
+-- Recently active users, for motivation pre-generation.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_engagement_last_login_idx
+    ON public.user_engagement (last_login) INCLUDE (user_id);
+
+-- Per-user step lookups are served by the (user_id, date_performed) primary
+-- key; the steps leaderboard reads everyone's steps in a date window.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_steps_date_performed_idx
+    ON public.user_steps (date_performed) INCLUDE (user_id, steps);
+
+INSERT INTO public.schema_migrations (version) VALUES ('0002') ON CONFLICT DO NOTHING;
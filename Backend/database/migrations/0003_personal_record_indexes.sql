@@ -0,0 +1,18 @@
+-- Personal records (workout service) and the 1RM leaderboard.
+
+-- The 1RM leaderboard for one exercise, grouped by user with the latest date first.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_exercise_max_exercise_id_user_id_date_idx
+    ON public.user_exercise_max (exercise_id, user_id, date_performed DESC) INCLUDE (calculated_1rm);
+
+-- A user's latest max per exercise when a workout is saved, the backfill's
+-- per-user delete and the cascade when a user is deleted.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS user_exercise_max_user_id_exercise_id_date_idx
+    ON public.user_exercise_max (user_id, exercise_id, date_performed DESC) INCLUDE (calculated_1rm);
+
+-- Custom exercises of a user, for the SET NULL when the user is deleted.
+-- Built-in exercises have no creator and are left out.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS exercises_createdby_idx
+    ON public.exercises (createdby)
+    WHERE createdby IS NOT NULL;
+
+INSERT INTO public.schema_migrations (version) VALUES ('0003') ON CONFLICT DO NOTHING;
@@ -0,0 +1,18 @@
+-- Family service lookups. Lookups by family_id alone are served by the
+-- (family_id, user_id) primary key of family_members.
+
+-- The families of a user: getUserFamilies, the family feed and membership checks by user.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS family_members_user_id_idx
+    ON public.family_members (user_id) INCLUDE (family_id);
+
+-- Pending requests of a receiver newest first, and the duplicate-invite check.
+-- Answered requests are never looked up by receiver, so they are left out.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS family_requests_pending_receiver_id_idx
+    ON public.family_requests (receiver_id, family_id, created_at DESC)
+    WHERE status IS NULL;
+
+-- Requests of a family, deleted with it.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS family_requests_family_id_idx
+    ON public.family_requests (family_id);
+
+INSERT INTO public.schema_migrations (version) VALUES ('0004') ON CONFLICT DO NOTHING;